@@ -0,0 +1,116 @@
+//! Benchmark of the per-frame cost of the EventCache as the cache size grows.
+//! Run with `cargo bench --bench event_cache`.
+use std::hint::black_box;
+use std::path::PathBuf;
+
+use bytes::Bytes;
+use criterion::{criterion_group, criterion_main, BatchSize, BenchmarkId, Criterion, Throughput};
+
+use attpc_conduit::backend::buffer_pool::BufferPool;
+use attpc_conduit::backend::constants::*;
+use attpc_conduit::backend::event_builder::EventCache;
+use attpc_conduit::backend::graw_frame::GrawFrame;
+use attpc_conduit::backend::pad_map::PadMap;
+
+const FRAMES_PER_EVENT: u32 = NUMBER_OF_COBOS as u32 * NUMBER_OF_ASADS as u32;
+const CACHE_SIZES: [usize; 3] = [44, 440, 4400];
+
+/// Write a pad map giving every hardware address a pad and load it
+fn make_pad_map() -> PadMap {
+    let path: PathBuf = std::env::temp_dir().join("attpc_conduit_bench_pad_map.csv");
+    let mut contents = String::from("cobo,asad,aget,channel,pad\n");
+    let mut pad = 0;
+    for cobo in 0..NUMBER_OF_COBOS {
+        for asad in 0..NUMBER_OF_ASADS {
+            for aget in 0..NUMBER_OF_AGETS {
+                for channel in 0..NUMBER_OF_CHANNELS {
+                    contents.push_str(&format!("{cobo},{asad},{aget},{channel},{pad}\n"));
+                    pad += 1;
+                }
+            }
+        }
+    }
+    std::fs::write(&path, contents).expect("Could not write the benchmark pad map");
+    PadMap::new(&path).expect("Could not read the benchmark pad map")
+}
+
+/// Encode a partial GRAW frame with a few samples on the first channel
+fn encode_frame(event_id: u32, cobo_id: u8, asad_id: u8) -> Vec<u8> {
+    let n_items: u32 = 8;
+    let mut message = vec![0u8; 2 * SIZE_UNIT as usize];
+    message[0] = EXPECTED_META_TYPE;
+    message[1..4].copy_from_slice(&2u32.to_be_bytes()[1..]);
+    message[5..7].copy_from_slice(&EXPECTED_FRAME_TYPE_PARTIAL.to_be_bytes());
+    message[8..10].copy_from_slice(&EXPECTED_HEADER_SIZE.to_be_bytes());
+    message[10..12].copy_from_slice(&EXPECTED_ITEM_SIZE_PARTIAL.to_be_bytes());
+    message[12..16].copy_from_slice(&n_items.to_be_bytes());
+    message[22..26].copy_from_slice(&event_id.to_be_bytes());
+    message[26] = cobo_id;
+    message[27] = asad_id;
+    let body = &mut message[SIZE_UNIT as usize..];
+    for time_bucket in 0..n_items {
+        let item: u32 = (time_bucket << 14) | 100;
+        let start = (time_bucket * 4) as usize;
+        body[start..start + 4].copy_from_slice(&item.to_be_bytes());
+    }
+    message
+}
+
+/// Produces a stream of small frames, one per AsAd for each event in order
+struct FrameStream {
+    count: u32,
+}
+
+impl FrameStream {
+    fn next_frame(&mut self) -> GrawFrame {
+        let slot = self.count % FRAMES_PER_EVENT;
+        let message = encode_frame(
+            self.count / FRAMES_PER_EVENT + 1,
+            (slot / NUMBER_OF_ASADS as u32) as u8,
+            (slot % NUMBER_OF_ASADS as u32) as u8,
+        );
+        self.count += 1;
+        GrawFrame::from_message(Bytes::from(message)).expect("Could not decode the benchmark frame")
+    }
+}
+
+fn bench_add_frame(c: &mut Criterion) {
+    let pad_map = make_pad_map();
+    let pool = BufferPool::new(MAX_POOLED_BUFFERS);
+    let mut group = c.benchmark_group("event_cache_add_frame");
+    group.throughput(Throughput::Elements(1));
+    for max_cache_size in CACHE_SIZES {
+        let mut cache = EventCache::new(pool.clone(), false);
+        let mut stream = FrameStream { count: 0 };
+        // Fill the cache so every measured frame pays for eviction
+        while cache.size() <= max_cache_size {
+            cache
+                .add_frame(&pad_map, stream.next_frame())
+                .expect("Could not fill the cache");
+        }
+        group.bench_with_input(
+            BenchmarkId::from_parameter(max_cache_size),
+            &max_cache_size,
+            |b, &max_cache_size| {
+                b.iter_batched(
+                    || stream.next_frame(),
+                    |frame| {
+                        cache
+                            .add_frame(&pad_map, frame)
+                            .expect("Could not add a frame");
+                        while cache.size() > max_cache_size {
+                            let event = cache.get_lru_event().expect("Broken cache");
+                            black_box(event.get_event_id());
+                            pool.recycle(event.take_data_matrix().0);
+                        }
+                    },
+                    BatchSize::SmallInput,
+                )
+            },
+        );
+    }
+    group.finish();
+}
+
+criterion_group!(benches, bench_add_frame);
+criterion_main!(benches);
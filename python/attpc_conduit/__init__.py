@@ -1,21 +1,51 @@
-from ._attpc_conduit import Conduit
+from ._attpc_conduit import Conduit, EventFilter
 from .core.conduit_log import init_conduit_logger
 from .core.pipeline import ConduitPipeline, init_detector_bounds
-from .core.histograms import init_default_histograms
+from .core.parallel import ParallelConduitPipeline
+from .core.metrics import PipelineMetrics, log_conduit_stats
+from .core.load_shedding import LoadSheddingPolicy
+from .core.event_log import (
+    ColumnarEventLog,
+    set_event_log,
+    log_event,
+    log_event_labels,
+)
+from .core.event_source import EventSource, ConduitEventSource, FileEventSource
+from .core.sparse import SparseEvent
+from .core.beam_region import beam_region_pads
+from .core.voxel_cluster import FastClusterParameters
+from .core.histograms import init_default_histograms, HistogramPublisher
 from .core.blueprint import generate_default_blueprint
-from .core.static import PAD_ELEC_PATH
+from .core.static import PAD_ELEC_PATH, PAD_TABLE_CACHE_PATH
 from .phases.pointcloud_phase import PointcloudPhase
 from .phases.cluster_phase import ClusterPhase
 from .phases.estimation_phase import EstimationPhase
 
 __all__ = [
     "Conduit",
+    "EventFilter",
     "init_conduit_logger",
     "ConduitPipeline",
+    "ParallelConduitPipeline",
+    "PipelineMetrics",
+    "log_conduit_stats",
+    "LoadSheddingPolicy",
+    "ColumnarEventLog",
+    "set_event_log",
+    "log_event",
+    "log_event_labels",
+    "EventSource",
+    "ConduitEventSource",
+    "FileEventSource",
+    "SparseEvent",
+    "beam_region_pads",
+    "FastClusterParameters",
     "init_detector_bounds",
     "init_default_histograms",
+    "HistogramPublisher",
     "generate_default_blueprint",
     "PAD_ELEC_PATH",
+    "PAD_TABLE_CACHE_PATH",
     "PointcloudPhase",
     "ClusterPhase",
     "EstimationPhase",
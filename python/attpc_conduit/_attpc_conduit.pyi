@@ -1,5 +1,6 @@
 import numpy as np
 from pathlib import Path
+from typing import Any
 
 class Conduit:
     """This class represents the communication conduit
@@ -16,14 +17,24 @@ class Conduit:
 
     Methods
     -------
-    connect(max_cache_size)
+    connect(max_cache_size, exporter_addresses, event_timeout, n_builders, reorder_window, record_path, subtract_fpn, zero_threshold, event_filter)
         Start the Conduit, creating the communication channels and async tasks.
+    replay(recording_path, max_cache_size, speed, event_timeout, n_builders, reorder_window, subtract_fpn, zero_threshold, event_filter)
+        Start the Conduit, building events from a recording instead of the DataExporters.
     disconnect()
         Stop the Conduit, destroying communication channels and tasks.
-    poll_events() -> tuple[int, ndarray] | None
+    poll_events(timeout) -> tuple[int, ndarray] | None
         Poll the Conduit, asking if an event is ready for analysis
+    poll_events_batch(max_events, timeout) -> list[tuple[int, ndarray]]
+        Poll the Conduit for several events at once
+    poll_events_sparse(max_events, timeout) -> list[tuple[int, tuple[ndarray, ndarray, ndarray]]]
+        Poll the Conduit for several events at once, in sparse form
+    stats() -> dict[str, Any]
+        Get a snapshot of the backend statistics
     is_connected() -> bool
         Check if the conduit is connected to the data streams
+    is_finished() -> bool
+        Check if the conduit has no more events to give
     """
 
     def __init__(self, pad_path: Path, n_threads: int):
@@ -47,20 +58,129 @@ class Conduit:
             The conduit object
         """
         ...
-    def connect(self, max_cache_size: int):
+    def connect(
+        self,
+        max_cache_size: int,
+        exporter_addresses: list[str] | None = None,
+        event_timeout: float | None = 0.5,
+        n_builders: int = 1,
+        reorder_window: int = 0,
+        record_path: Path | None = None,
+        subtract_fpn: bool = False,
+        zero_threshold: int | None = None,
+        event_filter: EventFilter | None = None,
+    ):
         """Start the Conduit, creating the communication channels and async tasks.
 
         This spawns the async tasks to the runtime and starts the process of receiving data
         from the GET data acquisition and listening on the included server. This should
         almost always be run when starting your application.
 
+        An event is made available as soon as every AsAd of the connected CoBos (that has
+        pads in the pad map) has sent its frame. Incomplete events are made available
+        once they reach the event timeout, or once the event cache is full.
+
         Parameters
         ----------
         max_cache_size: int
             The maximum size the event cache is allowed to reach (in GRAW frames)
-            before events are emitted. Each Event can be populated by at most one frame
-            per AsAd. This means that for the AT-TPC, which has 44 AsAds, the max_cache_size
-            should be given in units of 44.
+            before incomplete events are emitted. Each Event can be populated by at most
+            one frame per AsAd. This means that for the AT-TPC, which has 44 AsAds, the
+            max_cache_size should be given in units of 44.
+        exporter_addresses: list[str] | None
+            The addresses (ip:port) of the DataExporters to receive data from, one per
+            CoBo, in CoBo order. Default is None, which uses the AT-TPC MacMini
+            addresses.
+        event_timeout: float | None
+            The maximum time an incomplete event waits in the cache in seconds. Default
+            is 0.5 s. If None (or infinite), incomplete events wait until the cache is
+            full.
+        n_builders: int
+            The number of event building tasks. Frames are distributed across the tasks
+            by event number, and the cache size is split evenly between them. Default is
+            1.
+        reorder_window: int
+            The number of built events held back to put events in order when
+            n_builders > 1. No event is held longer than event_timeout (0.5 s if
+            None). Default is 0, which makes events available as soon as they are built,
+            in no particular order.
+        record_path: Path | None
+            If given, every frame received from the DataExporters is written to a
+            recording at this path, which can be played back with replay. The recording
+            is written by its own task and never slows down event building; if the disk
+            cannot keep up, frames are dropped from the recording (see stats). Default
+            is None, which does not record.
+        subtract_fpn: bool
+            If True, the fixed pattern noise (FPN) channels of each AGET are averaged
+            and subtracted from the traces of its pads. The FPN channels are never
+            included in the events. Default is False.
+        zero_threshold: int | None
+            If given, each trace is baseline subtracted and zero suppressed: samples
+            which are not within a few time buckets of a sample over the threshold are
+            zeroed, and traces with no samples left are dropped. Default is None, which
+            does not zero suppress. Zero suppressed events are best polled with
+            poll_events_sparse.
+        event_filter: EventFilter | None
+            If given, only the events accepted by the filter are made available. The
+            filter sees the events after the FPN subtraction and zero suppression.
+            Rejected events are counted in the stats. Default is None, which makes
+            every event available.
+
+        Raises
+        ------
+        ValueError
+            If the event timeout is negative or NaN
+        """
+        ...
+    def replay(
+        self,
+        recording_path: Path,
+        max_cache_size: int,
+        speed: float | None = 1.0,
+        event_timeout: float | None = 0.5,
+        n_builders: int = 1,
+        reorder_window: int = 0,
+        subtract_fpn: bool = False,
+        zero_threshold: int | None = None,
+        event_filter: EventFilter | None = None,
+    ):
+        """Start the Conduit, building events from a recording made by connect
+
+        The frames of the recording are fed to the event builders in the order they were
+        received, instead of frames from the DataExporters. Events are polled as usual.
+        Events left in the cache when the recording ends are made available.
+
+        Parameters
+        ----------
+        recording_path: Path
+            The path to the recording
+        max_cache_size: int
+            The maximum size of the event cache in GRAW frames (see connect)
+        speed: float | None
+            The multiple of the recorded rate to replay the frames at. Default is 1.0,
+            the original speed. If None, the frames are replayed as fast as the event
+            builders take them.
+        event_timeout: float | None
+            The maximum time an incomplete event waits in the cache in seconds (see
+            connect). Default is 0.5 s.
+        n_builders: int
+            The number of event building tasks (see connect). Default is 1.
+        reorder_window: int
+            The number of built events held back to put events in order (see connect).
+            Default is 0.
+        subtract_fpn: bool
+            If True, subtract the fixed pattern noise (see connect). Default is False.
+        zero_threshold: int | None
+            If given, zero suppress the traces at this threshold (see connect). Default
+            is None.
+        event_filter: EventFilter | None
+            If given, only make the events accepted by the filter available (see
+            connect). Default is None.
+
+        Raises
+        ------
+        ValueError
+            If the event timeout is negative or NaN
         """
         ...
     def disconnect(self):
@@ -70,10 +190,21 @@ class Conduit:
         completion.
         """
         ...
-    def poll_events(self) -> tuple[int, np.ndarray] | None:
+    def poll_events(
+        self, timeout: float | None = None
+    ) -> tuple[int, np.ndarray] | None:
         """Poll the Conduit, asking if an event is ready to be analyzed
 
-        The poll is synchronous but does not block.
+        The poll is synchronous. If no timeout is given the poll does not block.
+        Otherwise, the poll waits up to the timeout for an event. The GIL is released
+        while waiting, so other Python threads can run.
+
+        Parameters
+        ----------
+        timeout: float | None
+            The maximum time to wait for an event in seconds. Default is None, which
+            does not wait. If infinite, waits until an event is ready (or the event
+            builders stop).
 
         Returns
         -------
@@ -85,6 +216,124 @@ class Conduit:
             AGET, channel, pad) and the remaining 512 elements are the trace in GET
             time buckets. Each element of the trace matrix is a 16-bit integer.
 
+        Raises
+        ------
+        ValueError
+            If the timeout is negative or NaN
+
+        Notes
+        -----
+        The trace matrix is not copied out of the Conduit; the array shares the memory
+        the event was built in. Once the array is garbage collected the memory is
+        reused for new events.
+        """
+        ...
+
+    def poll_events_batch(
+        self, max_events: int, timeout: float | None = None
+    ) -> list[tuple[int, np.ndarray]]:
+        """Poll the Conduit for up to max_events events in a single call
+
+        The poll is synchronous. If no timeout is given the poll does not block.
+        Otherwise, the poll waits up to the timeout for the first event to be ready,
+        and then takes any other ready events. The GIL is released while waiting, so
+        other Python threads can run.
+
+        Parameters
+        ----------
+        max_events: int
+            The maximum number of events to return
+        timeout: float | None
+            The maximum time to wait for an event in seconds. Default is None, which
+            does not wait. If infinite, waits until an event is ready (or the event
+            builders stop).
+
+        Returns
+        -------
+        list[tuple[int, numpy.ndarray]]
+            The ready events, in the order they were built. Each event is a tuple of the
+            event number and the trace matrix (see poll_events). The list is empty if
+            no events were ready.
+
+        Raises
+        ------
+        ValueError
+            If the timeout is negative or NaN
+        """
+        ...
+
+    def poll_events_sparse(
+        self, max_events: int, timeout: float | None = None
+    ) -> list[tuple[int, tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+        """Poll the Conduit for up to max_events events in sparse form
+
+        Behaves like poll_events_batch, but only the runs of read out samples (segments)
+        of each trace which were not zero suppressed are returned. For zero suppressed events (see connect) this is
+        much less data than the trace matrix. The arrays can be wrapped in a
+        SparseEvent.
+
+        Parameters
+        ----------
+        max_events: int
+            The maximum number of events to return
+        timeout: float | None
+            The maximum time to wait for an event in seconds. Default is None, which
+            does not wait. If infinite, waits until an event is ready (or the event
+            builders stop).
+
+        Returns
+        -------
+        list[tuple[int, tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]]
+            The ready events, in the order they were built. Each event is a tuple of the
+            event number and the arrays (hardware, segments, samples). hardware is the
+            Nx5 int16 matrix of the hardware columns (CoBo, AsAd, AGET, channel, pad) of
+            each trace. segments is the Mx3 int32 matrix of the trace (row of
+            hardware), first time bucket, and length of each segment. samples is the
+            int16 array of the samples of every segment, in order.
+
+        Raises
+        ------
+        ValueError
+            If the timeout is negative or NaN
+        """
+        ...
+
+    def stats(self) -> dict[str, Any]:
+        """Get a snapshot of the backend statistics
+
+        The counters are updated by the backend with relaxed atomics, so the snapshot
+        is cheap but the values may be very slightly inconsistent with each other.
+        Counters are totals since the last call to connect.
+
+        Returns
+        -------
+        dict[str, Any]
+            The statistics. Empty if the Conduit has never been connected. The keys are
+
+            - frames_received: list[int], GRAW frames received from each DataExporter
+            - bytes_received: list[int], bytes received from each DataExporter
+            - seconds_since_data: list[float | None], time since each DataExporter last
+              sent data (None if it never has)
+            - frame_errors: dict[str, int], frames which could not be parsed, by error
+              kind. Bad frames are skipped.
+            - cached_events: int, incomplete events in the event cache
+            - cached_frames: int, frames in the event cache
+            - frame_queue_depth: int, frames waiting to be added to the event cache
+            - event_queue_depth: int, built events waiting to be polled
+            - complete_events: int, events emitted with every expected frame
+            - timeout_evictions: int, incomplete events emitted after the event timeout
+            - full_cache_evictions: int, incomplete events emitted because the cache
+              was full
+            - end_of_stream_evictions: int, incomplete events emitted because every
+              frame source finished (e.g. the end of a replay)
+            - late_frames: int, frames dropped because their event was already emitted
+            - recorded_frames: int, frames written to the recording
+            - recording_drops: int, frames dropped from the recording because the disk
+              could not keep up
+            - filter_rejections: dict[str, int], events dropped by the event filter, by
+              the selection they failed (multiplicity, charge, outside_beam)
+            - prescaled_events: int, events which failed the event filter but were kept
+              by the prescale
         """
         ...
 
@@ -97,3 +346,57 @@ class Conduit:
             True if connected, False if disconnected
         """
         ...
+
+    def is_finished(self) -> bool:
+        """Check if the conduit has no more events to give
+
+        The conduit is finished once the backend services which send built events have
+        all stopped (i.e. at the end of a replay, or once every DataExporter receiver has
+        exited) and every event has been polled. Polls then return right away rather
+        than waiting out their timeout. The conduit stays connected until disconnect is
+        called.
+
+        Returns
+        -------
+        bool
+            True if no more events will arrive. Also True if the conduit was never
+            connected.
+        """
+        ...
+
+class EventFilter:
+    """A filter selecting which events the Conduit makes available
+
+    The filter runs in the Conduit backend as events are built, so rejected events never
+    cost any Python time. Events are rejected if they fail any of the selections, and
+    rejections are counted in Conduit.stats. The defaults accept every event.
+
+    Parameters
+    ----------
+    min_multiplicity: int
+        The minimum number of traces (pads) in the event. Default is 0.
+    max_multiplicity: int | None
+        The maximum number of traces in the event. Default is None, no maximum.
+    min_charge: int | None
+        The minimum sum of every sample of every trace. This is only meaningful for
+        baseline subtracted (zero suppressed) events. Default is None, no minimum.
+    beam_pads: list[int] | None
+        The pad numbers of the beam region (see beam_region_pads). Default is None, an
+        empty beam region.
+    min_outside_beam: int
+        The minimum number of pads hit outside of the beam region. Default is 0.
+    prescale: int | None
+        If given, one in every prescale rejected events is accepted anyway, to keep a
+        sample of the rejected events. Each event builder counts its own rejections.
+        Default is None, which drops every rejected event.
+    """
+
+    def __init__(
+        self,
+        min_multiplicity: int = 0,
+        max_multiplicity: int | None = None,
+        min_charge: int | None = None,
+        beam_pads: list[int] | None = None,
+        min_outside_beam: int = 0,
+        prescale: int | None = None,
+    ): ...
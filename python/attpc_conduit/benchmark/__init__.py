@@ -0,0 +1,15 @@
+from .graw import SyntheticEventGenerator, FRAME_TYPE_PARTIAL, FRAME_TYPE_FULL
+from .exporter import ExporterStandIn
+from .driver import BenchmarkReport, run_benchmark
+from .clustering import ClusterBenchmarkReport, run_cluster_benchmark
+
+__all__ = [
+    "SyntheticEventGenerator",
+    "FRAME_TYPE_PARTIAL",
+    "FRAME_TYPE_FULL",
+    "ExporterStandIn",
+    "BenchmarkReport",
+    "run_benchmark",
+    "ClusterBenchmarkReport",
+    "run_cluster_benchmark",
+]
@@ -0,0 +1,201 @@
+"""Accuracy and runtime benchmark of the fast clustering path"""
+
+from .. import (
+    ClusterPhase,
+    PointcloudPhase,
+    FileEventSource,
+    FastClusterParameters,
+    PAD_TABLE_CACHE_PATH,
+)
+from ..core.event_source import EventSource
+from ..core.phase import PhaseResult
+
+from spyral.core.config import ClusterParameters, DetectorParameters
+from spyral_utils.plot import Histogrammer
+from sklearn.metrics import adjusted_rand_score
+from dataclasses import dataclass
+from pathlib import Path
+import rerun as rr
+import numpy as np
+import click
+import time
+
+PERCENTILES: list[int] = [10, 50, 90, 99]
+
+
+@dataclass
+class ClusterBenchmarkReport:
+    """Dataclass representing the results of a clustering benchmark
+
+    Attributes
+    ----------
+    n_events: int
+        The number of events clustered (events with a point cloud of at least the
+        minimum cloud size)
+    mean_points: float
+        The mean number of points per clustered event
+    full_time: dict[int, float]
+        The runtime of the full algorithm in milliseconds, keyed by percentile
+    fast_time: dict[int, float]
+        The runtime of the fast path in milliseconds, keyed by percentile
+    speedup: float
+        The total runtime of the full algorithm over the total runtime of the fast path
+    mean_ari: float
+        The mean adjusted Rand index of the fast path labels with respect to the full
+        algorithm labels
+    ari: dict[int, float]
+        The adjusted Rand index, keyed by percentile
+    """
+
+    n_events: int
+    mean_points: float
+    full_time: dict[int, float]
+    fast_time: dict[int, float]
+    speedup: float
+    mean_ari: float
+    ari: dict[int, float]
+
+
+def percentiles(values: list[float]) -> dict[int, float]:
+    """Get the PERCENTILES of a list of values, zero if the list is empty"""
+    if len(values) == 0:
+        return {percentile: 0.0 for percentile in PERCENTILES}
+    return dict(zip(PERCENTILES, np.percentile(values, PERCENTILES).tolist()))
+
+
+def run_cluster_benchmark(
+    source: EventSource,
+    pointcloud: PointcloudPhase,
+    cluster_params: ClusterParameters,
+    det_params: DetectorParameters,
+    voxel_size: float,
+    n_events: int | None = None,
+) -> ClusterBenchmarkReport:
+    """Compare the fast clustering path to the full algorithm on recorded events
+
+    The point cloud of each event is clustered with both the full algorithm and the fast
+    path. The labels of the fast path are compared to those of the full algorithm with
+    the adjusted Rand index (1.0 is the same clustering, ~0.0 is no better than chance).
+
+    Parameters
+    ----------
+    source: EventSource
+        The source of the events
+    pointcloud: PointcloudPhase
+        The phase used to make the point clouds
+    cluster_params: ClusterParameters
+        Parameters controlling the clustering algorithm
+    det_params: DetectorParameters
+        Parameters describing the detector
+    voxel_size: float
+        The voxel size of the fast path in mm
+    n_events: int | None
+        The maximum number of events to cluster. Default is None, every event of the
+        source.
+
+    Returns
+    -------
+    ClusterBenchmarkReport
+        The results of the benchmark
+    """
+    full = ClusterPhase(cluster_params, det_params)
+    fast = ClusterPhase(
+        cluster_params, det_params, FastClusterParameters(voxel_size=voxel_size)
+    )
+    grammer = Histogrammer()
+    rng = np.random.default_rng()
+
+    n_points: list[int] = []
+    full_times: list[float] = []
+    fast_times: list[float] = []
+    scores: list[float] = []
+    for event_id, event in source:
+        if n_events is not None and len(n_points) >= n_events:
+            break
+        result = pointcloud.run(PhaseResult(event, True, event_id), grammer, rng)
+        if (
+            not result.successful
+            or len(result.artifact) < cluster_params.min_cloud_size
+        ):
+            continue
+        cloud = result.artifact
+
+        start = time.perf_counter()
+        _, full_labels, _ = full.cluster(cloud)
+        full_times.append((time.perf_counter() - start) * 1.0e3)
+        start = time.perf_counter()
+        _, fast_labels, _ = fast.cluster(cloud)
+        fast_times.append((time.perf_counter() - start) * 1.0e3)
+
+        n_points.append(len(cloud))
+        scores.append(adjusted_rand_score(full_labels, fast_labels))
+
+    return ClusterBenchmarkReport(
+        n_events=len(n_points),
+        mean_points=float(np.mean(n_points)) if len(n_points) > 0 else 0.0,
+        full_time=percentiles(full_times),
+        fast_time=percentiles(fast_times),
+        speedup=sum(full_times) / sum(fast_times) if len(fast_times) > 0 else 0.0,
+        mean_ari=float(np.mean(scores)) if len(scores) > 0 else 0.0,
+        ari=percentiles(scores),
+    )
+
+
+@click.command(
+    help="Compare the fast clustering path to the full algorithm on the events of a merged trace file"
+)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--n-events",
+    default=None,
+    type=int,
+    help="The maximum number of events to cluster. Every event if not given",
+)
+@click.option(
+    "--voxel-size",
+    default=4.0,
+    type=float,
+    help="The voxel size of the fast path (mm)",
+    show_default=True,
+)
+def cluster_benchmark(path: Path, n_events: int | None, voxel_size: float):
+    # Use the parameters of the default script
+    from ..run_conduit import (
+        get_params,
+        detector_params,
+        pad_params,
+        cluster_params,
+    )
+
+    # Log to memory; the data is discarded
+    rr.init("attpc_conduit_cluster_benchmark", spawn=False)
+    rr.memory_recording()
+
+    pointcloud = PointcloudPhase(
+        get_params, detector_params, pad_params, pad_table_cache=PAD_TABLE_CACHE_PATH
+    )
+    with FileEventSource(path) as source:
+        report = run_cluster_benchmark(
+            source,
+            pointcloud,
+            cluster_params,
+            detector_params,
+            voxel_size,
+            n_events,
+        )
+
+    click.echo(f"Events clustered: {report.n_events}")
+    click.echo(f"Mean points per event: {report.mean_points:.1f}")
+    for percentile in PERCENTILES:
+        click.echo(
+            f"Time p{percentile}: full {report.full_time[percentile]:.1f} ms, "
+            f"fast {report.fast_time[percentile]:.1f} ms"
+        )
+    click.echo(f"Speedup: {report.speedup:.2f}")
+    click.echo(f"Adjusted Rand index mean: {report.mean_ari:.3f}")
+    for percentile in PERCENTILES:
+        click.echo(f"Adjusted Rand index p{percentile}: {report.ari[percentile]:.3f}")
+
+
+if __name__ == "__main__":
+    cluster_benchmark()
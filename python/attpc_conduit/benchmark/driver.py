@@ -0,0 +1,285 @@
+"""End-to-end throughput benchmark of the Conduit and analysis pipeline"""
+
+from .. import Conduit, ConduitPipeline, ConduitEventSource, init_default_histograms
+from ..core.static import PAD_ELEC_PATH
+from .exporter import ExporterStandIn
+from .graw import SyntheticEventGenerator, FRAME_TYPE_FULL, FRAME_TYPE_PARTIAL
+
+from spyral_utils.plot import Histogrammer
+from dataclasses import dataclass
+from threading import Thread
+from pathlib import Path
+import rerun as rr
+import numpy as np
+import resource
+import click
+import sys
+import time
+
+
+@dataclass
+class BenchmarkReport:
+    """Dataclass representing the results of a benchmark
+
+    Attributes
+    ----------
+    n_events: int
+        The number of events received and analyzed
+    n_frames: int
+        The number of GRAW frames in the received events
+    elapsed: float
+        The time from the first frame sent to the last event analyzed in seconds
+    frames_per_second: float
+        The frame throughput
+    events_per_second: float
+        The event throughput
+    latency_percentiles: dict[int, float]
+        The end-to-end latency (first frame sent to event analyzed) in milliseconds,
+        keyed by percentile (50, 90, 99)
+    peak_rss: float
+        The peak resident set size of the process in MB
+    """
+
+    n_events: int
+    n_frames: int
+    elapsed: float
+    frames_per_second: float
+    events_per_second: float
+    latency_percentiles: dict[int, float]
+    peak_rss: float
+
+
+def peak_rss_mb() -> float:
+    """Get the peak resident set size of this process in MB"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS reports bytes
+    if sys.platform == "darwin":
+        return max_rss / 1.0e6
+    return max_rss / 1.0e3
+
+
+def run_benchmark(
+    pad_path: Path,
+    generator: SyntheticEventGenerator,
+    n_events: int,
+    pipeline: ConduitPipeline | None = None,
+    recording: rr.MemoryRecording | None = None,
+    event_cache_size: int = 440,
+    n_threads: int = 4,
+    rate: float | None = None,
+    idle_timeout: float = 5.0,
+) -> BenchmarkReport:
+    """Run the Conduit (and optionally a pipeline) against local stand-in DataExporters
+
+    Events are produced by the generator and sent by a set of ExporterStandIns, one per
+    simulated CoBo. Enough extra events are sent after the benchmarked events to push
+    them out of the Conduit event cache; these are not included in the results.
+
+    Parameters
+    ----------
+    pad_path: Path
+        Path to the pad map given to the Conduit
+    generator: SyntheticEventGenerator
+        The source of the events
+    n_events: int
+        The number of events to benchmark
+    pipeline: ConduitPipeline | None
+        The analysis pipeline to run on each event. If None, events are only polled.
+    recording: rerun.MemoryRecording | None
+        The in-memory recording the pipeline logs to. If given, it is drained after
+        every poll so that logged data does not accumulate. Default is None.
+    event_cache_size: int
+        The size of the Conduit event cache in GRAW frames. Default is 440.
+    n_threads: int
+        The number of threads given to the Conduit runtime. Default is 4.
+    rate: float | None
+        The rate at which events are sent in events per second. Default is None, which
+        sends as fast as the Conduit accepts them.
+    idle_timeout: float
+        Stop waiting for events once none have been received for this many seconds.
+        Default is 5 s.
+
+    Returns
+    -------
+    BenchmarkReport
+        The results of the benchmark
+    """
+    exporters = ExporterStandIn(generator.n_cobos)
+    addresses = exporters.start()
+
+    conduit = Conduit(pad_path, n_threads)
+    conduit.connect(event_cache_size, addresses)
+    source = ConduitEventSource(conduit)
+
+    n_flush_events = event_cache_size // generator.frames_per_event + 2
+    send_times: dict[int, float] = {}
+
+    def produce() -> None:
+        start = time.perf_counter()
+        for idx in range(n_events + n_flush_events):
+            event_id = idx + 1
+            if rate is not None:
+                delay = start + idx / rate - time.perf_counter()
+                if delay > 0.0:
+                    time.sleep(delay)
+            frames = generator.generate(event_id)
+            send_times[event_id] = time.perf_counter()
+            for cobo_id, frame in frames:
+                exporters.send_frame(cobo_id, frame)
+
+    grammer = Histogrammer()
+    init_default_histograms(grammer)
+    rng = np.random.default_rng()
+    latencies: list[float] = []
+
+    producer = Thread(target=produce, daemon=True)
+    start = time.perf_counter()
+    producer.start()
+    last_event = time.perf_counter()
+    while len(latencies) < n_events:
+        events = source.poll()
+        now = time.perf_counter()
+        if len(events) == 0 and now - last_event > idle_timeout:
+            break
+        for event_id, event in events:
+            if event_id > n_events:
+                continue
+            if pipeline is not None:
+                pipeline.run(event_id, event, grammer, rng, now)
+            last_event = time.perf_counter()
+            latencies.append(last_event - send_times[event_id])
+        if recording is not None:
+            recording.drain_as_bytes()
+    stop = last_event
+    if pipeline is not None:
+        pipeline.shutdown(grammer)
+
+    # Keep draining the conduit until the producer has queued every frame
+    while producer.is_alive() and time.perf_counter() - stop < idle_timeout:
+        source.poll()
+    conduit.disconnect()
+    exporters.stop()
+
+    elapsed = stop - start
+    n_received = len(latencies)
+    n_frames = n_received * generator.frames_per_event
+    percentiles = [50, 90, 99]
+    latency_values = (
+        np.percentile(np.array(latencies) * 1.0e3, percentiles)
+        if n_received > 0
+        else np.zeros(len(percentiles))
+    )
+    return BenchmarkReport(
+        n_events=n_received,
+        n_frames=n_frames,
+        elapsed=elapsed,
+        frames_per_second=n_frames / elapsed if elapsed > 0.0 else 0.0,
+        events_per_second=n_received / elapsed if elapsed > 0.0 else 0.0,
+        latency_percentiles=dict(zip(percentiles, latency_values.tolist())),
+        peak_rss=peak_rss_mb(),
+    )
+
+
+@click.command(
+    help="Benchmark the Conduit against local stand-in DataExporters (no network needed)"
+)
+@click.option(
+    "--n-events", default=500, type=int, help="The number of events", show_default=True
+)
+@click.option(
+    "--n-cobos",
+    default=11,
+    type=int,
+    help="The number of simulated CoBos",
+    show_default=True,
+)
+@click.option(
+    "--frame-type",
+    default="partial",
+    type=click.Choice(["partial", "full"]),
+    help="The type of GRAW frame to generate",
+    show_default=True,
+)
+@click.option(
+    "--n-hits",
+    default=500,
+    type=int,
+    help="The number of hit pads per event",
+    show_default=True,
+)
+@click.option(
+    "--event-cache-size",
+    default=440,
+    type=int,
+    help="The size of the event cache in the conduit in GRAW frames",
+    show_default=True,
+)
+@click.option(
+    "--n-threads",
+    default=4,
+    type=int,
+    help="The number of threads given to the Conduit runtime",
+    show_default=True,
+)
+@click.option(
+    "--rate",
+    default=None,
+    type=float,
+    help="The rate at which events are sent (events/s). Unlimited if not given",
+)
+@click.option(
+    "--analysis/--no-analysis",
+    default=True,
+    help="Run the default analysis pipeline on each event",
+    show_default=True,
+)
+def benchmark(
+    n_events: int,
+    n_cobos: int,
+    frame_type: str,
+    n_hits: int,
+    event_cache_size: int,
+    n_threads: int,
+    rate: float | None,
+    analysis: bool,
+):
+    pipeline = None
+    recording = None
+    if analysis:
+        # Use the phases of the default script, without load shedding
+        from ..run_conduit import pipeline as default_pipeline
+
+        pipeline = ConduitPipeline(default_pipeline.phases)
+        # Log to memory; the data is discarded
+        rr.init("attpc_conduit_benchmark", spawn=False)
+        recording = rr.memory_recording()
+
+    with PAD_ELEC_PATH as path:
+        generator = SyntheticEventGenerator(
+            path,
+            n_cobos,
+            FRAME_TYPE_FULL if frame_type == "full" else FRAME_TYPE_PARTIAL,
+            n_hits,
+        )
+        report = run_benchmark(
+            path,
+            generator,
+            n_events,
+            pipeline,
+            recording,
+            event_cache_size,
+            n_threads,
+            rate,
+        )
+
+    click.echo(f"Events analyzed: {report.n_events} ({report.n_frames} frames)")
+    click.echo(f"Elapsed time: {report.elapsed:.3f} s")
+    click.echo(f"Frames per second: {report.frames_per_second:.1f}")
+    click.echo(f"Events per second: {report.events_per_second:.1f}")
+    for percentile, latency in report.latency_percentiles.items():
+        click.echo(f"Latency p{percentile}: {latency:.1f} ms")
+    click.echo(f"Peak RSS: {report.peak_rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,122 @@
+"""A local stand-in for the AT-TPC DataExporters"""
+
+from queue import Queue, Full
+from threading import Thread
+import socket
+import struct
+
+
+class ExporterStandIn:
+    """A local stand-in for the DataExporters of a set of CoBos
+
+    Each simulated CoBo listens on its own TCP port and serves a single client (the
+    Conduit receiver) using the DataExporter protocol: every GRAW frame is prefixed
+    with its size in bytes as a little-endian 64-bit unsigned integer. Each CoBo has a
+    sender thread with a bounded queue, so a slow client applies backpressure to the
+    producer just like the real acquisition.
+
+    Parameters
+    ----------
+    n_cobos: int
+        The number of simulated CoBos
+    host: str
+        The address to listen on. Default is 127.0.0.1.
+    queue_size: int
+        The maximum number of frames waiting to be sent per CoBo. Default is 64.
+
+    Attributes
+    ----------
+    addresses: list[str]
+        The address (ip:port) of each simulated CoBo
+
+    Methods
+    -------
+    start()
+        Start listening for connections
+    send_frame(cobo_id, frame)
+        Queue a frame to be sent by a CoBo
+    stop(timeout)
+        Stop sending and close all connections
+    """
+
+    def __init__(self, n_cobos: int, host: str = "127.0.0.1", queue_size: int = 64):
+        self._listeners: list[socket.socket] = []
+        self._queues: list[Queue[bytes | None]] = []
+        self._threads: list[Thread] = []
+        self.addresses: list[str] = []
+        for _ in range(n_cobos):
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((host, 0))  # Let the OS pick a free port
+            self._listeners.append(listener)
+            self._queues.append(Queue(maxsize=queue_size))
+            self.addresses.append(f"{host}:{listener.getsockname()[1]}")
+
+    def start(self) -> list[str]:
+        """Start listening for connections
+
+        Returns
+        -------
+        list[str]
+            The address (ip:port) of each simulated CoBo, to be given to the Conduit
+        """
+        for listener, queue in zip(self._listeners, self._queues):
+            listener.listen(1)
+            thread = Thread(target=_serve, args=(listener, queue), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self.addresses
+
+    def send_frame(self, cobo_id: int, frame: bytes) -> None:
+        """Queue a frame to be sent by a CoBo
+
+        Blocks if the queue of the CoBo is full.
+
+        Parameters
+        ----------
+        cobo_id: int
+            The simulated CoBo which sends the frame
+        frame: bytes
+            The encoded GRAW frame
+        """
+        self._queues[cobo_id].put(frame)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop sending and close all connections
+
+        Frames which are already queued are sent first. Senders whose client never
+        connected are abandoned after a timeout.
+
+        Parameters
+        ----------
+        timeout: float
+            The maximum time to wait for each sender in seconds. Default is 5 s.
+        """
+        for queue in self._queues:
+            try:
+                queue.put(None, timeout=timeout)  # Tells the sender to stop
+            except Full:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+        for listener in self._listeners:
+            listener.close()
+
+
+def _serve(listener: socket.socket, queue: Queue[bytes | None]) -> None:
+    """Accept a single client and send it every frame put in the queue
+
+    Stops when None is put in the queue or the client disconnects.
+    """
+    connection, _ = listener.accept()
+    with connection:
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            frame = queue.get()
+            if frame is None:
+                break
+            try:
+                connection.sendall(struct.pack("<Q", len(frame)))
+                connection.sendall(frame)
+            except OSError:
+                break
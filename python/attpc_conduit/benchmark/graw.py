@@ -0,0 +1,274 @@
+"""Generation of synthetic GRAW frames
+
+Frames follow the layout parsed by GrawFrame in the conduit backend: a single 256 byte
+header followed by a body padded to a multiple of 256 bytes. All words are big-endian.
+"""
+
+from pathlib import Path
+import numpy as np
+
+META_TYPE: int = 8
+HEADER_SIZE: int = 1  # In size units
+SIZE_UNIT: int = 256  # In bytes
+FRAME_TYPE_PARTIAL: int = 1
+FRAME_TYPE_FULL: int = 2
+ITEM_SIZE_PARTIAL: int = 4
+ITEM_SIZE_FULL: int = 2
+
+NUMBER_OF_ASADS: int = 4
+NUMBER_OF_AGETS: int = 4
+NUMBER_OF_CHANNELS: int = 68
+NUMBER_OF_TIME_BUCKETS: int = 512
+
+
+def encode_header(
+    frame_type: int,
+    n_items: int,
+    event_id: int,
+    event_time: int,
+    cobo_id: int,
+    asad_id: int,
+) -> bytes:
+    """Encode a GRAW frame header
+
+    Parameters
+    ----------
+    frame_type: int
+        The frame type, either partial (1) or full (2)
+    n_items: int
+        The number of data items in the frame body
+    event_id: int
+        The event number
+    event_time: int
+        The 48-bit event timestamp
+    cobo_id: int
+        The CoBo which produced the frame
+    asad_id: int
+        The AsAd which produced the frame
+
+    Returns
+    -------
+    bytes
+        The 256 byte header
+    """
+    item_size = (
+        ITEM_SIZE_PARTIAL if frame_type == FRAME_TYPE_PARTIAL else ITEM_SIZE_FULL
+    )
+    body_units = -(-(n_items * item_size) // SIZE_UNIT)  # ceiling division
+    header = bytearray(HEADER_SIZE * SIZE_UNIT)
+    header[0] = META_TYPE
+    header[1:4] = (HEADER_SIZE + body_units).to_bytes(3, "big")
+    header[4] = 0  # data source
+    header[5:7] = frame_type.to_bytes(2, "big")
+    header[7] = 5  # revision
+    header[8:10] = HEADER_SIZE.to_bytes(2, "big")
+    header[10:12] = item_size.to_bytes(2, "big")
+    header[12:16] = n_items.to_bytes(4, "big")
+    header[16:22] = (event_time & 0xFFFFFFFFFFFF).to_bytes(6, "big")
+    header[22:26] = event_id.to_bytes(4, "big")
+    header[26] = cobo_id
+    header[27] = asad_id
+    header[28:30] = (0).to_bytes(2, "big")  # read offset
+    header[30] = 0  # status
+    return bytes(header)
+
+
+def _pad_body(body: bytes) -> bytes:
+    """Pad a frame body to a multiple of the GRAW size unit"""
+    remainder = len(body) % SIZE_UNIT
+    if remainder == 0:
+        return body
+    return body + bytes(SIZE_UNIT - remainder)
+
+
+def encode_partial_body(
+    agets: np.ndarray, channels: np.ndarray, traces: np.ndarray
+) -> tuple[bytes, int]:
+    """Encode traces as the body of a partial (zero-suppressed) frame
+
+    Each sample is a 32-bit item containing the AGET, channel, time bucket, and sample.
+
+    Parameters
+    ----------
+    agets: ndarray
+        The AGET of each trace
+    channels: ndarray
+        The channel of each trace
+    traces: ndarray
+        The (N, 512) samples of each trace
+
+    Returns
+    -------
+    tuple[bytes, int]
+        The padded body and the number of items
+    """
+    n_traces = len(traces)
+    buckets = np.tile(np.arange(NUMBER_OF_TIME_BUCKETS, dtype=np.uint32), n_traces)
+    items = (
+        (np.repeat(agets.astype(np.uint32), NUMBER_OF_TIME_BUCKETS) << 30)
+        | (np.repeat(channels.astype(np.uint32), NUMBER_OF_TIME_BUCKETS) << 23)
+        | (buckets << 14)
+        | (traces.astype(np.uint32).ravel() & 0xFFF)
+    )
+    return (_pad_body(items.astype(">u4").tobytes()), len(items))
+
+
+def encode_full_body(traces: np.ndarray) -> tuple[bytes, int]:
+    """Encode traces as the body of a full frame
+
+    Each sample is a 16-bit item containing the AGET and sample. The channel and time
+    bucket are implied by the order of the items for each AGET.
+
+    Parameters
+    ----------
+    traces: ndarray
+        The (4, 68, 512) samples of every channel of the AsAd
+
+    Returns
+    -------
+    tuple[bytes, int]
+        The padded body and the number of items
+    """
+    agets = np.arange(NUMBER_OF_AGETS, dtype=np.uint16)[np.newaxis, np.newaxis, :]
+    # Order the items as time bucket, channel, AGET
+    samples = np.transpose(traces, (2, 1, 0)).astype(np.uint16)
+    items = (agets << 14) | (samples & 0x0FFF)
+    return (_pad_body(items.astype(">u2").tobytes()), items.size)
+
+
+def read_hardware_addresses(pad_path: Path) -> np.ndarray:
+    """Read the hardware addresses of all pads from a pad map
+
+    Parameters
+    ----------
+    pad_path: Path
+        Path to the pad map CSV (cobo, asad, aget, channel, pad)
+
+    Returns
+    -------
+    ndarray
+        The (N, 4) array of (cobo, asad, aget, channel)
+    """
+    table = np.loadtxt(pad_path, delimiter=",", skiprows=1, dtype=np.int64)
+    return table[:, :4]
+
+
+class SyntheticEventGenerator:
+    """Generates synthetic events as GRAW frames
+
+    Each event contains one frame for each AsAd of each simulated CoBo. A random set of
+    pads from the pad map are hit with a Gaussian pulse on top of a noisy baseline. To
+    keep generation cheap, a fixed number of template events are generated up front
+    and reused with new event numbers.
+
+    Parameters
+    ----------
+    pad_path: Path
+        Path to the pad map CSV used to pick hit pads
+    n_cobos: int
+        The number of simulated CoBos
+    frame_type: int
+        The frame type to generate, either partial (1) or full (2)
+    n_hits: int
+        The number of hit pads per event
+    n_templates: int
+        The number of distinct events to generate. Default is 8.
+    seed: int | None
+        The seed of the random number generator. Default is None.
+
+    Attributes
+    ----------
+    n_cobos: int
+        The number of simulated CoBos
+    frame_type: int
+        The frame type generated
+    frames_per_event: int
+        The number of frames in each event
+
+    Methods
+    -------
+    generate(event_id)
+        Generate the frames of an event
+    """
+
+    def __init__(
+        self,
+        pad_path: Path,
+        n_cobos: int,
+        frame_type: int,
+        n_hits: int,
+        n_templates: int = 8,
+        seed: int | None = None,
+    ):
+        if frame_type not in (FRAME_TYPE_PARTIAL, FRAME_TYPE_FULL):
+            raise ValueError(f"Unknown GRAW frame type {frame_type}")
+        self.n_cobos = n_cobos
+        self.frame_type = frame_type
+        self.frames_per_event = n_cobos * NUMBER_OF_ASADS
+        rng = np.random.default_rng(seed)
+        addresses = read_hardware_addresses(pad_path)
+        addresses = addresses[addresses[:, 0] < n_cobos]
+        # Templates are a list (per event) of frame bodies and item counts, ordered by
+        # (cobo, asad)
+        self._templates: list[list[tuple[bytes, int]]] = [
+            self._generate_template(addresses, n_hits, rng) for _ in range(n_templates)
+        ]
+
+    def _generate_template(
+        self, addresses: np.ndarray, n_hits: int, rng: np.random.Generator
+    ) -> list[tuple[bytes, int]]:
+        """Generate the frame bodies of a single template event"""
+        hits = addresses[
+            rng.choice(len(addresses), size=min(n_hits, len(addresses)), replace=False)
+        ]
+        buckets = np.arange(NUMBER_OF_TIME_BUCKETS)
+        bodies = []
+        for cobo in range(self.n_cobos):
+            for asad in range(NUMBER_OF_ASADS):
+                asad_hits = hits[(hits[:, 0] == cobo) & (hits[:, 1] == asad)]
+                traces = rng.normal(
+                    400.0,
+                    5.0,
+                    size=(NUMBER_OF_AGETS, NUMBER_OF_CHANNELS, NUMBER_OF_TIME_BUCKETS),
+                )
+                for _, _, aget, channel in asad_hits:
+                    center = rng.uniform(50.0, 450.0)
+                    amplitude = rng.uniform(200.0, 3000.0)
+                    traces[aget, channel] += amplitude * np.exp(
+                        -0.5 * ((buckets - center) / 5.0) ** 2
+                    )
+                np.clip(traces, 0.0, 4095.0, out=traces)
+                if self.frame_type == FRAME_TYPE_FULL:
+                    bodies.append(encode_full_body(traces))
+                else:
+                    bodies.append(
+                        encode_partial_body(
+                            asad_hits[:, 2],
+                            asad_hits[:, 3],
+                            traces[asad_hits[:, 2], asad_hits[:, 3]],
+                        )
+                    )
+        return bodies
+
+    def generate(self, event_id: int) -> list[tuple[int, bytes]]:
+        """Generate the frames of an event
+
+        Parameters
+        ----------
+        event_id: int
+            The event number
+
+        Returns
+        -------
+        list[tuple[int, bytes]]
+            The CoBo and encoded frame (header and body) of every frame in the event
+        """
+        template = self._templates[event_id % len(self._templates)]
+        frames = []
+        for idx, (body, n_items) in enumerate(template):
+            cobo, asad = divmod(idx, NUMBER_OF_ASADS)
+            header = encode_header(
+                self.frame_type, n_items, event_id, event_id, cobo, asad
+            )
+            frames.append((cobo, header + body))
+        return frames
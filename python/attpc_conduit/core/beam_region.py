@@ -0,0 +1,27 @@
+from spyral.core.pad_map import PadMap
+
+
+def beam_region_pads(pad_map: PadMap, radius: float) -> list[int]:
+    """Get the pads of the beam region of the pad plane
+
+    The beam region is the disk of the given radius about the center of the pad plane.
+    This is typically given to an EventFilter, to select events with hits outside of the
+    beam region.
+
+    Parameters
+    ----------
+    pad_map: PadMap
+        The map of pad number to pad position
+    radius: float
+        The radius of the beam region in mm (see DetectorParameters.beam_region_radius)
+
+    Returns
+    -------
+    list[int]
+        The pad numbers of the beam region
+    """
+    return [
+        pad
+        for pad, data in pad_map.map.items()
+        if data.x**2.0 + data.y**2.0 < radius**2.0
+    ]
@@ -7,7 +7,7 @@ def generate_default_blueprint() -> bpt.Blueprint:
     """Generate a default blueprint for Rerun
 
     Create our normal setup, with a tab for the 3-D view,
-    1-D Histograms, 2-D Histograms, and logs.
+    1-D Histograms, 2-D Histograms, performance metrics, and logs.
 
     Returns
     -------
@@ -41,6 +41,67 @@ def generate_default_blueprint() -> bpt.Blueprint:
                         height=rr.TensorDimensionSelection(dimension=1, invert=True),
                     ),
                 ),
+                bpt.Vertical(
+                    bpt.Horizontal(
+                        bpt.TimeSeriesView(
+                            name="Phase Time (ms)", contents="/metrics/time/**"
+                        ),
+                        bpt.TimeSeriesView(
+                            name="Phase Success Rate",
+                            contents="/metrics/success_rate/**",
+                        ),
+                        bpt.TimeSeriesView(
+                            name="Phase Artifact Size", contents="/metrics/size/**"
+                        ),
+                    ),
+                    bpt.Horizontal(
+                        bpt.TimeSeriesView(
+                            name="Latency (ms)", contents="/metrics/latency"
+                        ),
+                        bpt.TimeSeriesView(
+                            name="Events per Second",
+                            contents="/metrics/events_per_second",
+                        ),
+                        bpt.TimeSeriesView(
+                            name="Sampling Fraction",
+                            contents=[
+                                "/metrics/sampling_fraction/**",
+                                "/metrics/load_shedding",
+                                "/metrics/cluster_fast_path",
+                            ],
+                        ),
+                    ),
+                    bpt.Horizontal(
+                        bpt.TimeSeriesView(
+                            name="Frames Received",
+                            contents="/metrics/conduit/frames_received/**",
+                        ),
+                        bpt.TimeSeriesView(
+                            name="Conduit Queues",
+                            contents=[
+                                "/metrics/conduit/cached_events",
+                                "/metrics/conduit/cached_frames",
+                                "/metrics/conduit/frame_queue_depth",
+                                "/metrics/conduit/event_queue_depth",
+                            ],
+                        ),
+                        bpt.TimeSeriesView(
+                            name="Conduit Events and Errors",
+                            contents=[
+                                "/metrics/conduit/complete_events",
+                                "/metrics/conduit/timeout_evictions",
+                                "/metrics/conduit/full_cache_evictions",
+                                "/metrics/conduit/end_of_stream_evictions",
+                                "/metrics/conduit/late_frames",
+                                "/metrics/conduit/frame_errors/**",
+                                "/metrics/conduit/recording_drops",
+                                "/metrics/conduit/filter_rejections/**",
+                                "/metrics/conduit/prescaled_events",
+                            ],
+                        ),
+                    ),
+                    name="Performance",
+                ),
                 bpt.TextLogView(name="Logs"),
             ),
         )
@@ -5,14 +5,28 @@ from .static import UNSIGNED_NOISE_LABEL
 # Hardcoded for now
 POINT_COLORMAP: Colormap = Colormap("viridis")
 LABEL_COLORMAP: Colormap = Colormap("seaborn:tab10")
+NOISE_COLOR: Color = Color("grey")
 
 
-def generate_point_colors(
-    values: np.ndarray,
-) -> list[tuple[float, float, float, float]]:
+def _make_lut(colors: np.ndarray) -> np.ndarray:
+    """Convert an (N, 4) array of float sRGBA values to a uint8 lookup table"""
+    return np.round(np.asarray(colors) * 255.0).astype(np.uint8)
+
+
+# Precomputed sRGBA lookup tables. The label table has the noise color appended as the
+# last entry.
+POINT_LUT: np.ndarray = _make_lut(POINT_COLORMAP.lut())
+LABEL_LUT: np.ndarray = _make_lut(
+    np.vstack((LABEL_COLORMAP.lut(), np.array(NOISE_COLOR.rgba)))
+)
+NOISE_LUT_INDEX: int = len(LABEL_LUT) - 1
+
+
+def generate_point_colors(values: np.ndarray) -> np.ndarray:
     """Convert a 1-D array of values to a set of colors
 
-    Use the cmap Colormap to convert a 1-D array of values to colors
+    Use the precomputed colormap lookup table to convert a 1-D array of values to
+    colors
 
     Parameters
     ----------
@@ -21,17 +35,43 @@ def generate_point_colors(
 
     Returns
     -------
-    list[tuple[float, float, float, float]]
-        The list of sRGBA values
+    ndarray
+        An (N, 4) array of sRGBA values as uint8
     """
     max_val = np.max(values)
-    return [POINT_COLORMAP(value / max_val).rgba for value in values]
+    if max_val <= 0.0:
+        return np.repeat(POINT_LUT[:1], len(values), axis=0)
+    indices = (values / max_val * len(POINT_LUT)).astype(np.intp)
+    np.clip(indices, 0, len(POINT_LUT) - 1, out=indices)
+    return POINT_LUT[indices]
+
+
+def generate_label_colors(labels: np.ndarray) -> np.ndarray:
+    """Convert a 1-D array of labels into colors
+
+    Use the precomputed colormap lookup table to convert cluster labels to colors.
+    Labels larger than 9 wrap around the colormap. The unsigned noise label is grey.
+
+    Parameters
+    ----------
+    labels: ndarray
+        Set of integer labels to be colored
+
+    Returns
+    -------
+    ndarray
+        An (N, 4) array of sRGBA values as uint8
+    """
+    labels = np.asarray(labels)
+    indices = np.where(labels > 9, labels % 9, labels)
+    indices[labels == UNSIGNED_NOISE_LABEL] = NOISE_LUT_INDEX
+    return LABEL_LUT[indices]
 
 
-def get_label_color(label: int) -> tuple[float, float, float, float]:
+def get_label_color(label: int) -> tuple[int, int, int, int]:
     """Convert a label integer into a color
 
-    Use the cmap Colormap to convert a single integer into a color
+    Use the precomputed colormap lookup table to convert a single integer into a color
 
     Parameters
     ----------
@@ -39,12 +79,7 @@ def get_label_color(label: int) -> tuple[float, float, float, float]:
         The label to be converted into a color.
     Returns
     -------
-    tuple[float, float, float, float]
-        The sRGBA value
+    tuple[int, int, int, int]
+        The sRGBA value as uint8
     """
-    color_label = label
-    if color_label == UNSIGNED_NOISE_LABEL:
-        return Color("grey").rgba
-    elif color_label > 9:
-        color_label %= 9
-    return LABEL_COLORMAP(label).rgba
+    return tuple(generate_label_colors(np.array([label]))[0].tolist())
@@ -0,0 +1,280 @@
+from .color import generate_label_colors
+from .static import UNSIGNED_NOISE_LABEL
+
+from typing import Any
+import rerun as rr
+import numpy as np
+
+
+class EventLog:
+    """Routes the per-event data logged by the Phases to rerun
+
+    The default EventLog logs data immediately with rr.log, which is what we want for
+    live data. Phases should log per-event data through log_event and
+    log_event_labels rather than calling rr.log directly, so that the logging mode can
+    be changed (see ColumnarEventLog).
+
+    Methods
+    -------
+    begin_event(event_id)
+        Start logging a new event
+    log(entity_path, archetype, **fields)
+        Log data for the current event
+    log_labels(entity_path, labels)
+        Log the annotation (color) of a set of cluster labels for the current event
+    flush()
+        Send any buffered data to rerun
+    """
+
+    def begin_event(self, event_id: int) -> None:
+        """Start logging a new event, clearing the data of the previous event
+
+        Parameters
+        ----------
+        event_id: int
+            The event number
+        """
+        rr.set_time_sequence("event_time", event_id)
+        rr.log("/event", rr.Clear(recursive=True))
+
+    def log(self, entity_path: str, archetype: Any, **fields: Any) -> None:
+        """Log data for the current event
+
+        Parameters
+        ----------
+        entity_path: str
+            The rerun entity path
+        archetype: Any
+            The rerun archetype type (i.e. rr.Points3D)
+        **fields: Any
+            The fields of the archetype. The first field is the primary component,
+            which sets the number of instances (i.e. positions for rr.Points3D).
+        """
+        rr.log(entity_path, archetype(**fields))
+
+    def log_labels(self, entity_path: str, labels: np.ndarray) -> None:
+        """Log the annotation (color) of a set of cluster labels for the current event
+
+        Parameters
+        ----------
+        entity_path: str
+            The rerun entity path
+        labels: ndarray
+            The cluster labels, including the unsigned noise label
+        """
+        colors = generate_label_colors(labels)
+        rr.log(
+            entity_path,
+            rr.AnnotationContext(
+                [
+                    rr.AnnotationInfo(label, None, color)
+                    for label, color in zip(labels.tolist(), colors)
+                ]
+            ),
+        )
+
+    def flush(self) -> None:
+        """Send any buffered data to rerun. Nothing is buffered by the default log."""
+        pass
+
+
+class ColumnarEventLog(EventLog):
+    """An EventLog which buffers many events and sends them as columns
+
+    Intended for offline (file) data, where the overhead of rerun log calls dominates
+    for small events. Data for batch_size events is buffered, and then each entity is
+    sent with a single rr.send_columns call over the event_time sequence. Events which
+    did not log an entity get an empty partition, so that stale data is never shown.
+    The previous batch is cleared with a single Clear at the start of each batch, and
+    cluster label colors are logged once as a static AnnotationContext.
+
+    Parameters
+    ----------
+    batch_size: int
+        The number of events to buffer before sending. Default is 256.
+
+    Attributes
+    ----------
+    batch_size: int
+        The number of events to buffer before sending
+
+    Methods
+    -------
+    begin_event(event_id)
+        Start logging a new event, sending the buffer if it is full
+    log(entity_path, archetype, **fields)
+        Buffer data for the current event
+    log_labels(entity_path, labels)
+        Record the cluster labels used by the current event
+    flush()
+        Send all buffered data to rerun
+    """
+
+    def __init__(self, batch_size: int = 256):
+        self.batch_size = batch_size
+        self._event_ids: list[int] = []
+        # entity path -> (archetype, buffered (event index, fields) pairs)
+        self._buffers: dict[str, tuple[Any, list[tuple[int, dict[str, Any]]]]] = {}
+        # entity path -> max label in the logged AnnotationContext
+        self._max_labels: dict[str, int] = {}
+
+    def begin_event(self, event_id: int) -> None:
+        """Start logging a new event, sending the buffer if it is full
+
+        Parameters
+        ----------
+        event_id: int
+            The event number
+        """
+        if len(self._event_ids) >= self.batch_size:
+            self.flush()
+        rr.set_time_sequence("event_time", event_id)
+        self._event_ids.append(event_id)
+
+    def log(self, entity_path: str, archetype: Any, **fields: Any) -> None:
+        """Buffer data for the current event
+
+        Scalar fields are broadcast to the number of instances when sent. An entity
+        must be logged with the same fields for every event. Data logged before the
+        first event is started is logged immediately.
+
+        Parameters
+        ----------
+        entity_path: str
+            The rerun entity path
+        archetype: Any
+            The rerun archetype type (i.e. rr.Points3D)
+        **fields: Any
+            The fields of the archetype. The first field is the primary component,
+            which sets the number of instances (i.e. positions for rr.Points3D).
+        """
+        if len(self._event_ids) == 0:
+            rr.log(entity_path, archetype(**fields))
+            return
+        _, entries = self._buffers.setdefault(entity_path, (archetype, []))
+        entries.append((len(self._event_ids) - 1, fields))
+
+    def log_labels(self, entity_path: str, labels: np.ndarray) -> None:
+        """Record the cluster labels used by the current event
+
+        Label colors only depend on the label, so a single static AnnotationContext
+        covering every label seen is logged, and only updated when a larger label
+        appears.
+
+        Parameters
+        ----------
+        entity_path: str
+            The rerun entity path
+        labels: ndarray
+            The cluster labels, including the unsigned noise label
+        """
+        labels = labels[labels != UNSIGNED_NOISE_LABEL]
+        max_label = int(np.max(labels)) if len(labels) > 0 else 0
+        if max_label <= self._max_labels.get(entity_path, -1):
+            return
+        self._max_labels[entity_path] = max_label
+        all_labels = np.append(np.arange(max_label + 1), UNSIGNED_NOISE_LABEL)
+        colors = generate_label_colors(all_labels)
+        rr.log(
+            entity_path,
+            rr.AnnotationContext(
+                [
+                    rr.AnnotationInfo(label, None, color)
+                    for label, color in zip(all_labels.tolist(), colors)
+                ]
+            ),
+            static=True,
+        )
+
+    def flush(self) -> None:
+        """Send all buffered data to rerun"""
+        if len(self._event_ids) == 0:
+            return
+        n_events = len(self._event_ids)
+        current_event = self._event_ids[-1]
+        # Clear whatever the previous batch left behind
+        rr.set_time_sequence("event_time", self._event_ids[0])
+        rr.log("/event", rr.Clear(recursive=True))
+        times = rr.TimeSequenceColumn("event_time", self._event_ids)
+        for entity_path, (archetype, entries) in self._buffers.items():
+            lengths = np.zeros(n_events, dtype=np.int64)
+            columns: dict[str, list[np.ndarray]] = {}
+            for event_index, fields in entries:
+                primary = next(iter(fields.values()))
+                n_instances = 1 if np.ndim(primary) == 0 else len(primary)
+                lengths[event_index] += n_instances
+                for name, value in fields.items():
+                    if value is None:
+                        continue
+                    if np.ndim(value) == 0:
+                        value = np.full(n_instances, value)
+                    columns.setdefault(name, []).append(np.asarray(value))
+            rr.send_columns(
+                entity_path,
+                indexes=[times],
+                columns=archetype.columns(
+                    **{name: np.concatenate(values) for name, values in columns.items()}
+                ).partition(lengths),
+            )
+        self._event_ids.clear()
+        self._buffers.clear()
+        rr.set_time_sequence("event_time", current_event)
+
+
+# The EventLog used by the Phases
+_event_log: EventLog = EventLog()
+
+
+def get_event_log() -> EventLog:
+    """Get the EventLog used by the Phases
+
+    Returns
+    -------
+    EventLog
+        The current EventLog
+    """
+    return _event_log
+
+
+def set_event_log(event_log: EventLog) -> None:
+    """Set the EventLog used by the Phases
+
+    Any data buffered in the current EventLog is flushed first.
+
+    Parameters
+    ----------
+    event_log: EventLog
+        The new EventLog
+    """
+    global _event_log
+    _event_log.flush()
+    _event_log = event_log
+
+
+def log_event(entity_path: str, archetype: Any, **fields: Any) -> None:
+    """Log data for the current event through the current EventLog
+
+    Parameters
+    ----------
+    entity_path: str
+        The rerun entity path
+    archetype: Any
+        The rerun archetype type (i.e. rr.Points3D)
+    **fields: Any
+        The fields of the archetype. The first field is the primary component, which
+        sets the number of instances (i.e. positions for rr.Points3D).
+    """
+    _event_log.log(entity_path, archetype, **fields)
+
+
+def log_event_labels(entity_path: str, labels: np.ndarray) -> None:
+    """Log the annotation (color) of a set of cluster labels through the current EventLog
+
+    Parameters
+    ----------
+    entity_path: str
+        The rerun entity path
+    labels: ndarray
+        The cluster labels, including the unsigned noise label
+    """
+    _event_log.log_labels(entity_path, labels)
@@ -0,0 +1,287 @@
+from .._attpc_conduit import Conduit
+from .sparse import SparseEvent
+from spyral.trace.trace_reader import create_reader
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from typing import Iterable, Iterator
+import numpy as np
+
+
+class EventSource(ABC):
+    """Abstract Base Class of a source of events for the pipeline
+
+    An EventSource gives the live (Conduit) and offline (file) paths one interface.
+    Events are taken from the source in batches with poll, or by iterating over the
+    source.
+
+    Methods
+    -------
+    poll()
+        Get the next batch of events. This is an abstract method.
+    is_finished()
+        Check if the source has no more events. This is an abstract method.
+    close()
+        Release any resources held by the source
+    """
+
+    @abstractmethod
+    def poll(self) -> list[tuple[int, np.ndarray | SparseEvent]]:
+        """Get the next batch of events. This is an abstract method.
+
+        May block for a limited time waiting for events.
+
+        Returns
+        -------
+        list[tuple[int, numpy.ndarray | SparseEvent]]
+            The events as tuples of the event number and trace matrix (or SparseEvent),
+            in order. The list can be empty if no events are ready.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_finished(self) -> bool:
+        """Check if the source has no more events. This is an abstract method.
+
+        Returns
+        -------
+        bool
+            True if no more events will be produced
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the source"""
+        pass
+
+    def __iter__(self) -> Iterator[tuple[int, np.ndarray | SparseEvent]]:
+        while not self.is_finished():
+            for event in self.poll():
+                yield event
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class ConduitEventSource(EventSource):
+    """An EventSource which polls events from a live Conduit
+
+    Parameters
+    ----------
+    conduit: Conduit
+        The connected Conduit
+    batch_size: int
+        The maximum number of events taken per poll. Default is 10.
+    timeout: float
+        The maximum time to wait for events per poll in seconds. The GIL is released
+        while waiting. Default is 0.1 s.
+    sparse: bool
+        If True, events are polled in sparse form as SparseEvents, which is much less
+        data for zero suppressed events. Default is False.
+
+    Attributes
+    ----------
+    conduit: Conduit
+        The Conduit
+    batch_size: int
+        The maximum number of events taken per poll
+    timeout: float
+        The maximum time to wait for events per poll in seconds
+    sparse: bool
+        If True, events are polled as SparseEvents
+
+    Methods
+    -------
+    poll()
+        Get the next batch of events from the Conduit
+    is_finished()
+        Check if the Conduit has no more events to give
+    """
+
+    def __init__(
+        self,
+        conduit: Conduit,
+        batch_size: int = 10,
+        timeout: float = 0.1,
+        sparse: bool = False,
+    ):
+        self.conduit = conduit
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.sparse = sparse
+
+    def poll(self) -> list[tuple[int, np.ndarray | SparseEvent]]:
+        """Get the next batch of events from the Conduit
+
+        Returns
+        -------
+        list[tuple[int, numpy.ndarray | SparseEvent]]
+            The ready events as tuples of the event number and trace matrix (or
+            SparseEvent)
+        """
+        if self.sparse:
+            return [
+                (event_id, SparseEvent(*arrays))
+                for event_id, arrays in self.conduit.poll_events_sparse(
+                    self.batch_size, self.timeout
+                )
+            ]
+        return self.conduit.poll_events_batch(self.batch_size, self.timeout)
+
+    def is_finished(self) -> bool:
+        """Check if the Conduit has no more events to give
+
+        Returns
+        -------
+        bool
+            True if the Conduit is not connected, or if its data streams have ended
+            and every event has been polled
+        """
+        return not self.conduit.is_connected() or self.conduit.is_finished()
+
+
+class FileEventSource(EventSource):
+    """An EventSource which reads events from a trace (merged HDF5) file ahead of time
+
+    A background thread reads the events into a bounded queue, so that file I/O and
+    decompression overlap with the analysis. Events are read in chunks of consecutive
+    events; the merged formats store each event as its own dataset, so each event
+    is read whole in a single call and a chunk is handed over at once.
+
+    Parameters
+    ----------
+    path: Path
+        The path to the trace file
+    event_ids: Iterable[int] | None
+        The events to read, in order. If None, the full event range of the file is
+        read.
+    prefetch: int
+        The maximum number of events read ahead. Default is 64.
+    chunk_size: int
+        The number of events read per chunk. Default is 16.
+    timeout: float
+        The maximum time to wait for events per poll in seconds. Default is 0.1 s.
+
+    Attributes
+    ----------
+    path: Path
+        The path to the trace file
+    timeout: float
+        The maximum time to wait for events per poll in seconds
+
+    Methods
+    -------
+    poll()
+        Get the next chunk of events read from the file
+    is_finished()
+        Check if every event has been taken from the source
+    close()
+        Stop the reading thread
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        event_ids: Iterable[int] | None = None,
+        prefetch: int = 64,
+        chunk_size: int = 16,
+        timeout: float = 0.1,
+    ):
+        self.path = path
+        self.timeout = timeout
+        reader = create_reader(path, 0)
+        if reader is None:
+            raise ValueError(f"Could not read events from {path}")
+        if event_ids is None:
+            event_ids = reader.event_range()
+        self._chunk_size = max(chunk_size, 1)
+        # The queue holds chunks. None marks the end of the events.
+        self._queue: Queue[list[tuple[int, np.ndarray]] | None] = Queue(
+            maxsize=max(prefetch // self._chunk_size, 1)
+        )
+        self._stop = Event()
+        self._done = False
+        self._error: Exception | None = None
+        self._thread = Thread(
+            target=self._read, args=(reader, iter(event_ids)), daemon=True
+        )
+        self._thread.start()
+
+    def _put(self, item: list[tuple[int, np.ndarray]] | None) -> bool:
+        """Put an item in the queue, giving up if the source is closed"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _read(self, reader, event_ids: Iterator[int]) -> None:
+        """Read chunks of events into the queue. Runs on the background thread."""
+        try:
+            chunk: list[tuple[int, np.ndarray]] = []
+            for event_id in event_ids:
+                if self._stop.is_set():
+                    return
+                event = reader.read_raw_get_event(event_id)
+                if event is None:
+                    continue
+                chunk.append((event_id, event))
+                if len(chunk) == self._chunk_size:
+                    if not self._put(chunk):
+                        return
+                    chunk = []
+            if len(chunk) > 0 and not self._put(chunk):
+                return
+        except Exception as e:
+            self._error = e
+        self._put(None)
+
+    def poll(self) -> list[tuple[int, np.ndarray]]:
+        """Get the next chunk of events read from the file
+
+        Returns
+        -------
+        list[tuple[int, numpy.ndarray]]
+            The events as tuples of the event number and trace matrix. Empty if no
+            events were ready within the timeout.
+
+        Raises
+        ------
+        Exception
+            Any exception raised while reading the file
+        """
+        if self._done:
+            return []
+        try:
+            chunk = self._queue.get(timeout=self.timeout)
+        except Empty:
+            return []
+        if chunk is None:
+            self._done = True
+            if self._error is not None:
+                raise self._error
+            return []
+        return chunk
+
+    def is_finished(self) -> bool:
+        """Check if every event has been taken from the source
+
+        Returns
+        -------
+        bool
+            True if every event has been taken
+        """
+        return self._done
+
+    def close(self) -> None:
+        """Stop the reading thread"""
+        self._stop.set()
+        self._thread.join()
+        self._done = True
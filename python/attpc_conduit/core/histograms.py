@@ -1,6 +1,10 @@
-from spyral_utils.plot.histogram import Histogrammer
+from spyral_utils.plot.histogram import Histogrammer, Hist1D, Hist2D
 from .static import PARTICLE_ID_HISTOGRAM, KINEMATICS_HISTOGRAM, POLAR_HISTOGRAM
 
+import rerun as rr
+import numpy as np
+import time
+
 
 def init_default_histograms(grammer: Histogrammer) -> None:
     """Create the default histograms
@@ -16,3 +20,179 @@ def init_default_histograms(grammer: Histogrammer) -> None:
     grammer.add_hist2d(PARTICLE_ID_HISTOGRAM, (512, 512), ((0.0, 200.0), (0.0, 3.0)))
     grammer.add_hist2d(KINEMATICS_HISTOGRAM, (180, 512), ((0.0, 180.0), (0.0, 3.0)))
     grammer.add_hist1d(POLAR_HISTOGRAM, 180, (0, 180.0))
+
+
+def compact_counts(counts: np.ndarray) -> np.ndarray:
+    """Convert histogram counts to the smallest unsigned integer type which holds them
+
+    Histogram counts are stored as 64-bit floats, but are always whole numbers. Sending
+    them as the smallest sufficient integer type reduces the size of the update by
+    a factor of 2 to 8. Every bin is still sent: rerun replaces a logged tensor as a
+    whole, and can't update only the bins which changed.
+
+    Parameters
+    ----------
+    counts: ndarray
+        The histogram counts
+
+    Returns
+    -------
+    ndarray
+        The counts as uint8, uint16, or uint32
+    """
+    max_count = np.max(counts) if counts.size > 0 else 0.0
+    for dtype in (np.uint8, np.uint16):
+        if max_count <= np.iinfo(dtype).max:
+            return counts.astype(dtype)
+    return counts.astype(np.uint32)
+
+
+def log_histogram(gram: Hist1D | Hist2D, compact: bool = False) -> None:
+    """Log a histogram to rerun
+
+    1-D histograms are logged as bar charts, 2-D histograms are logged as static
+    tensors. The whole histogram is logged every time (see compact_counts).
+
+    Parameters
+    ----------
+    gram: Hist1D | Hist2D
+        The histogram to log
+    compact: bool
+        If True, send the counts as the smallest sufficient integer type
+    """
+    counts = compact_counts(gram.counts) if compact else gram.counts
+    if isinstance(gram, Hist1D):
+        rr.log(f"/histograms/{gram.name}", rr.BarChart(counts))
+    elif isinstance(gram, Hist2D):
+        rr.log(f"/histograms/{gram.name}", rr.Tensor(counts.T), static=True)
+
+
+class HistogramPublisher:
+    """Publishes histograms to rerun at a limited rate
+
+    Re-logging every histogram after every event is expensive, especially for large
+    2-D histograms. The publisher instead flushes on a wall-clock and/or event-count
+    cadence, and only logs the histograms which changed since they were last
+    published. Histograms only ever accumulate counts, so a histogram is considered
+    changed when its total number of counts changes. A changed histogram is logged in
+    full (rerun has no partial tensor update), optionally with compact counts.
+
+    If both period and event_period are None, a flush is done for every event.
+
+    Parameters
+    ----------
+    period: float | None
+        The minimum time between flushes in seconds. Default is 0.5 s (2 Hz).
+    event_period: int | None
+        Flush after this many events. Default is None (not used).
+    compact: bool
+        If True, send the counts as the smallest sufficient integer type rather than
+        64-bit floats (see compact_counts). Default is True.
+
+    Attributes
+    ----------
+    period: float | None
+        The minimum time between flushes in seconds
+    event_period: int | None
+        Flush after this many events
+    compact: bool
+        If True, send compact counts
+
+    Methods
+    -------
+    update(grammer)
+        Record that an event was processed, flushing if the cadence is reached
+    idle(grammer)
+        Flush any unpublished events once the period has passed
+    flush(grammer)
+        Log all changed histograms
+    """
+
+    def __init__(
+        self,
+        period: float | None = 0.5,
+        event_period: int | None = None,
+        compact: bool = True,
+    ):
+        self.period = period
+        self.event_period = event_period
+        self.compact = compact
+        self._last_flush = 0.0
+        self._events_since_flush = 0
+        self._published_totals: dict[str, float] = {}
+
+    def _is_due(self) -> bool:
+        """Check if the publishing cadence has been reached"""
+        if self.period is None and self.event_period is None:
+            return True
+        if (
+            self.period is not None
+            and time.perf_counter() - self._last_flush >= self.period
+        ):
+            return True
+        return (
+            self.event_period is not None
+            and self._events_since_flush >= self.event_period
+        )
+
+    def update(self, grammer: Histogrammer) -> bool:
+        """Record that an event was processed, flushing if the cadence is reached
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+
+        Returns
+        -------
+        bool
+            True if the histograms were flushed
+        """
+        self._events_since_flush += 1
+        if not self._is_due():
+            return False
+        self.flush(grammer)
+        return True
+
+    def idle(self, grammer: Histogrammer) -> bool:
+        """Flush any unpublished events once the period has passed
+
+        Used while no events are arriving, so that the last events are published even
+        though update is not called again.
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+
+        Returns
+        -------
+        bool
+            True if the histograms were flushed
+        """
+        if self._events_since_flush == 0:
+            return False
+        if (
+            self.period is not None
+            and time.perf_counter() - self._last_flush < self.period
+        ):
+            return False
+        self.flush(grammer)
+        return True
+
+    def flush(self, grammer: Histogrammer) -> None:
+        """Log all of the histograms which changed since they were last published
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        """
+        for gram in grammer.histograms.values():
+            total = float(np.sum(gram.counts))
+            if self._published_totals.get(gram.name) == total:
+                continue
+            log_histogram(gram, self.compact)
+            self._published_totals[gram.name] = total
+        self._last_flush = time.perf_counter()
+        self._events_since_flush = 0
@@ -0,0 +1,165 @@
+from .phase import PhaseLike
+from .event_log import log_event
+
+import rerun as rr
+
+
+class LoadSheddingPolicy:
+    """A policy for shedding load when the pipeline falls behind the data stream
+
+    The policy watches the latency of events (the time from when an event was polled
+    to when it starts being analyzed) and the number of events waiting to be
+    analyzed. When either exceeds its limit, the policy starts shedding load: the
+    configured Phases (and all Phases after them, as they depend on the result) are
+    only run on a fraction of the events. Once both the latency and the backlog fall
+    below their recovery limits, all Phases are run on every event again.
+
+    Sampling is deterministic: a Phase with a fraction of 0.25 is run on exactly every
+    fourth event while shedding. The fraction of events each Phase was actually run
+    on over the whole run is tracked, and logged to /metrics/sampling_fraction, so that
+    histogram statistics can be corrected.
+
+    Parameters
+    ----------
+    sample_fractions: dict[str, float]
+        Map of Phase name (i.e. "Cluster") to the fraction of the events reaching the
+        Phase which it is run on while shedding load. Phases which are not in the map
+        are always run (unless a Phase before them was skipped).
+    max_latency: float
+        The latency in seconds above which load is shed. Default is 1.0 s.
+    recover_latency: float
+        The latency in seconds below which full processing resumes. Default is 0.1 s.
+    max_backlog: int | None
+        The number of waiting events above which load is shed. Default is None (not
+        used).
+    recover_backlog: int
+        The number of waiting events below which full processing resumes. Default is 0.
+
+    Attributes
+    ----------
+    sample_fractions: dict[str, float]
+        Map of Phase name to the fraction of events the Phase is run on while shedding
+    max_latency: float
+        The latency in seconds above which load is shed
+    recover_latency: float
+        The latency in seconds below which full processing resumes
+    max_backlog: int | None
+        The number of waiting events above which load is shed
+    recover_backlog: int
+        The number of waiting events below which full processing resumes
+    shedding: bool
+        True if the policy is currently shedding load
+
+    Methods
+    -------
+    update(latency, backlog)
+        Update the policy state with the current latency and backlog
+    select(phases)
+        Select how many of the Phases to run for an event
+    sampling_fraction(name)
+        Get the fraction of events a Phase was run on
+    log()
+        Log the policy state to rerun
+    """
+
+    def __init__(
+        self,
+        sample_fractions: dict[str, float],
+        max_latency: float = 1.0,
+        recover_latency: float = 0.1,
+        max_backlog: int | None = None,
+        recover_backlog: int = 0,
+    ):
+        self.sample_fractions = sample_fractions
+        self.max_latency = max_latency
+        self.recover_latency = recover_latency
+        self.max_backlog = max_backlog
+        self.recover_backlog = recover_backlog
+        self.shedding = False
+        self._credits: dict[str, float] = {name: 0.0 for name in sample_fractions}
+        self._offered: dict[str, int] = {}
+        self._run: dict[str, int] = {}
+
+    def update(self, latency: float | None, backlog: int = 0) -> None:
+        """Update the policy state with the current latency and backlog
+
+        Parameters
+        ----------
+        latency: float | None
+            The latency of the current event in seconds. If None, only the backlog is
+            considered.
+        backlog: int
+            The number of events waiting to be analyzed. Default is 0.
+        """
+        behind = (latency is not None and latency > self.max_latency) or (
+            self.max_backlog is not None and backlog > self.max_backlog
+        )
+        caught_up = (latency is None or latency < self.recover_latency) and (
+            backlog <= self.recover_backlog
+        )
+        if behind:
+            self.shedding = True
+        elif caught_up:
+            self.shedding = False
+
+    def select(self, phases: list[PhaseLike]) -> int:
+        """Select how many of the Phases to run for an event
+
+        Parameters
+        ----------
+        phases: list[PhaseLike]
+            The Phases of the pipeline, in order
+
+        Returns
+        -------
+        int
+            The number of leading Phases to run. The remaining Phases are skipped.
+        """
+        n_run = len(phases)
+        for idx, phase in enumerate(phases):
+            fraction = self.sample_fractions.get(phase.name)
+            if self.shedding and fraction is not None:
+                self._credits[phase.name] += fraction
+                if self._credits[phase.name] >= 1.0:
+                    self._credits[phase.name] -= 1.0
+                else:
+                    n_run = idx
+                    break
+
+        for idx, phase in enumerate(phases):
+            self._offered[phase.name] = self._offered.get(phase.name, 0) + 1
+            self._run[phase.name] = self._run.get(phase.name, 0) + int(idx < n_run)
+        return n_run
+
+    def sampling_fraction(self, name: str) -> float:
+        """Get the fraction of events a Phase was run on
+
+        Parameters
+        ----------
+        name: str
+            The Phase name
+
+        Returns
+        -------
+        float
+            The fraction of events the Phase was run on. If no events have been
+            offered to the Phase, returns 1.0.
+        """
+        offered = self._offered.get(name, 0)
+        if offered == 0:
+            return 1.0
+        return self._run[name] / offered
+
+    def log(self) -> None:
+        """Log the policy state to rerun
+
+        Logs whether load is being shed to /metrics/load_shedding and the sampling
+        fraction of every Phase to /metrics/sampling_fraction
+        """
+        log_event("/metrics/load_shedding", rr.Scalar, scalar=float(self.shedding))
+        for name in self._offered.keys():
+            log_event(
+                f"/metrics/sampling_fraction/{name}",
+                rr.Scalar,
+                scalar=self.sampling_fraction(name),
+            )
@@ -0,0 +1,206 @@
+from .phase import PhaseLike, PhaseResult
+from .event_log import log_event
+from spyral_utils.plot import Histogrammer
+
+from dataclasses import dataclass
+from typing import Any
+import rerun as rr
+import numpy as np
+import time
+
+
+@dataclass
+class PhaseMetrics:
+    """Dataclass representing the performance of a single Phase run
+
+    Attributes
+    ----------
+    name: str
+        The name of the Phase
+    wall_time: float
+        The time taken to run the Phase in seconds
+    successful: bool
+        True if the Phase was successful or False if it failed
+    size: int
+        The size of the artifact produced by the Phase (points, clusters, estimates)
+    """
+
+    name: str
+    wall_time: float
+    successful: bool
+    size: int
+
+
+def artifact_size(artifact: Any) -> int:
+    """Get the size of a Phase artifact
+
+    Parameters
+    ----------
+    artifact: Any
+        The artifact of a PhaseResult
+
+    Returns
+    -------
+    int
+        The length of the artifact, or 0 if the artifact has no length
+    """
+    try:
+        return len(artifact)
+    except TypeError:
+        return 0
+
+
+def run_phases(
+    phases: list[PhaseLike],
+    payload: PhaseResult,
+    grammer: Histogrammer,
+    rng: np.random.Generator,
+) -> tuple[PhaseResult, list[PhaseMetrics]]:
+    """Run a chain of Phases, timing each one
+
+    Parameters
+    ----------
+    phases: list[PhaseLike]
+        The Phases to run, in order
+    payload: PhaseResult
+        The input to the first Phase
+    grammer: Histogrammer
+        The histogram manager
+    rng: numpy.random.Generator
+        A random number generator
+
+    Returns
+    -------
+    tuple[PhaseResult, list[PhaseMetrics]]
+        The result of the last Phase and the metrics of each Phase
+    """
+    result = payload
+    metrics = []
+    for phase in phases:
+        start = time.perf_counter()
+        result = phase.run(result, grammer, rng)
+        stop = time.perf_counter()
+        size = artifact_size(result.artifact) if result.successful else 0
+        metrics.append(PhaseMetrics(phase.name, stop - start, result.successful, size))
+    return (result, metrics)
+
+
+class PipelineMetrics:
+    """Tracks the performance of the pipeline and logs it to rerun
+
+    For every event the wall time (ms), cumulative success rate, and artifact size of
+    each Phase are logged as scalars under /metrics/time, /metrics/success_rate, and
+    /metrics/size respectively. The poll-to-display latency (ms) is logged to
+    /metrics/latency and the event rate to /metrics/events_per_second.
+
+    Parameters
+    ----------
+    rate_window: float
+        The time window over which the event rate is measured in seconds. Default is
+        1 s.
+
+    Attributes
+    ----------
+    rate_window: float
+        The time window over which the event rate is measured in seconds
+
+    Methods
+    -------
+    record(phase_metrics, poll_time)
+        Record and log the metrics for an event
+    """
+
+    def __init__(self, rate_window: float = 1.0):
+        self.rate_window = rate_window
+        self._attempts: dict[str, int] = {}
+        self._successes: dict[str, int] = {}
+        self._window_start = time.perf_counter()
+        self._window_events = 0
+
+    def record(
+        self, phase_metrics: list[PhaseMetrics], poll_time: float | None = None
+    ) -> None:
+        """Record and log the metrics for an event
+
+        Parameters
+        ----------
+        phase_metrics: list[PhaseMetrics]
+            The metrics of each Phase run for the event
+        poll_time: float | None
+            The time.perf_counter() value when the event was polled from the conduit.
+            If None, the latency is not logged.
+        """
+        for metric in phase_metrics:
+            self._attempts[metric.name] = self._attempts.get(metric.name, 0) + 1
+            self._successes[metric.name] = self._successes.get(metric.name, 0) + int(
+                metric.successful
+            )
+            log_event(
+                f"/metrics/time/{metric.name}",
+                rr.Scalar,
+                scalar=metric.wall_time * 1.0e3,
+            )
+            log_event(
+                f"/metrics/success_rate/{metric.name}",
+                rr.Scalar,
+                scalar=self._successes[metric.name] / self._attempts[metric.name],
+            )
+            log_event(f"/metrics/size/{metric.name}", rr.Scalar, scalar=metric.size)
+
+        now = time.perf_counter()
+        if poll_time is not None:
+            log_event("/metrics/latency", rr.Scalar, scalar=(now - poll_time) * 1.0e3)
+
+        self._window_events += 1
+        elapsed = now - self._window_start
+        if elapsed >= self.rate_window:
+            log_event(
+                "/metrics/events_per_second",
+                rr.Scalar,
+                scalar=self._window_events / elapsed,
+            )
+            self._window_start = now
+            self._window_events = 0
+
+
+def log_conduit_stats(stats: dict[str, Any]) -> None:
+    """Log a snapshot of the Conduit backend statistics to rerun
+
+    Per-CoBo counters are logged under /metrics/conduit/<stat>/cobo_<n>, frame errors
+    under /metrics/conduit/frame_errors/<kind>, event filter rejections under
+    /metrics/conduit/filter_rejections/<kind>, and the remaining values under
+    /metrics/conduit/<stat>.
+
+    Parameters
+    ----------
+    stats: dict[str, Any]
+        The result of Conduit.stats(). An empty dictionary (never connected) logs
+        nothing.
+    """
+    for name in ("frames_received", "bytes_received", "seconds_since_data"):
+        for cobo, value in enumerate(stats.get(name, [])):
+            # A CoBo which has not sent any data has no seconds_since_data
+            if value is not None:
+                log_event(
+                    f"/metrics/conduit/{name}/cobo_{cobo}", rr.Scalar, scalar=value
+                )
+    for kind, count in stats.get("frame_errors", {}).items():
+        log_event(f"/metrics/conduit/frame_errors/{kind}", rr.Scalar, scalar=count)
+    for kind, count in stats.get("filter_rejections", {}).items():
+        log_event(f"/metrics/conduit/filter_rejections/{kind}", rr.Scalar, scalar=count)
+    for name in (
+        "cached_events",
+        "cached_frames",
+        "frame_queue_depth",
+        "event_queue_depth",
+        "complete_events",
+        "timeout_evictions",
+        "full_cache_evictions",
+        "end_of_stream_evictions",
+        "late_frames",
+        "recorded_frames",
+        "recording_drops",
+        "prescaled_events",
+    ):
+        if name in stats:
+            log_event(f"/metrics/conduit/{name}", rr.Scalar, scalar=stats[name])
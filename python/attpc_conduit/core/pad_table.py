@@ -0,0 +1,136 @@
+from spyral.core.config import PadParameters, DEFAULT_MAP
+from spyral.core.pad_map import PadMap
+from spyral.core.legacy_beam_pads import LEGACY_BEAM_PADS
+
+from importlib.resources import files, as_file
+from pathlib import Path
+import numpy as np
+import hashlib
+import logging
+import os
+
+# The columns of the pad table
+PAD_X: int = 0
+PAD_Y: int = 1
+PAD_TIME_OFFSET: int = 2
+PAD_GAIN: int = 3
+PAD_SCALE: int = 4
+PAD_VALID: int = 5  # 1.0 if the pad is in the map and is not a beam pad, otherwise 0.0
+NUMBER_OF_PAD_COLUMNS: int = 6
+
+# Bump this if the layout of the pad table changes, invalidating any cached tables
+PAD_TABLE_VERSION: int = 1
+
+# The packaged Spyral map files used when a PadParameters path is DEFAULT_MAP
+DEFAULT_PAD_FILES: dict[str, str] = {
+    "pad_geometry_path": "padxy.csv",
+    "pad_time_path": "pad_time_correction.csv",
+    "pad_electronics_path": "pad_electronics.csv",
+    "pad_scale_path": "pad_scale.csv",
+}
+
+
+def build_pad_table(pad_map: PadMap) -> np.ndarray:
+    """Build a dense pad table from a PadMap
+
+    The table has one row per pad number, so the pad data of a set of hits can be
+    gathered with a single fancy index over their pad numbers.
+
+    Parameters
+    ----------
+    pad_map: PadMap
+        The Spyral pad map
+
+    Returns
+    -------
+    numpy.ndarray
+        The (number of pads, NUMBER_OF_PAD_COLUMNS) pad table. Rows of pads missing
+        from the map are zero (and so not valid).
+    """
+    n_pads = max(pad_map.map.keys(), default=-1) + 1
+    table = np.zeros((n_pads, NUMBER_OF_PAD_COLUMNS))
+    for pad_id, pad in pad_map.map.items():
+        table[pad_id, PAD_X] = pad.x
+        table[pad_id, PAD_Y] = pad.y
+        table[pad_id, PAD_TIME_OFFSET] = pad.time_offset
+        table[pad_id, PAD_GAIN] = pad.gain
+        table[pad_id, PAD_SCALE] = pad.scale
+        table[pad_id, PAD_VALID] = 0.0 if pad_map.is_beam_pad(pad_id) else 1.0
+    return table
+
+
+def pad_table_key(pad_params: PadParameters) -> str:
+    """Make the cache key of the pad table for a set of PadParameters
+
+    The key is a hash of the contents of every pad map file (the packaged Spyral files
+    for DEFAULT_MAP paths), the beam pads, and the table version, so an edited map file
+    gets a new table.
+
+    Parameters
+    ----------
+    pad_params: PadParameters
+        Parameters describing the pad plane mapping
+
+    Returns
+    -------
+    str
+        The hex digest key
+    """
+    digest = hashlib.sha256(f"pad_table_v{PAD_TABLE_VERSION}".encode())
+    for field, default_name in DEFAULT_PAD_FILES.items():
+        path: Path = getattr(pad_params, field)
+        if path == DEFAULT_MAP:
+            with as_file(files("spyral.data").joinpath(default_name)) as default_path:
+                digest.update(default_path.read_bytes())
+        else:
+            digest.update(Path(path).read_bytes())
+    digest.update(np.asarray(sorted(LEGACY_BEAM_PADS), dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def load_pad_table(
+    pad_params: PadParameters, cache_path: Path | None = None
+) -> np.ndarray:
+    """Load the pad table for a set of PadParameters
+
+    If a cache directory is given, the table is read from the cache if it was built from
+    the same map files before (see pad_table_key). Otherwise the table is built from a
+    PadMap and written to the cache. Problems with the cache are logged and the table is
+    built as usual.
+
+    Parameters
+    ----------
+    pad_params: PadParameters
+        Parameters describing the pad plane mapping
+    cache_path: Path | None
+        The directory to cache pad tables in. Default is None, which does not cache.
+
+    Returns
+    -------
+    numpy.ndarray
+        The pad table (see build_pad_table)
+    """
+    if cache_path is None:
+        return build_pad_table(PadMap(pad_params))
+
+    table_path = cache_path / f"pad_table_{pad_table_key(pad_params)}.npy"
+    try:
+        table = np.load(table_path)
+        if table.ndim == 2 and table.shape[1] == NUMBER_OF_PAD_COLUMNS:
+            return table
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Could not read the cached pad table {table_path}: {e}")
+
+    table = build_pad_table(PadMap(pad_params))
+    try:
+        cache_path.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so a concurrent reader never sees a partial table
+        temp_path = table_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, "wb") as temp_file:
+            np.save(temp_file, table)
+        os.replace(temp_path, table_path)
+    except OSError as e:
+        logging.warning(f"Could not cache the pad table to {table_path}: {e}")
+    return table
@@ -0,0 +1,533 @@
+from .phase import PhaseLike, PhaseResult
+from .histograms import HistogramPublisher
+from .metrics import PhaseMetrics, PipelineMetrics, run_phases
+from .load_shedding import LoadSheddingPolicy
+from .event_log import ColumnarEventLog, get_event_log, set_event_log
+from .sparse import SparseEvent
+from spyral_utils.plot import Histogrammer
+
+from spyral.trace.trace_reader import TraceReader, create_reader
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+import multiprocessing as mp
+import rerun as rr
+import numpy as np
+import time
+import sys
+import os
+
+
+@dataclass
+class WorkerResult:
+    """Dataclass representing the result of an event analyzed by a pipeline worker
+
+    Attributes
+    ----------
+    event_id: int
+        The event that was analyzed
+    recording: bytes
+        The encoded Rerun data logged by the phases for this event
+    histograms: dict[str, numpy.ndarray]
+        The histogram counts filled by the phases for this event, keyed by histogram
+        name. Only histograms which were filled are included.
+    phase_metrics: list[PhaseMetrics]
+        The performance metrics of each phase run for this event
+    """
+
+    event_id: int
+    recording: bytes
+    histograms: dict[str, np.ndarray]
+    phase_metrics: list[PhaseMetrics]
+
+
+# Per-process state of a pipeline worker. Each worker owns its own phases,
+# histograms, random number generator, and Rerun recording.
+_worker_phases: list[PhaseLike] = []
+_worker_grammer: Histogrammer = Histogrammer()
+_worker_rng: np.random.Generator = np.random.default_rng()
+_worker_storage: rr.MemoryRecording | None = None
+_worker_readers: dict[Path, TraceReader] = {}
+
+
+def _init_worker(
+    phases: list[PhaseLike],
+    grammer: Histogrammer,
+    application_id: str,
+    recording_id: str,
+    entropy: int,
+) -> None:
+    """Initialize the state of a pipeline worker process
+
+    The worker logs into an in-memory Rerun recording which shares the application
+    and recording ids of the parent, so that the parent can forward the data as-is.
+    The worker stdout is redirected to stderr, as the parent stdout may be carrying
+    the Rerun stream (i.e. in a file loader).
+
+    Parameters
+    ----------
+    phases: list[PhaseLike]
+        The Phases of the analysis pipeline
+    grammer: Histogrammer
+        The histogram manager to copy. Counts are reset.
+    application_id: str
+        The parent Rerun application id
+    recording_id: str
+        The parent Rerun recording id
+    entropy: int
+        Entropy used to seed the worker random number generator
+    """
+    global _worker_phases, _worker_grammer, _worker_rng, _worker_storage
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    _worker_phases = phases
+    _worker_grammer = grammer
+    for gram in _worker_grammer.histograms.values():
+        gram.counts[:] = 0
+    _worker_rng = np.random.default_rng([entropy, os.getpid()])
+    rr.init(application_id, recording_id=recording_id, spawn=False)
+    _worker_storage = rr.memory_recording()
+
+
+def _drain_histograms(grammer: Histogrammer) -> dict[str, np.ndarray]:
+    """Take the counts out of the histograms, resetting them
+
+    Parameters
+    ----------
+    grammer: Histogrammer
+        The histogram manager
+
+    Returns
+    -------
+    dict[str, numpy.ndarray]
+        The counts of every histogram which was filled, keyed by name
+    """
+    counts = {}
+    for name, gram in grammer.histograms.items():
+        if np.any(gram.counts):
+            counts[name] = gram.counts.copy()
+            gram.counts[:] = 0
+    return counts
+
+
+def _analyze_event(
+    event_id: int, event: np.ndarray | SparseEvent, n_phases: int
+) -> list[PhaseMetrics]:
+    """Run the pipeline phases for a single event in a worker process
+
+    Parameters
+    ----------
+    event_id: int
+        The event number
+    event: numpy.ndarray | SparseEvent
+        The trace matrix (or SparseEvent) of the event to be analyzed
+    n_phases: int
+        The number of leading phases to run
+
+    Returns
+    -------
+    list[PhaseMetrics]
+        The performance metrics of each phase run
+    """
+    get_event_log().begin_event(event_id)
+    payload = PhaseResult(artifact=event, successful=True, event_id=event_id)
+    _, phase_metrics = run_phases(
+        _worker_phases[:n_phases], payload, _worker_grammer, _worker_rng
+    )
+    return phase_metrics
+
+
+def _run_worker_event(
+    event_id: int, event: np.ndarray | SparseEvent, n_phases: int
+) -> WorkerResult:
+    """Run the pipeline phases for a single event in a worker process
+
+    Parameters
+    ----------
+    event_id: int
+        The event number
+    event: numpy.ndarray | SparseEvent
+        The trace matrix (or SparseEvent) of the event to be analyzed
+    n_phases: int
+        The number of leading phases to run
+
+    Returns
+    -------
+    WorkerResult
+        The logged data and histogram counts for the event
+    """
+    phase_metrics = _analyze_event(event_id, event, n_phases)
+    recording = b""
+    if _worker_storage is not None:
+        recording = _worker_storage.drain_as_bytes()
+    return WorkerResult(
+        event_id, recording, _drain_histograms(_worker_grammer), phase_metrics
+    )
+
+
+def _run_worker_file_chunk(
+    path: Path, event_ids: list[int], n_phases: int
+) -> list[WorkerResult]:
+    """Read a chunk of events from a trace file and run the pipeline phases on them
+
+    The trace file is opened once per worker and kept open. The event data of the
+    chunk is sent as columns (see ColumnarEventLog); the recording of the whole chunk
+    is attached to the last result.
+
+    Parameters
+    ----------
+    path: Path
+        The path to the trace (merged HDF5) file
+    event_ids: list[int]
+        The events to analyze
+    n_phases: int
+        The number of leading phases to run
+
+    Returns
+    -------
+    list[WorkerResult]
+        The logged data and histogram counts of each event which was found in the file
+    """
+    reader = _worker_readers.get(path)
+    if reader is None:
+        reader = create_reader(path, 0)
+        if reader is None:
+            raise RuntimeError(f"Could not open trace file {path}")
+        _worker_readers[path] = reader
+
+    if not isinstance(get_event_log(), ColumnarEventLog):
+        set_event_log(ColumnarEventLog(len(event_ids)))
+
+    results = []
+    for event_id in event_ids:
+        event = reader.read_raw_get_event(event_id)
+        if event is None:
+            continue
+        phase_metrics = _analyze_event(event_id, event, n_phases)
+        results.append(
+            WorkerResult(
+                event_id, b"", _drain_histograms(_worker_grammer), phase_metrics
+            )
+        )
+
+    get_event_log().flush()
+    if _worker_storage is not None and len(results) > 0:
+        results[-1].recording = _worker_storage.drain_as_bytes()
+    return results
+
+
+class ParallelConduitPipeline:
+    """A ConduitPipeline which analyzes events in a pool of worker processes
+
+    Each worker process holds its own copy of the phases and a private Histogrammer.
+    Events are distributed to the workers, and the results are collected in event
+    order. The parent merges the worker histograms into its Histogrammer and does all
+    of the Rerun logging. The phases themselves are unchanged; anything a phase logs
+    to Rerun in a worker is forwarded through the parent recording.
+
+    The worker pool is started lazily on the first call to run or replay.
+
+    Parameters
+    ----------
+    phases: list[PhaseLike]
+        The Phases of the analysis pipeline. Note that these are conduit PhaseLikes
+        *not* attpc_spyral PhaseLikes. The phases must be picklable.
+    n_workers: int
+        The number of worker processes
+    max_pending: int | None
+        The maximum number of events in flight. If None, defaults to twice the number
+        of workers.
+    publisher: HistogramPublisher | None
+        Controls how often histograms are logged. If None, a default
+        HistogramPublisher is used.
+    metrics: PipelineMetrics | None
+        Tracks and logs the pipeline performance. If None, a default PipelineMetrics
+        is used.
+    shedding: LoadSheddingPolicy | None
+        Controls which Phases are skipped when the pipeline falls behind. The number
+        of events in flight, plus the backlog given to run, is used as the backlog. If
+        None, all Phases are always run.
+
+    Attributes
+    ----------
+    phases: list[PhaseLike]
+        The Phases of the analysis pipeline.
+    n_workers: int
+        The number of worker processes
+    max_pending: int
+        The maximum number of events in flight
+    publisher: HistogramPublisher
+        Controls how often histograms are logged
+    metrics: PipelineMetrics
+        Tracks and logs the pipeline performance
+    shedding: LoadSheddingPolicy | None
+        Controls which Phases are skipped when the pipeline falls behind
+
+    Methods
+    -------
+    run(event_id, event, grammer, rng, poll_time, backlog)
+        Submit an event to the pipeline and log any finished events
+    replay(path, event_ids, grammer, rng, chunk_size)
+        Analyze the events of a trace file, reading them in the workers
+    idle(grammer)
+        Log any finished events while no events are arriving
+    flush(grammer)
+        Wait for all events in flight and log them
+    shutdown(grammer)
+        Flush the pipeline, stop the worker processes, and release the resources held
+        by the Phases
+    """
+
+    def __init__(
+        self,
+        phases: list[PhaseLike],
+        n_workers: int,
+        max_pending: int | None = None,
+        publisher: HistogramPublisher | None = None,
+        metrics: PipelineMetrics | None = None,
+        shedding: LoadSheddingPolicy | None = None,
+    ):
+        self.phases = phases
+        self.n_workers = n_workers
+        self.max_pending = max_pending if max_pending is not None else 2 * n_workers
+        self.publisher = publisher if publisher is not None else HistogramPublisher()
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.shedding = shedding
+        self._pool: ProcessPoolExecutor | None = None
+        # Events (or chunks of events) in flight, along with the time they were polled
+        self._pending: deque[
+            tuple[Future[WorkerResult | list[WorkerResult]], float | None]
+        ] = deque()
+
+    def _start(self, grammer: Histogrammer, rng: np.random.Generator) -> None:
+        """Start the worker pool
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager, used as a template for the worker histograms
+        rng: numpy.random.Generator
+            A random number generator used to seed the workers
+        """
+        application_id = rr.get_application_id()
+        recording_id = rr.get_recording_id()
+        if application_id is None or recording_id is None:
+            raise RuntimeError(
+                "ParallelConduitPipeline requires an initialized Rerun recording!"
+            )
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                self.phases,
+                grammer,
+                application_id,
+                recording_id,
+                int(rng.integers(np.iinfo(np.int64).max)),
+            ),
+        )
+
+    def _log_result(
+        self, result: WorkerResult, grammer: Histogrammer, poll_time: float | None
+    ) -> None:
+        """Merge the worker result into the parent and log it
+
+        Parameters
+        ----------
+        result: WorkerResult
+            The result from the worker
+        grammer: Histogrammer
+            The histogram manager
+        poll_time: float | None
+            The time.perf_counter() value when the event was polled
+        """
+        rr.set_time_sequence("event_time", result.event_id)
+        if len(result.recording) != 0:
+            rr.log_file_from_contents(f"event_{result.event_id}.rrd", result.recording)
+        for name, counts in result.histograms.items():
+            grammer.histograms[name].counts += counts
+        self.publisher.update(grammer)
+        self.metrics.record(result.phase_metrics, poll_time)
+
+    def _collect(self, grammer: Histogrammer, block: bool) -> None:
+        """Log the finished events in order
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        block: bool
+            If True, wait until all events in flight are finished
+        """
+        while len(self._pending) > 0:
+            future, poll_time = self._pending[0]
+            if (
+                not block
+                and not future.done()
+                and len(self._pending) < self.max_pending
+            ):
+                break
+            self._pending.popleft()
+            results = future.result()
+            if isinstance(results, WorkerResult):
+                results = [results]
+            for result in results:
+                self._log_result(result, grammer, poll_time)
+
+    def run(
+        self,
+        event_id: int,
+        event: np.ndarray | SparseEvent,
+        grammer: Histogrammer,
+        rng: np.random.Generator,
+        poll_time: float | None = None,
+        backlog: int = 0,
+    ) -> None:
+        """Submit a single event to the pipeline
+
+        The event is analyzed asynchronously. Any events which have finished are
+        logged in order. If the maximum number of events are in flight, this blocks
+        until the oldest event is finished. If a load shedding policy is set, some
+        of the Phases may be skipped when the pipeline is behind.
+
+        Parameters
+        ----------
+        event_id: int
+            The event number
+        event: numpy.ndarray | SparseEvent
+            The trace matrix (or SparseEvent) of the event to be analyzed
+        grammer: Histogrammer
+            The histogram manager
+        rng: numpy.random.Generator
+            A random number generator, used to seed the workers when the pool starts
+        poll_time: float | None
+            The time.perf_counter() value when the event was polled, used to measure
+            the poll-to-display latency. Default is None.
+        backlog: int
+            The number of events waiting to be submitted after this one (i.e. the rest
+            of the poll and the events queued in the Conduit). Default is 0.
+        """
+        if self._pool is None:
+            self._start(grammer, rng)
+        assert self._pool is not None
+        n_phases = len(self.phases)
+        if self.shedding is not None:
+            latency = None if poll_time is None else time.perf_counter() - poll_time
+            self.shedding.update(latency, len(self._pending) + backlog)
+            n_phases = self.shedding.select(self.phases)
+            rr.set_time_sequence("event_time", event_id)
+            self.shedding.log()
+        future = self._pool.submit(_run_worker_event, event_id, event, n_phases)
+        self._pending.append((future, poll_time))
+        self._collect(grammer, block=False)
+
+    def replay(
+        self,
+        path: Path,
+        event_ids: Iterable[int],
+        grammer: Histogrammer,
+        rng: np.random.Generator,
+        chunk_size: int = 16,
+    ) -> None:
+        """Analyze the events of a trace file
+
+        The event range is split into chunks of consecutive events, and each worker
+        reads its chunks directly from the file, so that the event data never passes
+        through the parent. Results are logged in event order, and the pipeline is
+        flushed once all events are analyzed. All Phases are run on every event.
+
+        Parameters
+        ----------
+        path: Path
+            The path to the trace (merged HDF5) file
+        event_ids: Iterable[int]
+            The events to analyze, in order
+        grammer: Histogrammer
+            The histogram manager
+        rng: numpy.random.Generator
+            A random number generator, used to seed the workers when the pool starts
+        chunk_size: int
+            The number of events given to a worker at a time. Default is 16.
+        """
+        if self._pool is None:
+            self._start(grammer, rng)
+        assert self._pool is not None
+        chunk: list[int] = []
+        for event_id in event_ids:
+            chunk.append(event_id)
+            if len(chunk) < chunk_size:
+                continue
+            self._submit_chunk(path, chunk, grammer)
+            chunk = []
+        if len(chunk) > 0:
+            self._submit_chunk(path, chunk, grammer)
+        self.flush(grammer)
+
+    def _submit_chunk(
+        self, path: Path, chunk: list[int], grammer: Histogrammer
+    ) -> None:
+        """Submit a chunk of file events to the workers and log any finished events
+
+        Parameters
+        ----------
+        path: Path
+            The path to the trace file
+        chunk: list[int]
+            The events of the chunk
+        grammer: Histogrammer
+            The histogram manager
+        """
+        assert self._pool is not None
+        future = self._pool.submit(
+            _run_worker_file_chunk, path, chunk, len(self.phases)
+        )
+        self._pending.append((future, None))
+        self._collect(grammer, block=False)
+
+    def idle(self, grammer: Histogrammer) -> None:
+        """Log any finished events while no events are arriving
+
+        Finished events are otherwise only logged when the next event is submitted.
+        The histograms of the last events are published once the publisher period has
+        passed.
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        """
+        self._collect(grammer, block=False)
+        self.publisher.idle(grammer)
+
+    def flush(self, grammer: Histogrammer) -> None:
+        """Wait for all events in flight and log them
+
+        Any histograms which have not been published are also logged.
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        """
+        self._collect(grammer, block=True)
+        self.publisher.flush(grammer)
+
+    def shutdown(self, grammer: Histogrammer) -> None:
+        """Flush the pipeline, stop the worker processes, and release the resources
+        held by the Phases
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        """
+        self.flush(grammer)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for phase in self.phases:
+            phase.shutdown()
@@ -54,6 +54,8 @@ class PhaseLike(ABC):
     -------
     run(payload, grammer, rng)
         Run the phase. This is an abstract method.
+    shutdown()
+        Release any resources held by the phase
     """
 
     def __init__(
@@ -91,3 +93,10 @@ class PhaseLike(ABC):
             The result of this phase containing the artifact information
         """
         raise NotImplementedError
+
+    def shutdown(self) -> None:
+        """Release any resources held by the phase (i.e. worker processes)
+
+        Does nothing by default. Phases holding resources should override it.
+        """
+        pass
@@ -1,9 +1,15 @@
 from .phase import PhaseLike, PhaseResult
-from spyral_utils.plot import Histogrammer, Hist1D, Hist2D
+from .histograms import HistogramPublisher
+from .metrics import PipelineMetrics, run_phases
+from .load_shedding import LoadSheddingPolicy
+from .event_log import get_event_log
+from .sparse import SparseEvent
+from spyral_utils.plot import Histogrammer
 
 
 import rerun as rr
 import numpy as np
+import time
 
 
 def init_detector_bounds() -> None:
@@ -30,59 +36,131 @@ class ConduitPipeline:
     phases: list[PhaseLike]
         The Phases of the analysis pipeline. Note that these are conduit PhaseLikes
         *not* attpc_spyral PhaseLikes.
+    publisher: HistogramPublisher | None
+        Controls how often histograms are logged. If None, a default
+        HistogramPublisher is used.
+    metrics: PipelineMetrics | None
+        Tracks and logs the pipeline performance. If None, a default PipelineMetrics
+        is used.
+    shedding: LoadSheddingPolicy | None
+        Controls which Phases are skipped when the pipeline falls behind. If None,
+        all Phases are always run.
 
     Attributes
     ----------
     phases: list[PhaseLike]
         The Phases of the analysis pipeline. Note that these are conduit PhaseLikes
         *not* attpc_spyral PhaseLikes.
+    publisher: HistogramPublisher
+        Controls how often histograms are logged
+    metrics: PipelineMetrics
+        Tracks and logs the pipeline performance
+    shedding: LoadSheddingPolicy | None
+        Controls which Phases are skipped when the pipeline falls behind
 
     Methods
     -------
-    run(event_id, event, grammer, seed)
+    run(event_id, event, grammer, seed, poll_time, backlog)
         Run the pipeline for an event
+    idle(grammer)
+        Publish the histograms of the last events while no events are arriving
+    flush(grammer)
+        Send any buffered event data and log any histograms which have not been
+        published
+    shutdown(grammer)
+        Flush the pipeline and release the resources held by the Phases
 
     """
 
     def __init__(
         self,
         phases: list[PhaseLike],
+        publisher: HistogramPublisher | None = None,
+        metrics: PipelineMetrics | None = None,
+        shedding: LoadSheddingPolicy | None = None,
     ):
         self.phases = phases
+        self.publisher = publisher if publisher is not None else HistogramPublisher()
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.shedding = shedding
 
     def run(
         self,
         event_id: int,
-        event: np.ndarray,
+        event: np.ndarray | SparseEvent,
         grammer: Histogrammer,
         rng: np.random.Generator,
+        poll_time: float | None = None,
+        backlog: int = 0,
     ) -> None:
         """Run the pipeline for a single event
 
-        The conduit pipeline runs on single events.
+        The conduit pipeline runs on single events. If a load shedding policy is
+        set, some of the Phases may be skipped when the pipeline is behind.
 
         Parameters
         ----------
         event_id: int
             The event number
-        event: numpy.ndarray
-            The trace matrix of the event to be analyzed
+        event: numpy.ndarray | SparseEvent
+            The trace matrix (or SparseEvent) of the event to be analyzed
         seed: numpy.random.SeedSequence
             A seed to initialize the pipeline random number generator
+        poll_time: float | None
+            The time.perf_counter() value when the event was polled, used to measure
+            the poll-to-display latency. Default is None.
+        backlog: int
+            The number of events waiting to be analyzed after this one (i.e. the rest of
+            the poll and the events queued in the Conduit), used by the load shedding
+            policy. Default is 0.
         """
         # Clear the previous event data
-        rr.set_time_sequence("event_time", event_id)
-        rr.log("/event", rr.Clear(recursive=True))
-        result = PhaseResult(artifact=event, successful=True, event_id=event_id)
+        get_event_log().begin_event(event_id)
+        n_phases = len(self.phases)
+        if self.shedding is not None:
+            latency = None if poll_time is None else time.perf_counter() - poll_time
+            self.shedding.update(latency, backlog)
+            n_phases = self.shedding.select(self.phases)
+            self.shedding.log()
+        payload = PhaseResult(artifact=event, successful=True, event_id=event_id)
+        _, phase_metrics = run_phases(self.phases[:n_phases], payload, grammer, rng)
+
+        # Now we can log histograms. The publisher limits how often this happens
+        self.publisher.update(grammer)
+        self.metrics.record(phase_metrics, poll_time)
+
+    def idle(self, grammer: Histogrammer) -> None:
+        """Publish the histograms of the last events while no events are arriving
+
+        The publisher limits how often this happens.
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        """
+        self.publisher.idle(grammer)
+
+    def flush(self, grammer: Histogrammer) -> None:
+        """Send any buffered event data and log any histograms which have not been
+        published
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        """
+        get_event_log().flush()
+        self.publisher.flush(grammer)
+
+    def shutdown(self, grammer: Histogrammer) -> None:
+        """Flush the pipeline and release the resources held by the Phases
+
+        Parameters
+        ----------
+        grammer: Histogrammer
+            The histogram manager
+        """
+        self.flush(grammer)
         for phase in self.phases:
-            print("Running..")
-            result = phase.run(result, grammer, rng)
-
-        # Now we can log histograms. This way they only ever get logged once an event
-        for gram in grammer.histograms.values():
-            if isinstance(gram, Hist1D):
-                rr.log(f"/histograms/{gram.name}", rr.BarChart(gram.counts))
-            elif isinstance(gram, Hist2D):
-                rr.log(
-                    f"/histograms/{gram.name}", rr.Tensor(gram.counts.T), static=True
-                )
+            phase.shutdown()
@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+import numpy as np
+
+# The number of hardware columns (CoBo, AsAd, AGET, channel, pad) of a trace matrix
+HARDWARE_COLUMNS: int = 5
+# The number of GET time buckets in a trace
+NUMBER_OF_TIME_BUCKETS: int = 512
+
+
+@dataclass
+class SparseEvent:
+    """Dataclass representing an event in the sparse form polled from the Conduit
+
+    Only the runs of read out samples (segments) of each trace which were not zero
+    suppressed are stored; a sample in a segment can be zero. For zero suppressed events
+    this is much smaller than the full trace matrix.
+
+    Attributes
+    ----------
+    hardware: numpy.ndarray
+        The (N, 5) int16 hardware columns (CoBo, AsAd, AGET, channel, pad) of each trace
+    segments: numpy.ndarray
+        The (M, 3) int32 segments, as the trace (row of hardware), first time bucket
+        and length of each run of samples
+    samples: numpy.ndarray
+        The int16 samples of every segment, in order
+
+    Methods
+    -------
+    traces()
+        Get the (N, 512) matrix of the traces
+    to_dense()
+        Get the full (N, 517) trace matrix
+    """
+
+    hardware: np.ndarray
+    segments: np.ndarray
+    samples: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.hardware)
+
+    def traces(self) -> np.ndarray:
+        """Get the (N, 512) matrix of the traces
+
+        Samples outside of the segments are zero.
+
+        Returns
+        -------
+        numpy.ndarray
+            The int16 traces, one row per row of hardware
+        """
+        traces = np.zeros((len(self.hardware), NUMBER_OF_TIME_BUCKETS), dtype=np.int16)
+        if len(self.segments) == 0:
+            return traces
+        rows = self.segments[:, 0]
+        starts = self.segments[:, 1]
+        lengths = self.segments[:, 2]
+        # The offset of each sample within its segment
+        first_sample = np.cumsum(lengths) - lengths
+        offsets = np.arange(len(self.samples)) - np.repeat(first_sample, lengths)
+        traces[np.repeat(rows, lengths), np.repeat(starts, lengths) + offsets] = (
+            self.samples
+        )
+        return traces
+
+    def to_dense(self) -> np.ndarray:
+        """Get the full (N, 517) trace matrix
+
+        The matrix has the same layout as the events polled with Conduit.poll_events.
+
+        Returns
+        -------
+        numpy.ndarray
+            The int16 trace matrix
+        """
+        return np.concatenate((self.hardware, self.traces()), axis=1)
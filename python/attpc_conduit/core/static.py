@@ -1,6 +1,7 @@
 """Some constants used by the analysis pipeline"""
 
 from importlib.resources import files, as_file
+from pathlib import Path
 
 UNSIGNED_NOISE_LABEL = 4096
 
@@ -8,6 +9,8 @@ RADIUS = 2.0
 
 PAD_ELEC_PATH = as_file(files("spyral.data").joinpath("pad_electronics.csv"))
 
+PAD_TABLE_CACHE_PATH = Path.home() / ".cache" / "attpc_conduit"
+
 PARTICLE_ID_HISTOGRAM: str = "particle_id"
 KINEMATICS_HISTOGRAM: str = "kinematics"
 POLAR_HISTOGRAM: str = "polar_angle"
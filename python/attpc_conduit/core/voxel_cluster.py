@@ -0,0 +1,297 @@
+"""Fast, voxelized clustering of point clouds
+
+The full Spyral clustering (HDBSCAN, joining, and LocalOutlierFactor cleanup) grows
+faster than linearly with the number of points; the outlier test alone uses a number of
+neighbors proportional to the size of each cluster. Here the point cloud is first reduced
+to the mean points of the occupied cells of a grid (voxels), the Spyral algorithms are run
+on the reduced cloud, and the labels are propagated back to every point by voxel
+membership.
+"""
+
+from spyral.core.config import ClusterParameters
+from spyral.core.point_cloud import PointCloud
+from spyral.core.cluster import Cluster, LabeledCloud
+from spyral.core.clusterize import join_clusters, cleanup_clusters, NOISE_LABEL
+
+from collections import deque
+from dataclasses import dataclass
+import sklearn.cluster as skcluster
+import numpy as np
+
+# The scale applied to z so that it has the same dimensions as x,y (as in Spyral's
+# form_clusters)
+Z_SCALE: float = 584.0 / 1000.0
+# The number of recent runtimes of the full algorithm the runtime model is fit to
+BUDGET_HISTORY: int = 32
+# Every this many events sent to the fast path, an event is clustered with the full
+# algorithm anyway to re-measure its runtime
+BUDGET_RECHECK_INTERVAL: int = 50
+
+
+@dataclass
+class FastClusterParameters:
+    """Parameters controlling the fast (voxelized) clustering path
+
+    Attributes
+    ----------
+    voxel_size: float
+        The edge length of the voxels in mm. Like Spyral's form_clusters, z is rescaled
+        to the dimensions of x,y before the points are voxelized.
+    time_budget: float | None
+        The clustering time budget per event in seconds. The full algorithm is used
+        unless its predicted runtime for the event exceeds the budget, in which case the
+        fast path is used. If None, the fast path is always used.
+    """
+
+    voxel_size: float = 4.0
+    time_budget: float | None = None
+
+
+class ClusterTimeBudget:
+    """Predicts if the full clustering of an event fits in a time budget
+
+    The cost of the full algorithm is dominated by the outlier test, which grows about
+    quadratically with the number of points, on top of a fixed cost per event. The
+    runtime is predicted as an intercept plus a coefficient times the number of points
+    squared, fit (least squares, both terms non-negative) to the last BUDGET_HISTORY
+    measured runtimes of the full algorithm. Until runtimes for two different sizes have
+    been measured, the prediction is the mean measured runtime (0.0 before the first).
+
+    Only events clustered with the full algorithm are measured, so an over-estimate
+    would otherwise never be corrected. Once BUDGET_RECHECK_INTERVAL events have been
+    predicted not to fit, the next such event with no more points than their average is
+    clustered with the full algorithm anyway (see use_full), which can exceed the
+    budget.
+
+    Parameters
+    ----------
+    budget: float
+        The time budget per event in seconds
+
+    Attributes
+    ----------
+    budget: float
+        The time budget per event in seconds
+    intercept: float
+        The fixed runtime per event in seconds
+    cost: float
+        The runtime per point squared in seconds
+    samples: collections.deque[tuple[float, float]]
+        The number of points squared and runtime of the recent measurements
+    n_rejected: int
+        The number of events predicted not to fit since the last re-measurement
+    rejected_points: int
+        The total number of points of those events
+
+    Methods
+    -------
+    predict(n_points)
+        Predict the runtime of the full algorithm
+    fits(n_points)
+        Check if the full algorithm is predicted to fit in the budget
+    use_full(n_points)
+        Decide if an event should be clustered with the full algorithm
+    update(n_points, elapsed)
+        Update the runtime model with a measured runtime
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.intercept: float = 0.0
+        self.cost: float = 0.0
+        self.samples: deque[tuple[float, float]] = deque(maxlen=BUDGET_HISTORY)
+        self.n_rejected: int = 0
+        self.rejected_points: int = 0
+
+    def predict(self, n_points: int) -> float:
+        """Predict the runtime of the full algorithm
+
+        Parameters
+        ----------
+        n_points: int
+            The number of points in the cloud
+
+        Returns
+        -------
+        float
+            The predicted runtime in seconds, 0.0 if no runtime has been measured
+        """
+        return self.intercept + self.cost * float(n_points) ** 2.0
+
+    def fits(self, n_points: int) -> bool:
+        """Check if the full algorithm is predicted to fit in the budget
+
+        Parameters
+        ----------
+        n_points: int
+            The number of points in the cloud
+
+        Returns
+        -------
+        bool
+            True if the predicted runtime is within the budget
+        """
+        return self.predict(n_points) <= self.budget
+
+    def use_full(self, n_points: int) -> bool:
+        """Decide if an event should be clustered with the full algorithm
+
+        True if the full algorithm is predicted to fit in the budget, or if the event is
+        picked to re-measure the runtime of the full algorithm.
+
+        Parameters
+        ----------
+        n_points: int
+            The number of points in the cloud
+
+        Returns
+        -------
+        bool
+            True if the full algorithm should be used
+        """
+        if self.fits(n_points):
+            return True
+        self.n_rejected += 1
+        self.rejected_points += n_points
+        if (
+            self.n_rejected >= BUDGET_RECHECK_INTERVAL
+            and n_points * self.n_rejected <= self.rejected_points
+        ):
+            self.n_rejected = 0
+            self.rejected_points = 0
+            return True
+        return False
+
+    def update(self, n_points: int, elapsed: float) -> None:
+        """Update the runtime model with a measured runtime of the full algorithm
+
+        Parameters
+        ----------
+        n_points: int
+            The number of points in the cloud
+        elapsed: float
+            The runtime in seconds
+        """
+        if n_points == 0:
+            return
+        self.samples.append((float(n_points) ** 2.0, elapsed))
+        sizes = np.array([sample[0] for sample in self.samples])
+        times = np.array([sample[1] for sample in self.samples])
+        spread = sizes - sizes.mean()
+        variance = np.dot(spread, spread)
+        if variance == 0.0:
+            self.intercept = float(times.mean())
+            self.cost = 0.0
+            return
+        self.cost = max(float(np.dot(spread, times - times.mean()) / variance), 0.0)
+        self.intercept = float(times.mean() - self.cost * sizes.mean())
+        if self.intercept < 0.0:
+            # Refit through the origin
+            self.intercept = 0.0
+            self.cost = float(np.dot(sizes, times) / np.dot(sizes, sizes))
+
+
+def voxelize(pc: PointCloud, voxel_size: float) -> tuple[PointCloud, np.ndarray]:
+    """Reduce a point cloud to the mean points of its occupied voxels
+
+    Parameters
+    ----------
+    pc: PointCloud
+        The point cloud
+    voxel_size: float
+        The edge length of the voxels in mm (z rescaled by Z_SCALE)
+
+    Returns
+    -------
+    tuple[PointCloud, numpy.ndarray]
+        The point cloud of the mean (every column) of the points in each voxel, and the
+        voxel (row of the reduced cloud) of each point
+    """
+    scaled = pc.data[:, :3].copy()
+    scaled[:, 2] *= Z_SCALE
+    cells = np.floor(scaled / voxel_size).astype(np.int64)
+    _, voxels, counts = np.unique(
+        cells, axis=0, return_inverse=True, return_counts=True
+    )
+    voxels = voxels.ravel()
+    n_voxels = len(counts)
+    data = np.empty((n_voxels, pc.data.shape[1]))
+    for column in range(pc.data.shape[1]):
+        data[:, column] = (
+            np.bincount(voxels, weights=pc.data[:, column], minlength=n_voxels) / counts
+        )
+    return (PointCloud(pc.event_number, data), voxels)
+
+
+def cluster_voxelized(
+    pc: PointCloud, params: ClusterParameters, voxel_size: float
+) -> tuple[list[Cluster], np.ndarray]:
+    """Cluster a point cloud on a voxel grid
+
+    The cloud is reduced with voxelize, and the reduced cloud is clustered with HDBSCAN
+    (on a KD-tree), joined with join_clusters, and cleaned with cleanup_clusters, as in
+    the full algorithm. The minimum cluster size is scaled off of the number of voxels.
+    The voxel labels are then given to the points of each voxel, and the Clusters are
+    made from the labeled points of the full cloud.
+
+    Parameters
+    ----------
+    pc: PointCloud
+        The point cloud to be clustered
+    params: ClusterParameters
+        Configuration parameters controlling the clustering algorithms
+    voxel_size: float
+        The edge length of the voxels in mm (z rescaled by Z_SCALE)
+
+    Returns
+    -------
+    tuple[list[Cluster], numpy.ndarray]
+        A two element tuple, the first the list of cleaned clusters, the second the
+        label of each point in the point cloud. The same as cleanup_clusters.
+    """
+    if len(pc) < params.min_cloud_size:
+        return ([], np.empty(0))
+
+    reduced, voxels = voxelize(pc, voxel_size)
+    if len(reduced) <= params.min_points:
+        return ([], np.full(len(pc), NOISE_LABEL))
+
+    min_size = int(params.min_size_scale_factor * len(reduced))
+    if min_size < params.min_size_lower_cutoff:
+        min_size = params.min_size_lower_cutoff
+
+    cluster_data = reduced.data[:, :3].copy()
+    cluster_data[:, 2] *= Z_SCALE
+    clusterizer = skcluster.HDBSCAN(  # type: ignore
+        min_cluster_size=min_size,
+        min_samples=params.min_points,
+        cluster_selection_epsilon=params.cluster_selection_epsilon,
+        algorithm="kd_tree",
+        copy=True,
+    )
+    voxel_labels = clusterizer.fit(cluster_data).labels_
+
+    clusters: list[LabeledCloud] = []
+    for label in np.unique(voxel_labels):
+        mask = voxel_labels == label
+        clusters.append(
+            LabeledCloud(
+                label,
+                PointCloud(pc.event_number, reduced.data[mask]),
+                np.flatnonzero(mask),
+            )
+        )
+    joined, voxel_labels = join_clusters(clusters, params, voxel_labels)
+    cleaned, voxel_labels = cleanup_clusters(joined, params, voxel_labels)
+
+    labels = voxel_labels[voxels]
+    full_clusters: list[Cluster] = []
+    for cluster in cleaned:
+        points = pc.data[labels == cluster.label]
+        points = points[np.argsort(points[:, 2])]
+        data = np.zeros((len(points), 5))
+        data[:, :3] = points[:, :3]  # position
+        data[:, 3] = points[:, 4]  # peak integral
+        data[:, 4] = points[:, 7]  # scale (big or small)
+        full_clusters.append(Cluster(pc.event_number, cluster.label, data))
+    return (full_clusters, labels)
@@ -1,17 +1,26 @@
 from ..core.phase import PhaseLike, PhaseResult
-from ..core.color import get_label_color
+from ..core.event_log import log_event, log_event_labels
 from ..core.static import RADIUS, UNSIGNED_NOISE_LABEL
+from ..core.voxel_cluster import (
+    FastClusterParameters,
+    ClusterTimeBudget,
+    cluster_voxelized,
+)
 from spyral.core.config import ClusterParameters, DetectorParameters
+from spyral.core.cluster import Cluster
 from spyral.core.clusterize import (
     form_clusters,
     join_clusters,
     cleanup_clusters,
     NOISE_LABEL,
 )
+from spyral.core.point_cloud import PointCloud
 
 from numpy.random import Generator
 from spyral_utils.plot import Histogrammer
+import numpy as np
 import rerun as rr
+import time
 
 
 class ClusterPhase(PhaseLike):
@@ -23,12 +32,21 @@ class ClusterPhase(PhaseLike):
     algorithm. The clustering phase should come after the Pointcloud/PointcloudLegacy
     Phase in the Pipeline and before the EstimationPhase.
 
+    Large events can be clustered with a fast path, which clusters a voxelized copy of
+    the point cloud and gives the voxel labels back to the points (see
+    core.voxel_cluster). The fast path is either always used, or only used when the full
+    algorithm is predicted to exceed a per-event time budget. Whether the fast path was
+    used is logged to /metrics/cluster_fast_path.
+
     Parameters
     ----------
     cluster_params: ClusterParameters
         Parameters controlling the clustering algorithm
     det_params: DetectorParameters
         Parameters describing the detector
+    fast_params: FastClusterParameters | None
+        Parameters controlling the fast clustering path. Default is None, which always
+        uses the full algorithm.
 
     Attributes
     ----------
@@ -36,15 +54,66 @@ class ClusterPhase(PhaseLike):
         Parameters controlling the clustering algorithm
     det_params: DetectorParameters
         Parameters describing the detector
+    fast_params: FastClusterParameters | None
+        Parameters controlling the fast clustering path
+    budget: ClusterTimeBudget | None
+        The time budget of the full algorithm, if the fast path has one
 
+    Methods
+    -------
+    cluster(cloud)
+        Cluster a point cloud
     """
 
     def __init__(
-        self, cluster_params: ClusterParameters, det_params: DetectorParameters
+        self,
+        cluster_params: ClusterParameters,
+        det_params: DetectorParameters,
+        fast_params: FastClusterParameters | None = None,
     ) -> None:
         super().__init__("Cluster")
         self.cluster_params = cluster_params
         self.det_params = det_params
+        self.fast_params = fast_params
+        self.budget = (
+            ClusterTimeBudget(fast_params.time_budget)
+            if fast_params is not None and fast_params.time_budget is not None
+            else None
+        )
+
+    def cluster(self, cloud: PointCloud) -> tuple[list[Cluster], np.ndarray, bool]:
+        """Cluster a point cloud
+
+        Uses the fast path if it is always used, or if the time budget sends the event
+        to it (see ClusterTimeBudget.use_full). Otherwise the full algorithm is used and
+        its runtime updates the budget.
+
+        Parameters
+        ----------
+        cloud: PointCloud
+            The point cloud to be clustered
+
+        Returns
+        -------
+        tuple[list[Cluster], numpy.ndarray, bool]
+            The cleaned clusters, the label of each point, and True if the fast path was
+            used
+        """
+        if self.fast_params is not None and (
+            self.budget is None or not self.budget.use_full(len(cloud))
+        ):
+            cleaned, labels = cluster_voxelized(
+                cloud, self.cluster_params, self.fast_params.voxel_size
+            )
+            return (cleaned, labels, True)
+
+        start = time.perf_counter()
+        clusters, labels = form_clusters(cloud, self.cluster_params)
+        joined, labels = join_clusters(clusters, self.cluster_params, labels)
+        cleaned, labels = cleanup_clusters(joined, self.cluster_params, labels)
+        if self.budget is not None:
+            self.budget.update(len(cloud), time.perf_counter() - start)
+        return (cleaned, labels, False)
 
     def run(
         self,
@@ -57,34 +126,26 @@ class ClusterPhase(PhaseLike):
         if not payload.successful:
             return result
 
-        clusters, labels = form_clusters(payload.artifact, self.cluster_params)
-        joined, labels = join_clusters(clusters, self.cluster_params, labels)
-        cleaned, labels = cleanup_clusters(joined, self.cluster_params, labels)
+        cleaned, labels, fast = self.cluster(payload.artifact)
+        if self.fast_params is not None:
+            log_event("/metrics/cluster_fast_path", rr.Scalar, scalar=float(fast))
         if len(cleaned) == 0:
             return result
         result.artifact = cleaned
         result.successful = True
 
-        unique_labels = [c.label for c in result.artifact]
-        unique_labels.append(UNSIGNED_NOISE_LABEL)
+        unique_labels = np.array(
+            [c.label for c in result.artifact] + [UNSIGNED_NOISE_LABEL]
+        )
 
         labels[labels == NOISE_LABEL] = UNSIGNED_NOISE_LABEL
 
-        rr.log(
-            "/event",
-            rr.AnnotationContext(
-                [
-                    rr.AnnotationInfo(label, None, get_label_color(label))
-                    for label in unique_labels
-                ]
-            ),
-        )
-        rr.log(
+        log_event_labels("/event", unique_labels)
+        log_event(
             "/event/clusters",
-            rr.Points3D(
-                payload.artifact.data[:, :3],
-                radii=RADIUS,
-                class_ids=labels,
-            ),
+            rr.Points3D,
+            positions=payload.artifact.data[:, :3],
+            radii=RADIUS,
+            class_ids=labels,
         )
         return result
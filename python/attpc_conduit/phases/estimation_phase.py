@@ -1,13 +1,29 @@
 from ..core.phase import PhaseLike, PhaseResult
+from ..core.event_log import log_event
 from ..core.static import PARTICLE_ID_HISTOGRAM, KINEMATICS_HISTOGRAM, POLAR_HISTOGRAM
 from spyral.core.config import EstimateParameters, DetectorParameters
-from spyral.core.estimator import estimate_physics
+from spyral.core.cluster import Cluster
+from spyral.core.estimator import estimate_physics, EstimateResult
 
+from concurrent.futures import ProcessPoolExecutor
 from numpy.random import Generator
+import multiprocessing as mp
 import numpy as np
 from spyral_utils.plot import Histogrammer
 import rerun as rr
 
+# The packed form of the estimates of an event, used for logging and histogramming
+ESTIMATE_DTYPE = np.dtype(
+    [
+        ("cluster_label", np.int64),
+        ("half_size", np.float64, (3,)),  # circle radius (rho, rho, 0)
+        ("center", np.float64, (3,)),  # circle center (center x, center y, vertex z)
+        ("brho", np.float64),
+        ("polar", np.float64),
+        ("sqrt_dEdx", np.float64),
+    ]
+)
+
 
 class EstimationPhase(PhaseLike):
     """The default Conduit estimation phase, inheriting from PhaseLike
@@ -17,12 +33,22 @@ class EstimationPhase(PhaseLike):
     for use in the more complex solving phase to follow. EstimationPhase should come
     after ClusterPhase and before InterpSolverPhase in the Pipeline.
 
+    Events with several trajectories can have their clusters estimated concurrently on a
+    pool of worker processes (the estimation is mostly pure Python, so threads would not
+    help). The pool is created the first time it is needed, and is not pickled with the
+    phase, so each process running the phase (see ParallelConduitPipeline) makes its
+    own. The estimates are packed into an ESTIMATE_DTYPE array for logging and
+    histogramming.
+
     Parameters
     ----------
     estimate_params: EstimateParameters
         Parameters controlling the estimation algorithm
     det_params: DetectorParameters
         Parameters describing the detector
+    n_workers: int
+        The number of worker processes used to estimate clusters. Default is 0, which
+        estimates the clusters in the calling process.
 
     Attributes
     ----------
@@ -30,15 +56,78 @@ class EstimationPhase(PhaseLike):
         Parameters controlling the estimation algorithm
     det_params: DetectorParameters
         Parameters describing the detector
-
+    n_workers: int
+        The number of worker processes used to estimate clusters
+
+    Methods
+    -------
+    estimate(clusters)
+        Estimate the physics of a set of clusters
+    shutdown()
+        Stop the worker processes
     """
 
     def __init__(
-        self, estimate_params: EstimateParameters, det_params: DetectorParameters
+        self,
+        estimate_params: EstimateParameters,
+        det_params: DetectorParameters,
+        n_workers: int = 0,
     ):
         super().__init__("Estimation")
         self.estimate_params = estimate_params
         self.det_params = det_params
+        self.n_workers = n_workers
+        self._pool: ProcessPoolExecutor | None = None
+
+    def __getstate__(self) -> dict:
+        # The pool can't be pickled; it is recreated when needed
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+    def estimate(self, clusters: list[Cluster]) -> list[EstimateResult]:
+        """Estimate the physics of a set of clusters
+
+        Clusters too small to be estimated are skipped before they are handed to the
+        workers. If there are at least two clusters left and more than one worker, the
+        clusters are estimated on the worker pool.
+
+        Parameters
+        ----------
+        clusters: list[Cluster]
+            The clusters of an event
+
+        Returns
+        -------
+        list[EstimateResult]
+            The successful estimates, in the order of the clusters
+        """
+        indices = [
+            idx
+            for idx, cluster in enumerate(clusters)
+            if len(cluster.data) >= self.estimate_params.min_total_trajectory_points
+        ]
+        args = (
+            indices,
+            [clusters[idx] for idx in indices],
+            [self.estimate_params] * len(indices),
+            [self.det_params] * len(indices),
+        )
+        if self.n_workers > 1 and len(indices) > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.n_workers, mp_context=mp.get_context("spawn")
+                )
+            results = list(self._pool.map(_estimate_cluster, *args))
+        else:
+            results = list(map(_estimate_cluster, *args))
+        return [result for result in results if result is not None]
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, if any were started"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
     def run(
         self,
@@ -58,70 +147,90 @@ class EstimationPhase(PhaseLike):
             result.successful = False
             return result
 
-        for cidx in range(len(payload.artifact)):
-            local_cluster = payload.artifact[cidx]
-            # Cluster is loaded do some analysis
-            est = estimate_physics(
-                cidx,
-                local_cluster,
-                -1,
-                -1,
-                -1,
-                -1,
-                -1,
-                -1,
-                self.estimate_params,
-                self.det_params,
-            )
-            if est is not None:
-                result.artifact.append(est)
+        result.artifact = self.estimate(payload.artifact)
+        packed = pack_estimates(result.artifact, self.det_params)
 
         # Log circles if they exist
-        n_circles = len(result.artifact)
-        circle_block_data = np.zeros((n_circles, 6))
-        used_labels = []
-        for ridx, estimate in enumerate(result.artifact):
-            rho = (
-                estimate.brho
-                / self.det_params.magnetic_field
-                * 1000.0
-                * np.sin(estimate.polar)
-            )
-
-            # Log the circles
-            circle_block_data[ridx, 3:] = np.array(
-                [
-                    estimate.center_x,
-                    estimate.center_y,
-                    estimate.vertex_z,
-                ]
-            )
-            circle_block_data[ridx, :3] = np.array([rho, rho, 0.0])
-            used_labels.append(estimate.cluster_label)
-        rr.log(
+        log_event(
             "/event/circles",
-            rr.Ellipsoids3D(
-                half_sizes=circle_block_data[:, :3],
-                centers=circle_block_data[:, 3:],
-                colors=None,
-                class_ids=used_labels,
-            ),
+            rr.Ellipsoids3D,
+            half_sizes=packed["half_size"],
+            centers=packed["center"],
+            class_ids=packed["cluster_label"],
         )
 
         # Fill the histograms, but DO NOT LOG HERE
-        brho_array = np.array([est.brho for est in result.artifact])
-        polar_array = np.array([est.polar for est in result.artifact])
-        dedx_array = np.array([est.sqrt_dEdx for est in result.artifact])
         grammer.fill_hist2d(
             KINEMATICS_HISTOGRAM,
-            polar_array,
-            brho_array,
+            packed["polar"],
+            packed["brho"],
         )
         grammer.fill_hist2d(
             PARTICLE_ID_HISTOGRAM,
-            dedx_array,
-            brho_array,
+            packed["sqrt_dEdx"],
+            packed["brho"],
         )
-        grammer.fill_hist1d(POLAR_HISTOGRAM, polar_array)
+        grammer.fill_hist1d(POLAR_HISTOGRAM, packed["polar"])
 
         return result
+
+
+def _estimate_cluster(
+    cluster_index: int,
+    cluster: Cluster,
+    estimate_params: EstimateParameters,
+    det_params: DetectorParameters,
+) -> EstimateResult | None:
+    """Estimate a single cluster. Module level so that it can run in a worker process."""
+    return estimate_physics(
+        cluster_index,
+        cluster,
+        -1,
+        -1,
+        -1,
+        -1,
+        -1,
+        -1,
+        estimate_params,
+        det_params,
+    )
+
+
+def pack_estimates(
+    estimates: list[EstimateResult], det_params: DetectorParameters
+) -> np.ndarray:
+    """Pack the estimates of an event into a structured array
+
+    The fields are converted from the estimates in a single pass, and the circle radii
+    are computed for every estimate at once.
+
+    Parameters
+    ----------
+    estimates: list[EstimateResult]
+        The estimates of the event
+    det_params: DetectorParameters
+        Parameters describing the detector
+
+    Returns
+    -------
+    numpy.ndarray
+        The ESTIMATE_DTYPE array of the estimates
+    """
+    packed = np.array(
+        [
+            (
+                estimate.cluster_label,
+                (0.0, 0.0, 0.0),
+                (estimate.center_x, estimate.center_y, estimate.vertex_z),
+                estimate.brho,
+                estimate.polar,
+                estimate.sqrt_dEdx,
+            )
+            for estimate in estimates
+        ],
+        dtype=ESTIMATE_DTYPE,
+    )
+    rho = packed["brho"] / det_params.magnetic_field * 1000.0 * np.sin(packed["polar"])
+    packed["half_size"][:, 0] = rho
+    packed["half_size"][:, 1] = rho
+    return packed
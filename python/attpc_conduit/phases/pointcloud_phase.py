@@ -1,23 +1,36 @@
 from ..core.phase import PhaseLike, PhaseResult
 from ..core.color import generate_point_colors
+from ..core.event_log import log_event
+from ..core.sparse import SparseEvent
+from ..core.signal import remove_baselines, find_peaks
+from ..core.pad_table import (
+    load_pad_table,
+    PAD_X,
+    PAD_Y,
+    PAD_TIME_OFFSET,
+    PAD_SCALE,
+    PAD_VALID,
+)
 from ..core.static import RADIUS
 from spyral.core.config import (
     GetParameters,
     DetectorParameters,
     PadParameters,
 )
-from spyral.core.pad_map import PadMap
-from spyral.trace.get_event import GetEvent
 from spyral.core.point_cloud import (
-    point_cloud_from_get,
+    PointCloud,
     sort_point_cloud_in_z,
     calibrate_point_cloud_z,
 )
 
+from pathlib import Path
 import numpy as np
 from spyral_utils.plot import Histogrammer
 import rerun as rr
 
+# Traces with more peaks than this are considered noise and skipped (as in Spyral)
+MAX_PEAKS_PER_TRACE: int = 5
+
 
 class PointcloudPhase(PhaseLike):
     """The Conduit point cloud phase, inheriting from PhaseLike
@@ -27,6 +40,18 @@ class PointcloudPhase(PhaseLike):
     and scipy.signal.find_peaks to extract signals from the traces. PointcloudPhase
     is expected to be the first phase in the Pipeline.
 
+    The signal analysis is the same as Spyral's, but is batched over the traces of the
+    event (see core.signal): the baselines of every trace are removed with a single 2-D
+    FFT, and only traces with a sample over the peak threshold are searched for peaks.
+
+    The pad data (position, time offset, scale) is looked up in a dense pad table built
+    once from the pad map, indexed by the pad column of the event. The table can be
+    cached on disk, so it is only rebuilt when the pad map files change.
+
+    The event can be a trace matrix or a SparseEvent. The traces of a SparseEvent were
+    baseline subtracted and zero suppressed by the Conduit, so the Fourier transform
+    baseline removal is skipped and only the peaks are found.
+
     Parameters
     ----------
     get_params: GetParameters
@@ -35,6 +60,9 @@ class PointcloudPhase(PhaseLike):
         Parameters describing the detector
     pad_params: PadParameters
         Parameters describing the pad plane mapping
+    pad_table_cache: Path | None
+        The directory to cache the pad table in. Default is None, which builds the
+        table from the pad map every time.
 
     Attributes
     ----------
@@ -42,8 +70,8 @@ class PointcloudPhase(PhaseLike):
         Parameters controlling the GET-DAQ signal analysis
     det_params: DetectorParameters
         Parameters describing the detector
-    pad_map: PadMap
-        Map which converts trace ID to pad ID
+    pad_table: numpy.ndarray
+        The pad table, indexed by pad number (see core.pad_table)
 
     """
 
@@ -52,13 +80,14 @@ class PointcloudPhase(PhaseLike):
         get_params: GetParameters,
         detector_params: DetectorParameters,
         pad_params: PadParameters,
+        pad_table_cache: Path | None = None,
     ):
         super().__init__(
             "Pointcloud",
         )
         self.get_params = get_params
         self.det_params = detector_params
-        self.pad_map = PadMap(pad_params)
+        self.pad_table = load_pad_table(pad_params, pad_table_cache)
 
     def run(
         self,
@@ -69,8 +98,18 @@ class PointcloudPhase(PhaseLike):
         # Process the data
 
         result = PhaseResult(None, False, payload.event_id)
-        event = GetEvent(payload.artifact, payload.event_id, self.get_params, rng)
-        cloud = point_cloud_from_get(event, self.pad_map)
+        if isinstance(payload.artifact, SparseEvent):
+            hardware = payload.artifact.hardware
+            traces = payload.artifact.traces()
+        else:
+            hardware = payload.artifact[:, :5]
+            traces = remove_baselines(
+                payload.artifact[:, 5:], self.get_params.baseline_window_scale
+            )
+        peaks = find_peaks(traces, self.get_params, rng)
+        cloud = point_cloud_from_peaks(
+            payload.event_id, hardware, peaks, self.pad_table
+        )
         calibrate_point_cloud_z(cloud, self.det_params)
         sort_point_cloud_in_z(cloud)
         if len(cloud) == 0:
@@ -78,8 +117,63 @@ class PointcloudPhase(PhaseLike):
         colors = generate_point_colors(cloud.data[:, 3])
         result.artifact = cloud
         result.successful = True
-        rr.log(
+        log_event(
             "/event/cloud",
-            rr.Points3D(cloud.data[:, :3], radii=RADIUS, colors=colors),
+            rr.Points3D,
+            positions=cloud.data[:, :3],
+            radii=RADIUS,
+            colors=colors,
         )
         return result
+
+
+def point_cloud_from_peaks(
+    event_id: int, hardware: np.ndarray, peaks: np.ndarray, pad_table: np.ndarray
+) -> PointCloud:
+    """Create a point cloud from the peaks found in the traces of an event
+
+    Follows Spyral's point_cloud_from_get: traces with more than MAX_PEAKS_PER_TRACE
+    peaks, pads which are not in the pad map, and beam pads are skipped, and the pad
+    positions, time offsets, and scales are taken from the pad map. The pad data of every
+    peak is gathered from the pad table at once, using the pad column of the hardware.
+
+    Parameters
+    ----------
+    event_id: int
+        The event number
+    hardware: numpy.ndarray
+        The (N, 5) hardware columns (CoBo, AsAd, AGET, channel, pad) of the traces
+    peaks: numpy.ndarray
+        The (M, 4) peaks found with core.signal.find_peaks
+    pad_table: numpy.ndarray
+        The pad table (see core.pad_table)
+
+    Returns
+    -------
+    PointCloud
+        The point cloud, each row is [x,y,z,amplitude,integral,pad id,time,scale]
+    """
+    traces = peaks[:, 0].astype(np.int64)
+    # Peaks are ordered by trace, so the peak counts line up with the peaks
+    _, counts = np.unique(traces, return_counts=True)
+    pad_ids = hardware[traces, 4].astype(np.int64)
+    in_table = (pad_ids >= 0) & (pad_ids < len(pad_table))
+    pads = pad_table[np.where(in_table, pad_ids, 0)]
+    keep = (
+        in_table
+        & (pads[:, PAD_VALID] != 0.0)
+        & (np.repeat(counts, counts) <= MAX_PEAKS_PER_TRACE)
+    )
+    peaks = peaks[keep]
+    pads = pads[keep]
+    time = peaks[:, 1] + pads[:, PAD_TIME_OFFSET]
+    cloud_matrix = np.empty((len(peaks), 8))
+    cloud_matrix[:, 0] = pads[:, PAD_X]
+    cloud_matrix[:, 1] = pads[:, PAD_Y]
+    cloud_matrix[:, 2] = time  # until calibrated with calibrate_point_cloud_z
+    cloud_matrix[:, 3] = peaks[:, 2]
+    cloud_matrix[:, 4] = peaks[:, 3]
+    cloud_matrix[:, 5] = pad_ids[keep]
+    cloud_matrix[:, 6] = time
+    cloud_matrix[:, 7] = pads[:, PAD_SCALE]
+    return PointCloud(event_id, cloud_matrix)
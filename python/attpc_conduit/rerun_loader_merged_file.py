@@ -7,6 +7,11 @@ from . import (
     ClusterPhase,
     EstimationPhase,
     ConduitPipeline,
+    ParallelConduitPipeline,
+    ColumnarEventLog,
+    set_event_log,
+    FileEventSource,
+    PAD_TABLE_CACHE_PATH,
 )
 
 from spyral import (
@@ -80,7 +85,12 @@ estimate_params = EstimateParameters(
 )
 pipeline = ConduitPipeline(
     [
-        PointcloudPhase(get_params, detector_params, pad_params),
+        PointcloudPhase(
+            get_params,
+            detector_params,
+            pad_params,
+            pad_table_cache=PAD_TABLE_CACHE_PATH,
+        ),
         ClusterPhase(cluster_params, detector_params),
         EstimationPhase(estimate_params, detector_params),
     ]
@@ -125,6 +135,32 @@ pipeline = ConduitPipeline(
     type=str,
     help="optional - sequence to log at (e.g. `--sequence sim_frame=42`)",
 )
+@click.option(
+    "--batch-size",
+    type=int,
+    default=256,
+    show_default=True,
+    help="optional - number of events sent to Rerun at once as columns (0 logs each event)",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="optional - write to this .rrd file rather than stdout",
+)
+@click.option(
+    "--prefetch",
+    type=int,
+    default=64,
+    show_default=True,
+    help="optional - number of events read ahead of the analysis",
+)
+@click.option(
+    "--n-workers",
+    type=int,
+    default=0,
+    show_default=True,
+    help="optional - number of analysis worker processes (0 runs in the main process)",
+)
 def main(
     filepath: str,
     application_id: str,
@@ -134,6 +170,10 @@ def main(
     static: bool,
     time: str,
     sequence: str,
+    batch_size: int,
+    output: str | None,
+    prefetch: int,
+    n_workers: int,
 ) -> None:
     """The entry point for the rerun-loader-merged-file script"""
     rng = np.random.default_rng()
@@ -155,13 +195,26 @@ def main(
 
     rr.init(app_id, recording_id=recording_id)
     rr.send_blueprint(generate_default_blueprint(), make_active=True, make_default=True)
-    rr.stdout()  # Required for custom file loaders
-
+    if output is not None:
+        rr.save(output)
+    else:
+        rr.stdout()  # Required for custom file loaders
     init_detector_bounds()
 
-    for event_id in reader.event_range():
-        event_data = reader.read_raw_get_event(event_id)
-        if event_data is None:
-            continue
+    if n_workers > 0:
+        # Workers read and analyze chunks of the event range, and send each chunk as
+        # columns. Results are streamed back in event order
+        parallel = ParallelConduitPipeline(pipeline.phases, n_workers)
+        parallel.replay(path, reader.event_range(), grammer, rng, max(batch_size, 1))
+        parallel.shutdown(grammer)
+        return
+
+    if batch_size > 0:
+        set_event_log(ColumnarEventLog(batch_size))
+
+    # Events are read ahead on a background thread while the pipeline runs
+    with FileEventSource(path, reader.event_range(), prefetch) as source:
+        for event_id, event_data in source:
+            pipeline.run(event_id, event_data, grammer, rng)
 
-        pipeline.run(event_id, event_data[:], grammer, rng)
+    pipeline.shutdown(grammer)
@@ -5,10 +5,18 @@ from . import (
     init_detector_bounds,
     generate_default_blueprint,
     PAD_ELEC_PATH,
+    PAD_TABLE_CACHE_PATH,
     PointcloudPhase,
     EstimationPhase,
     ClusterPhase,
     ConduitPipeline,
+    ParallelConduitPipeline,
+    LoadSheddingPolicy,
+    ConduitEventSource,
+    EventFilter,
+    FastClusterParameters,
+    beam_region_pads,
+    log_conduit_stats,
 )
 
 from spyral import (
@@ -21,6 +29,7 @@ from spyral import (
     DEFAULT_MAP,
 )
 
+from spyral.core.pad_map import PadMap
 from pathlib import Path
 from spyral_utils.plot import Histogrammer
 import rerun as rr
@@ -66,16 +75,38 @@ cluster_params = ClusterParameters(
     continuity_join=None,
     outlier_scale_factor=0.5,
 )
+# Cluster events predicted to take longer than the time budget on a voxel grid instead
+fast_cluster_params = FastClusterParameters(voxel_size=4.0, time_budget=0.25)
 estimate_params = EstimateParameters(
     min_total_trajectory_points=30, smoothing_factor=100.0
 )
+# The number of processes used to estimate the clusters of multi-track events. Not used
+# when running the pipeline on analysis workers (--n-workers), as each would start its
+# own.
+estimate_workers = 4
 pipeline = ConduitPipeline(
     [
-        PointcloudPhase(get_params, detector_params, pad_params),
-        ClusterPhase(cluster_params, detector_params),
-        EstimationPhase(estimate_params, detector_params),
-    ]
+        PointcloudPhase(
+            get_params,
+            detector_params,
+            pad_params,
+            pad_table_cache=PAD_TABLE_CACHE_PATH,
+        ),
+        ClusterPhase(cluster_params, detector_params, fast_cluster_params),
+        EstimationPhase(estimate_params, detector_params, estimate_workers),
+    ],
+    # When behind, only cluster and estimate every fourth event. The backlog is the
+    # events left in the current poll plus those queued in the Conduit (which holds 40)
+    shedding=LoadSheddingPolicy({"Cluster": 0.25}, max_latency=1.0, max_backlog=20),
 )
+# Maximum number of events taken from the conduit per poll
+poll_batch_size = 10
+# Maximum time to wait on the conduit for events in seconds
+poll_timeout = 0.1
+# Number of built events held back to put events in order when using several builders
+reorder_window = 8
+# Time between logging the Conduit backend statistics in seconds
+stats_interval = 1.0
 
 
 @click.command()
@@ -100,6 +131,13 @@ pipeline = ConduitPipeline(
     help="The size of the event cache in the conduit in GRAW frames",
     show_default=True,
 )
+@click.option(
+    "--event-timeout",
+    default=0.5,
+    type=float,
+    help="The time an incomplete event can wait in the conduit before it is analyzed (s)",
+    show_default=True,
+)
 @click.option(
     "--n-threads",
     default=11,
@@ -107,8 +145,94 @@ pipeline = ConduitPipeline(
     help="The number of threads given to the Conduit runtime",
     show_default=True,
 )
+@click.option(
+    "--n-builders",
+    default=1,
+    type=int,
+    help="The number of event building tasks in the Conduit runtime",
+    show_default=True,
+)
+@click.option(
+    "--n-workers",
+    default=0,
+    type=int,
+    help="The number of analysis worker processes (0 runs the pipeline in the main process)",
+    show_default=True,
+)
+@click.option(
+    "--record",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Record every received GRAW frame to this file, for use with --replay",
+)
+@click.option(
+    "--replay",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Analyze a recording made with --record instead of the live data",
+)
+@click.option(
+    "--replay-speed",
+    default=1.0,
+    type=float,
+    help="The multiple of the recorded rate to replay at (0 replays as fast as possible)",
+    show_default=True,
+)
+@click.option(
+    "--subtract-fpn/--no-subtract-fpn",
+    default=False,
+    help="Subtract the fixed pattern noise of each AGET in the Conduit",
+    show_default=True,
+)
+@click.option(
+    "--zero-threshold",
+    default=None,
+    type=click.IntRange(0, 4095),
+    help="Baseline subtract and zero suppress the traces at this threshold in the Conduit, and poll events in sparse form",
+)
+@click.option(
+    "--min-multiplicity",
+    default=0,
+    type=click.IntRange(0),
+    help="Drop events with fewer traces than this in the Conduit",
+    show_default=True,
+)
+@click.option(
+    "--min-charge",
+    default=None,
+    type=int,
+    help="Drop events whose summed samples are less than this in the Conduit (use with --zero-threshold)",
+)
+@click.option(
+    "--min-outside-beam",
+    default=0,
+    type=click.IntRange(0),
+    help="Drop events with fewer pads than this hit outside of the beam region in the Conduit",
+    show_default=True,
+)
+@click.option(
+    "--prescale",
+    default=None,
+    type=click.IntRange(1),
+    help="Keep one in every N events dropped by the Conduit event filter",
+)
 def run_conduit(
-    viewer_ip: str, viewer_port: int, event_cache_size: int, n_threads: int
+    viewer_ip: str,
+    viewer_port: int,
+    event_cache_size: int,
+    event_timeout: float,
+    n_threads: int,
+    n_builders: int,
+    n_workers: int,
+    record: Path | None,
+    replay: Path | None,
+    replay_speed: float,
+    subtract_fpn: bool,
+    zero_threshold: int | None,
+    min_multiplicity: int,
+    min_charge: int | None,
+    min_outside_beam: int,
+    prescale: int | None,
 ):
     init_conduit_logger()  # initialize Rust logging
 
@@ -133,8 +257,43 @@ def run_conduit(
     with PAD_ELEC_PATH as path:
         conduit = Conduit(path, n_threads)
 
+    event_filter = None
+    if min_multiplicity > 0 or min_charge is not None or min_outside_beam > 0:
+        event_filter = EventFilter(
+            min_multiplicity=min_multiplicity,
+            min_charge=min_charge,
+            beam_pads=beam_region_pads(
+                PadMap(pad_params), detector_params.beam_region_radius
+            ),
+            min_outside_beam=min_outside_beam,
+            prescale=prescale,
+        )
+
     try:
-        conduit.connect(event_cache_size)
+        if replay is not None:
+            logging.info(f"Replaying {replay}...")
+            conduit.replay(
+                replay,
+                event_cache_size,
+                speed=replay_speed if replay_speed > 0.0 else None,
+                event_timeout=event_timeout,
+                n_builders=n_builders,
+                reorder_window=reorder_window if n_builders > 1 else 0,
+                subtract_fpn=subtract_fpn,
+                zero_threshold=zero_threshold,
+                event_filter=event_filter,
+            )
+        else:
+            conduit.connect(
+                event_cache_size,
+                event_timeout=event_timeout,
+                n_builders=n_builders,
+                reorder_window=reorder_window if n_builders > 1 else 0,
+                record_path=record,
+                subtract_fpn=subtract_fpn,
+                zero_threshold=zero_threshold,
+                event_filter=event_filter,
+            )
     except Exception as e:
         logging.error(f"Conduit failed to connect: {e}")
         return
@@ -150,16 +309,47 @@ def run_conduit(
     logging.info("Histograms are ready, setting up detector geometry...")
     # Setup detector bounds in rerun
     init_detector_bounds()
+
+    runner: ConduitPipeline | ParallelConduitPipeline = pipeline
+    if n_workers > 0:
+        logging.info(f"Running the pipeline on {n_workers} worker processes...")
+        # Each worker estimates its clusters in-process
+        phases = [
+            EstimationPhase(estimate_params, detector_params)
+            if isinstance(phase, EstimationPhase)
+            else phase
+            for phase in pipeline.phases
+        ]
+        runner = ParallelConduitPipeline(phases, n_workers, shedding=pipeline.shedding)
+    # Zero suppressed events are polled in sparse form
+    source = ConduitEventSource(
+        conduit, poll_batch_size, poll_timeout, sparse=zero_threshold is not None
+    )
     logging.info("Detector ready, starting event loop...")
 
     # Main event loop, which can call the pipeline run event loop
+    last_stats = time.perf_counter()
     while True:
         try:
-            event = conduit.poll_events()  # Poll the conduit
-            if event is not None:
-                pipeline.run(event[0], event[1], grammer, rng)
-            # Allow CPU  to do other things, sleep for a milli (should be good for <100 Hz)
-            time.sleep(0.01)
+            # Poll the conduit. This waits (without holding the GIL) until events are
+            # ready or the timeout expires, so there is no need to sleep
+            events = source.poll()
+            poll_time = time.perf_counter()
+            queued = 0
+            if runner.shedding is not None:
+                queued = conduit.stats().get("event_queue_depth", 0)
+            for idx, (event_id, event) in enumerate(events):
+                backlog = queued + len(events) - idx - 1
+                runner.run(event_id, event, grammer, rng, poll_time, backlog)
+            if len(events) == 0:
+                if source.is_finished():
+                    logging.info("The Conduit data streams have ended, shutting down.")
+                    break
+                # Publish the last events, which no later event will
+                runner.idle(grammer)
+            if poll_time - last_stats >= stats_interval:
+                log_conduit_stats(conduit.stats())
+                last_stats = poll_time
         except KeyboardInterrupt:
             logging.info("Conduit recieved KeyboardInterrupt, shutting down.")
             logging.info("Note: may take up to 2 minutes to shutdown.")
@@ -171,6 +361,8 @@ def run_conduit(
             print(f"Conduit exception: {e}")
             break
 
+    runner.shutdown(grammer)
+
     if conduit.is_connected():
         conduit.disconnect()
 
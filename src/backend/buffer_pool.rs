@@ -0,0 +1,40 @@
+use std::sync::{Arc, Mutex};
+
+/// A BufferPool recycles the buffers backing event data matrices. Building an event
+/// writes the traces into a buffer taken from the pool, and once the matrix is released
+/// (i.e. the Python array is garbage collected) the buffer is returned to the pool. Buffers
+/// keep their capacity, so in steady state building an event does not allocate. The pool
+/// can be cloned and shared between threads.
+#[derive(Debug, Clone)]
+pub struct BufferPool {
+    buffers: Arc<Mutex<Vec<Vec<i16>>>>,
+    max_buffers: usize,
+}
+
+impl BufferPool {
+    /// Create a new pool which holds at most max_buffers idle buffers
+    pub fn new(max_buffers: usize) -> Self {
+        BufferPool {
+            buffers: Arc::new(Mutex::new(Vec::with_capacity(max_buffers))),
+            max_buffers,
+        }
+    }
+
+    /// Take an empty buffer from the pool. If the pool is empty a new buffer is created
+    pub fn take(&self) -> Vec<i16> {
+        match self.buffers.lock() {
+            Ok(mut buffers) => buffers.pop().unwrap_or_default(),
+            Err(_) => Vec::new(),
+        }
+    }
+
+    /// Return a buffer to the pool. If the pool is full the buffer is dropped
+    pub fn recycle(&self, mut buffer: Vec<i16>) {
+        buffer.clear();
+        if let Ok(mut buffers) = self.buffers.lock() {
+            if buffers.len() < self.max_buffers {
+                buffers.push(buffer);
+            }
+        }
+    }
+}
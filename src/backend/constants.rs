@@ -13,12 +13,20 @@ pub const SIZE_OF_BITSET: usize = 72;
 // Electronics constants
 pub const NUMBER_OF_COBOS: u8 = 11; //total
 pub const COBO_WITH_TIMESTAMP: u8 = 10; // cobo with TS in sync with FRIBDAQ
-#[allow(dead_code)]
 pub const NUMBER_OF_ASADS: u8 = 4; //per cobo
 pub const NUMBER_OF_AGETS: u8 = 4; // per asad
 pub const NUMBER_OF_CHANNELS: u8 = 68;
 pub const NUMBER_OF_TIME_BUCKETS: u32 = 512;
 pub const NUMBER_OF_MATRIX_COLUMNS: usize = NUMBER_OF_TIME_BUCKETS as usize + 5; // cobo, asad, aget, channel, pad, buckets
+pub const NUMBER_OF_HARDWARE_COLUMNS: usize = 5; // cobo, asad, aget, channel, pad
+pub const FPN_CHANNELS: [u8; 4] = [11, 22, 45, 56]; // fixed pattern noise channels of each AGET
+
+// Signal processing constants
+pub const ZERO_SUPPRESSION_MARGIN: usize = 3; // time buckets kept on each side of a sample over threshold
+pub const BASELINE_SIGMA_CUT: f64 = 1.5; // samples further than this many sigma above the mean are signal
+
+// Memory constants
+pub const MAX_POOLED_BUFFERS: usize = 128; // idle event matrix buffers kept for reuse
 
 // GETDAQ constants
 pub const MM_IP_SUBNET: &str = "192.168.41"; // Subnet for all the MacMini's in AT-TPC
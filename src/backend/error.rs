@@ -39,6 +39,21 @@ pub enum GrawFrameError {
     BadDatum(GrawDataError),
 }
 
+impl GrawFrameError {
+    /// The kind of the error as an index into stats::FRAME_ERROR_KINDS
+    pub fn kind(&self) -> usize {
+        match self {
+            GrawFrameError::IOError(_) => 0,
+            GrawFrameError::IncorrectMetaType(_) => 1,
+            GrawFrameError::IncorrectFrameSize(_, _) => 2,
+            GrawFrameError::IncorrectFrameType(_) => 3,
+            GrawFrameError::IncorrectHeaderSize(_) => 4,
+            GrawFrameError::IncorrectItemSize(_) => 5,
+            GrawFrameError::BadDatum(_) => 6,
+        }
+    }
+}
+
 impl From<std::io::Error> for GrawFrameError {
     fn from(value: std::io::Error) -> Self {
         Self::IOError(value)
@@ -147,6 +162,7 @@ pub enum PadMapError {
     IOError(std::io::Error),
     ParsingError(std::num::ParseIntError),
     BadFileFormat,
+    InvalidEntry(u8, u8, u8, u8, u64),
 }
 
 impl From<std::io::Error> for PadMapError {
@@ -166,7 +182,8 @@ impl Display for PadMapError {
         match self {
             PadMapError::IOError(e) => write!(f, "PadMap recieved an io error: {e}"),
             PadMapError::ParsingError(e) => write!(f, "PadMap error recieved a parsing error: {e}"),
-            PadMapError::BadFileFormat => write!(f, "PadMap found a bad file format while reading the map file! Expected .csv without whitespaces")
+            PadMapError::BadFileFormat => write!(f, "PadMap found a bad file format while reading the map file! Expected .csv without whitespaces"),
+            PadMapError::InvalidEntry(cb, ad, ag, ch, pad) => write!(f, "PadMap found an entry outside of the AT-TPC electronics! CoBo: {cb}, AsAd: {ad}, AGET: {ag}, Channel: {ch}, Pad: {pad}")
         }
     }
 }
@@ -202,7 +219,7 @@ pub enum EventBuilderError {
     EventError(EventError),
     BrokenCache,
     ClosedChannel,
-    FailedSend(tokio::sync::mpsc::error::SendError<Event>),
+    FailedSend(Box<tokio::sync::mpsc::error::SendError<Event>>), //boxed, the event is large
 }
 
 impl From<EventError> for EventBuilderError {
@@ -213,7 +230,7 @@ impl From<EventError> for EventBuilderError {
 
 impl From<tokio::sync::mpsc::error::SendError<Event>> for EventBuilderError {
     fn from(value: tokio::sync::mpsc::error::SendError<Event>) -> Self {
-        Self::FailedSend(value)
+        Self::FailedSend(Box::new(value))
     }
 }
 
@@ -233,11 +250,43 @@ impl Display for EventBuilderError {
 
 impl Error for EventBuilderError {}
 
+#[derive(Debug)]
+pub enum RecordingError {
+    IOError(std::io::Error),
+    BadFileFormat,
+    FailedSend(Box<tokio::sync::mpsc::error::SendError<GrawFrame>>), //boxed, the frame is large
+}
+
+impl From<std::io::Error> for RecordingError {
+    fn from(value: std::io::Error) -> Self {
+        Self::IOError(value)
+    }
+}
+
+impl From<tokio::sync::mpsc::error::SendError<GrawFrame>> for RecordingError {
+    fn from(value: tokio::sync::mpsc::error::SendError<GrawFrame>) -> Self {
+        Self::FailedSend(Box::new(value))
+    }
+}
+
+impl Display for RecordingError {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        match self {
+            Self::IOError(e) => write!(f, "Recording recieved an io error: {e}"),
+            Self::BadFileFormat => write!(f, "The file is not a Conduit recording!"),
+            Self::FailedSend(e) => write!(f, "Replay failed to send a frame to the conduit: {e}"),
+        }
+    }
+}
+
+impl Error for RecordingError {}
+
 // ConduitError
 #[derive(Debug)]
 pub enum ConduitError {
     BrokenReceiver(ExporterReceiverError),
     FailedEventBuilder(EventBuilderError),
+    FailedRecording(RecordingError),
 }
 
 impl Display for ConduitError {
@@ -245,6 +294,7 @@ impl Display for ConduitError {
         match self {
             Self::BrokenReceiver(val) => write!(f, "A Receiver in the Conduit failed: {val}"),
             Self::FailedEventBuilder(val) => write!(f, "The Conduit event builder failed: {val}"),
+            Self::FailedRecording(val) => write!(f, "The Conduit recording failed: {val}"),
         }
     }
 }
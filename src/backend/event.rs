@@ -1,52 +1,171 @@
-use fxhash::FxHashMap;
-use numpy::ndarray::{s, Array1, Array2};
+use bitvec::prelude::*;
 
 use super::constants::*;
 use super::error::EventError;
 use super::graw_frame::GrawFrame;
-use super::pad_map::{HardwareID, PadMap};
+use super::pad_map::{hardware_index, source_index, PadMap, NUMBER_OF_HARDWARE_ADDRESSES};
+
+/// The number of AGETs in the AT-TPC electronics
+const NUMBER_OF_AGETS_TOTAL: usize = NUMBER_OF_HARDWARE_ADDRESSES / NUMBER_OF_CHANNELS as usize;
+/// Marks an AGET without a fixed pattern noise trace
+const NO_FPN: u16 = u16::MAX;
+/// The value of the pad column for fixed pattern noise rows
+const FPN_PAD: i16 = -1;
+/// The number of time buckets in a trace
+const N_BUCKETS: usize = NUMBER_OF_TIME_BUCKETS as usize;
+/// The number of words in the read out mask of a trace (one bit per time bucket)
+const READ_OUT_WORDS: usize = N_BUCKETS / 64;
+
+/// The processing applied to the traces of an event once it is built
+#[derive(Debug, Clone, Copy, Default)]
+pub struct TraceProcessing {
+    pub subtract_fpn: bool, //subtract the fixed pattern noise of each AGET
+    pub zero_threshold: Option<i16>, //zero suppress the traces at this threshold
+}
+
+/// The traces of an event in sparse form. Only the runs of read out samples (segments)
+/// which were not zero suppressed are kept, which is much smaller than the data matrix
+/// for zero suppressed events.
+#[derive(Debug, Default)]
+pub struct SparseTraces {
+    pub hardware: Vec<i16>, //the hardware columns (cobo, asad, aget, channel, pad) of each trace
+    pub segments: Vec<i32>, //the trace, first time bucket and length of each segment
+    pub samples: Vec<i16>,  //the samples of every segment, in order
+}
+
+/// The number of values describing a segment of a SparseTraces
+pub const SEGMENT_COLUMNS: usize = 3;
+
+/// The tables locating the matrix row of each hardware address of an event. There is an
+/// entry per hardware address, so rather than being allocated for every event, an index
+/// is taken back from each event once it is built and reused (see EventCache). Only the
+/// entries of the event's rows are reset.
+#[derive(Debug, Default)]
+pub struct RowIndex {
+    touched: BitVec, //marks the hardware addresses found in the event
+    rows: Vec<u16>,  //maps hardware index to the matrix row for that pad
+}
+
+impl RowIndex {
+    /// Allocate a new index with no hardware address marked. The default index is empty;
+    /// it is left in an event once its index is taken.
+    pub fn allocate() -> Self {
+        RowIndex {
+            touched: bitvec![0; NUMBER_OF_HARDWARE_ADDRESSES],
+            rows: vec![0; NUMBER_OF_HARDWARE_ADDRESSES],
+        }
+    }
+
+    /// Unmark a hardware address. Does nothing if the index is empty.
+    fn forget(&mut self, hw_index: usize) {
+        if hw_index < self.touched.len() {
+            self.touched.set(hw_index, false);
+        }
+    }
+
+    /// Move the row of a hardware address. Does nothing if the index is empty.
+    fn move_row(&mut self, hw_index: usize, row: usize) {
+        if let Some(entry) = self.rows.get_mut(hw_index) {
+            *entry = row as u16;
+        }
+    }
+}
+
+/// Get the hardware index of a data matrix row
+fn row_hardware_index(row: &[i16]) -> Option<usize> {
+    hardware_index(row[0] as u8, row[1] as u8, row[2] as u8, row[3] as u8)
+}
 
 /// An event is a collection of traces which all occured with the same Event ID
 /// generated by the AT-TPC GET DAQ. An event is created from a Vec of GrawFrames,
-/// which are then parsed into ndarray traces. The event can also subtract
-/// the fixed pattern noise recored by the electronics. To write the event to HDF5 or
-/// marshall the data to Python we must convert the event to a data matrix.
+/// which are parsed directly into the rows of the event data matrix. The matrix is a
+/// contiguous, row-major slab (usually taken from a BufferPool) in the format used by
+/// AT-TPC analysis, so that it can be written to HDF5 or marshalled to Python without
+/// further copies. Rows are located by the compact hardware index of the pad; a bitmap
+/// marks which hardware addresses have been touched, and a small table gives the row of
+/// each touched address, so that storing a sample is an indexed write. These tables (the
+/// RowIndex) are reused between events like the matrix buffer.
+///
+/// The event can also subtract the fixed pattern noise (FPN) recorded by the electronics
+/// and zero suppress its traces (see process). The FPN channels are not pads, so they are
+/// only kept (as rows with a pad of -1) while building an event which will subtract them.
+/// Which time buckets of each row were read out is tracked in a bitmask, as a sample
+/// which was read out can be zero (i.e. after the FPN is subtracted).
 #[derive(Debug)]
 pub struct Event {
     nframes: i32,
-    traces: FxHashMap<HardwareID, Array1<i16>>, //maps pad id to the trace for that pad
+    keep_fpn: bool,     //keep the FPN channels for subtraction
+    index: RowIndex,    //locates the matrix row of each hardware address
+    n_rows: usize,      //number of rows in the data matrix
+    data: Vec<i16>,     //row-major data matrix
+    read_out: Vec<u64>, //marks the time buckets read out, READ_OUT_WORDS per matrix row
+    sources: u64,       //bitmask of the (CoBo, AsAd) sources found in the event
     timestamp: u64,
     timestampother: u64,
     event_id: u32,
 }
 
 impl Event {
-    /// Make a new empty event
-    pub fn new() -> Self {
+    /// Make a new empty event, building the data matrix in the given buffer and locating
+    /// its rows with the given index, which must have no hardware address marked (see
+    /// RowIndex::allocate and take_row_index). The buffer is cleared, but keeps its
+    /// capacity. If keep_fpn is true the FPN channels are stored along with the pads.
+    pub fn new(mut buffer: Vec<i16>, index: RowIndex, keep_fpn: bool) -> Self {
+        buffer.clear();
         Event {
             nframes: 0,
-            traces: FxHashMap::default(),
+            keep_fpn,
+            index,
+            n_rows: 0,
+            data: buffer,
+            read_out: Vec::new(),
+            sources: 0,
             timestamp: 0,
             timestampother: 0,
             event_id: 0,
         }
     }
 
-    /// Convert the event traces to a data matrix for writing to disk or marshalling to
-    /// Python. Follows format used by AT-TPC analysis
-    pub fn convert_to_data_matrix(self) -> Array2<i16> {
-        let mut data_matrix = Array2::<i16>::zeros([self.traces.len(), NUMBER_OF_MATRIX_COLUMNS]);
-        for (row, (hw_id, trace)) in self.traces.into_iter().enumerate() {
-            data_matrix[[row, 0]] = hw_id.cobo_id as i16;
-            data_matrix[[row, 1]] = hw_id.asad_id as i16;
-            data_matrix[[row, 2]] = hw_id.aget_id as i16;
-            data_matrix[[row, 3]] = hw_id.channel as i16;
-            data_matrix[[row, 4]] = hw_id.pad_id as i16;
-            let mut trace_slice = data_matrix.slice_mut(s![row, 5..NUMBER_OF_MATRIX_COLUMNS]);
-            trace.move_into(&mut trace_slice);
+    /// Take the event data matrix for writing to disk or marshalling to Python. Returns
+    /// the row-major buffer and the number of rows. Each row has NUMBER_OF_MATRIX_COLUMNS
+    /// elements; the hardware address (cobo, asad, aget, channel, pad) followed by the
+    /// trace. Follows format used by AT-TPC analysis
+    pub fn take_data_matrix(self) -> (Vec<i16>, usize) {
+        (self.data, self.n_rows)
+    }
+
+    /// Take the row index of the event for reuse, unmarking the hardware addresses of the
+    /// event's rows. No more frames can be appended to the event.
+    pub fn take_row_index(&mut self) -> RowIndex {
+        let mut index = std::mem::take(&mut self.index);
+        for row in self.data.chunks_exact(NUMBER_OF_MATRIX_COLUMNS) {
+            if let Some(hw) = row_hardware_index(row) {
+                index.forget(hw);
+            }
         }
+        index
+    }
 
-        data_matrix
+    /// Get the matrix row of a hardware address, adding a new row (with the given value of
+    /// the pad column) the first time the address is found during the event
+    fn get_row(&mut self, hw_index: usize, hardware: [u8; 4], pad: i16) -> usize {
+        if self.index.touched[hw_index] {
+            return self.index.rows[hw_index] as usize;
+        }
+        let row = self.n_rows;
+        self.data.extend_from_slice(&[
+            hardware[0] as i16,
+            hardware[1] as i16,
+            hardware[2] as i16,
+            hardware[3] as i16,
+            pad,
+        ]);
+        self.data.resize((row + 1) * NUMBER_OF_MATRIX_COLUMNS, 0);
+        self.read_out.resize((row + 1) * READ_OUT_WORDS, 0);
+        self.index.touched.set(hw_index, true);
+        self.index.rows[hw_index] = row as u16;
+        self.n_rows += 1;
+        row
     }
 
     /// Add a frame to the event. Sanity checks can return errors
@@ -69,39 +188,473 @@ impl Event {
             self.timestamp = frame.header.event_time;
         }
 
-        for datum in frame.data.iter() {
-            if let Some(hw_id) = pad_map.get_hardware_id(
-                &frame.header.cobo_id,
-                &frame.header.asad_id,
-                &datum.aget_id,
-                &datum.channel,
-            ) {
-                match self.traces.get_mut(hw_id) {
-                    Some(trace) => {
-                        trace[datum.time_bucket_id as usize] = datum.sample;
-                    }
-                    None => {
-                        //First time this pad found during event. Create a new array
-                        let mut trace: Array1<i16> =
-                            Array1::<i16>::zeros(NUMBER_OF_TIME_BUCKETS as usize);
-                        trace[datum.time_bucket_id as usize] = datum.sample;
-                        self.traces.insert(hw_id.clone(), trace);
-                    }
+        let cobo_id = frame.header.cobo_id;
+        let asad_id = frame.header.asad_id;
+        if let Some(source) = source_index(cobo_id, asad_id) {
+            self.sources |= 1 << source;
+        }
+        // Samples are scattered straight from the frame body into the data matrix
+        frame.decode(|aget_id, channel, time_bucket_id, sample| {
+            let maybe_index = match pad_map.get_hardware_index(cobo_id, asad_id, aget_id, channel) {
+                Some(hw_index) => Some((hw_index, pad_map.get_pad_id(hw_index) as i16)),
+                None if self.keep_fpn && FPN_CHANNELS.contains(&channel) => {
+                    hardware_index(cobo_id, asad_id, aget_id, channel)
+                        .map(|hw_index| (hw_index, FPN_PAD))
                 }
+                None => None,
+            };
+            if let Some((hw_index, pad)) = maybe_index {
+                let row = self.get_row(hw_index, [cobo_id, asad_id, aget_id, channel], pad);
+                let bucket = time_bucket_id as usize;
+                self.data[row * NUMBER_OF_MATRIX_COLUMNS + NUMBER_OF_HARDWARE_COLUMNS + bucket] =
+                    sample;
+                self.read_out[row * READ_OUT_WORDS + bucket / 64] |= 1 << (bucket % 64);
             }
-        }
+        });
 
         self.nframes += 1;
 
         Ok(())
     }
 
+    /// Apply the trace processing to the event. The FPN of each AGET is subtracted from
+    /// its pads (if requested), and the FPN rows are removed. Zero suppression removes the
+    /// baseline of each trace and zeros the samples which are not within
+    /// ZERO_SUPPRESSION_MARGIN time buckets of a sample over the threshold; traces with
+    /// no sample over the threshold are removed. Time buckets which were not read out
+    /// are left as zero, and zeroed time buckets are no longer marked as read out. This
+    /// should be done once the event is complete.
+    pub fn process(&mut self, processing: &TraceProcessing) {
+        if processing.subtract_fpn {
+            self.subtract_fpn();
+        }
+        if self.keep_fpn {
+            self.retain_rows(|row, _| row[NUMBER_OF_HARDWARE_COLUMNS - 1] != FPN_PAD);
+        }
+        if let Some(threshold) = processing.zero_threshold {
+            for (row, words) in self
+                .data
+                .chunks_exact_mut(NUMBER_OF_MATRIX_COLUMNS)
+                .zip(self.read_out.chunks_exact_mut(READ_OUT_WORDS))
+            {
+                let trace = &mut row[NUMBER_OF_HARDWARE_COLUMNS..];
+                let mask = read_out_mask(words);
+                subtract_baseline(trace, &mask);
+                zero_suppress(trace, words, &mask, threshold);
+            }
+            self.retain_rows(|_, words| words.iter().any(|word| *word != 0));
+        }
+    }
+
+    /// Get the traces of the event in sparse form. The segments are the runs of time
+    /// buckets which were read out (and not zero suppressed).
+    pub fn to_sparse(&self) -> SparseTraces {
+        let mut sparse = SparseTraces {
+            hardware: Vec::with_capacity(self.n_rows * NUMBER_OF_HARDWARE_COLUMNS),
+            ..Default::default()
+        };
+        for (trace, (row, words)) in self
+            .data
+            .chunks_exact(NUMBER_OF_MATRIX_COLUMNS)
+            .zip(self.read_out.chunks_exact(READ_OUT_WORDS))
+            .enumerate()
+        {
+            sparse
+                .hardware
+                .extend_from_slice(&row[..NUMBER_OF_HARDWARE_COLUMNS]);
+            let samples = &row[NUMBER_OF_HARDWARE_COLUMNS..];
+            let mask = read_out_mask(words);
+            let mut bucket = 0;
+            while bucket < samples.len() {
+                if mask[bucket] == 0 {
+                    bucket += 1;
+                    continue;
+                }
+                let start = bucket;
+                while bucket < samples.len() && mask[bucket] != 0 {
+                    bucket += 1;
+                }
+                sparse.segments.extend_from_slice(&[
+                    trace as i32,
+                    start as i32,
+                    (bucket - start) as i32,
+                ]);
+                sparse.samples.extend_from_slice(&samples[start..bucket]);
+            }
+        }
+        sparse
+    }
+
+    /// Subtract the mean FPN trace of each AGET from the traces of its pads
+    fn subtract_fpn(&mut self) {
+        let mut fpn_rows: Vec<(usize, usize)> = self
+            .data
+            .chunks_exact(NUMBER_OF_MATRIX_COLUMNS)
+            .enumerate()
+            .filter(|(_, row)| row[NUMBER_OF_HARDWARE_COLUMNS - 1] == FPN_PAD)
+            .filter_map(|(idx, row)| {
+                row_hardware_index(row).map(|hw| (hw / NUMBER_OF_CHANNELS as usize, idx))
+            })
+            .collect();
+        if fpn_rows.is_empty() {
+            return;
+        }
+        fpn_rows.sort_unstable();
+
+        // The mean FPN trace of each AGET, located through mean_index
+        let mut mean_index = [NO_FPN; NUMBER_OF_AGETS_TOTAL];
+        let mut means: Vec<i16> = Vec::new();
+        let mut sums = [0i32; N_BUCKETS];
+        let mut counts = [0i32; N_BUCKETS];
+        for aget_rows in fpn_rows.chunk_by(|a, b| a.0 == b.0) {
+            sums.fill(0);
+            counts.fill(0);
+            for (_, row) in aget_rows {
+                let start = row * NUMBER_OF_MATRIX_COLUMNS + NUMBER_OF_HARDWARE_COLUMNS;
+                let trace = &self.data[start..start + N_BUCKETS];
+                let mask =
+                    read_out_mask(&self.read_out[row * READ_OUT_WORDS..(row + 1) * READ_OUT_WORDS]);
+                for (((sum, count), sample), flag) in
+                    sums.iter_mut().zip(counts.iter_mut()).zip(trace).zip(mask)
+                {
+                    *sum += (*sample & flag) as i32;
+                    *count += -flag as i32;
+                }
+            }
+            mean_index[aget_rows[0].0] = (means.len() / N_BUCKETS) as u16;
+            means.extend(sums.iter().zip(counts.iter()).map(|(sum, count)| {
+                if *count > 0 {
+                    (sum / count) as i16
+                } else {
+                    0
+                }
+            }));
+        }
+
+        for (row, words) in self
+            .data
+            .chunks_exact_mut(NUMBER_OF_MATRIX_COLUMNS)
+            .zip(self.read_out.chunks_exact(READ_OUT_WORDS))
+        {
+            if row[NUMBER_OF_HARDWARE_COLUMNS - 1] == FPN_PAD {
+                continue;
+            }
+            let Some(hw) = row_hardware_index(row) else {
+                continue;
+            };
+            let index = mean_index[hw / NUMBER_OF_CHANNELS as usize];
+            if index == NO_FPN {
+                continue;
+            }
+            let start = index as usize * N_BUCKETS;
+            let mean = &means[start..start + N_BUCKETS];
+            let mask = read_out_mask(words);
+            for ((sample, noise), flag) in row[NUMBER_OF_HARDWARE_COLUMNS..]
+                .iter_mut()
+                .zip(mean)
+                .zip(mask)
+            {
+                *sample = sample.saturating_sub(*noise & flag);
+            }
+        }
+    }
+
+    /// Keep only the rows of the data matrix for which keep (given the row and its read
+    /// out mask) returns true, preserving their order. The row table and read out masks
+    /// are updated so the event stays consistent.
+    fn retain_rows<F: FnMut(&[i16], &[u64]) -> bool>(&mut self, mut keep: F) {
+        let mut n_kept = 0;
+        for row in 0..self.n_rows {
+            let start = row * NUMBER_OF_MATRIX_COLUMNS;
+            let words = row * READ_OUT_WORDS;
+            let hw = row_hardware_index(&self.data[start..start + NUMBER_OF_MATRIX_COLUMNS]);
+            if !keep(
+                &self.data[start..start + NUMBER_OF_MATRIX_COLUMNS],
+                &self.read_out[words..words + READ_OUT_WORDS],
+            ) {
+                if let Some(hw) = hw {
+                    self.index.forget(hw);
+                }
+                continue;
+            }
+            if n_kept != row {
+                self.data.copy_within(
+                    start..start + NUMBER_OF_MATRIX_COLUMNS,
+                    n_kept * NUMBER_OF_MATRIX_COLUMNS,
+                );
+                self.read_out
+                    .copy_within(words..words + READ_OUT_WORDS, n_kept * READ_OUT_WORDS);
+            }
+            if let Some(hw) = hw {
+                self.index.move_row(hw, n_kept);
+            }
+            n_kept += 1;
+        }
+        self.n_rows = n_kept;
+        self.data.truncate(n_kept * NUMBER_OF_MATRIX_COLUMNS);
+        self.read_out.truncate(n_kept * READ_OUT_WORDS);
+    }
+
     /// Get the total number of frames in the event
     pub fn get_nframes(&self) -> usize {
         self.nframes as usize
     }
 
+    /// Get the number of traces (rows of the data matrix) in the event
+    pub fn get_nrows(&self) -> usize {
+        self.n_rows
+    }
+
+    /// Get the rows of the data matrix, each NUMBER_OF_MATRIX_COLUMNS long
+    pub fn get_rows(&self) -> std::slice::ChunksExact<'_, i16> {
+        self.data.chunks_exact(NUMBER_OF_MATRIX_COLUMNS)
+    }
+
+    /// Get the bitmask of the (CoBo, AsAd) sources which sent frames for this event
+    pub fn get_sources(&self) -> u64 {
+        self.sources
+    }
+
     pub fn get_event_id(&self) -> u32 {
         self.event_id
     }
 }
+
+/// Expand the read out mask of a trace to one value per time bucket, -1 (all bits set)
+/// if the time bucket was read out or 0 if not, so that the trace passes can mask samples
+/// without branching
+fn read_out_mask(words: &[u64]) -> [i16; N_BUCKETS] {
+    if words.iter().all(|word| *word == u64::MAX) {
+        return [-1; N_BUCKETS];
+    }
+    let mut mask = [0i16; N_BUCKETS];
+    for (flags, word) in mask.chunks_exact_mut(64).zip(words) {
+        for (bit, flag) in flags.iter_mut().enumerate() {
+            *flag = -(((word >> bit) & 1) as i16);
+        }
+    }
+    mask
+}
+
+/// Subtract the baseline from the samples of a trace which were read out (see
+/// read_out_mask). The baseline is the mean of the samples, excluding those more than
+/// BASELINE_SIGMA_CUT standard deviations above the mean (the signal). The standard
+/// deviation is estimated from the mean absolute deviation. The passes are branch free
+/// integer arithmetic, so that they vectorize.
+fn subtract_baseline(trace: &mut [i16], mask: &[i16; N_BUCKETS]) {
+    let (mut n, mut sum) = (0i32, 0i32);
+    for (sample, flag) in trace.iter().zip(mask) {
+        n += -*flag as i32;
+        sum += (*sample & *flag) as i32;
+    }
+    if n == 0 {
+        return;
+    }
+    let mean = sum / n;
+    let mut abs_dev = 0i32;
+    for (sample, flag) in trace.iter().zip(mask) {
+        abs_dev += (-*flag as i32) * (*sample as i32 - mean).abs();
+    }
+    // For normally distributed noise sigma = sqrt(pi/2) * mean absolute deviation
+    let sigma = std::f64::consts::FRAC_PI_2.sqrt() * abs_dev as f64 / n as f64;
+    let cut = mean + (BASELINE_SIGMA_CUT * sigma) as i32;
+    let (mut n_base, mut sum_base) = (0i32, 0i32);
+    for (sample, flag) in trace.iter().zip(mask) {
+        let value = *sample as i32;
+        let is_base = ((*flag != 0) & (value <= cut)) as i32;
+        n_base += is_base;
+        sum_base += is_base * value;
+    }
+    let baseline = if n_base > 0 {
+        (sum_base as f64 / n_base as f64).round() as i16
+    } else {
+        mean as i16
+    };
+    for (sample, flag) in trace.iter_mut().zip(mask) {
+        *sample = sample.saturating_sub(baseline & *flag);
+    }
+}
+
+/// Zero the samples of a trace which are not within ZERO_SUPPRESSION_MARGIN time buckets
+/// of a read out sample over the threshold. The zeroed time buckets are cleared from the
+/// read out mask of the trace.
+fn zero_suppress(trace: &mut [i16], words: &mut [u64], mask: &[i16; N_BUCKETS], threshold: i16) {
+    let mut over = [0u8; N_BUCKETS + 2 * ZERO_SUPPRESSION_MARGIN];
+    for ((flag, sample), read_out) in over[ZERO_SUPPRESSION_MARGIN..]
+        .iter_mut()
+        .zip(trace.iter())
+        .zip(mask)
+    {
+        *flag = ((*sample > threshold) & (*read_out != 0)) as u8;
+    }
+    let mut keep = [0u8; N_BUCKETS];
+    for offset in 0..=2 * ZERO_SUPPRESSION_MARGIN {
+        for (flag, over) in keep.iter_mut().zip(&over[offset..offset + N_BUCKETS]) {
+            *flag |= *over;
+        }
+    }
+    for (sample, flag) in trace.iter_mut().zip(keep) {
+        *sample *= flag as i16;
+    }
+    for (word, flags) in words.iter_mut().zip(keep.chunks_exact(64)) {
+        // Gather the 0/1 flag bytes eight at a time: the multiply moves byte i to bit
+        // 56 + i without carries
+        let kept = flags
+            .chunks_exact(8)
+            .enumerate()
+            .fold(0u64, |bits, (byte, eight)| {
+                let eight = u64::from_le_bytes(eight.try_into().unwrap());
+                bits | ((eight.wrapping_mul(0x0102_0408_1020_4080) >> 56) << (8 * byte))
+            });
+        *word &= kept;
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// Add a row to an event, marking the given time buckets as read out
+    fn push_row(
+        event: &mut Event,
+        hardware: [u8; 4],
+        pad: i16,
+        trace: &[i16],
+        read_out: std::ops::Range<usize>,
+    ) {
+        event.data.extend_from_slice(&[
+            hardware[0] as i16,
+            hardware[1] as i16,
+            hardware[2] as i16,
+            hardware[3] as i16,
+            pad,
+        ]);
+        event.data.extend_from_slice(trace);
+        event
+            .read_out
+            .resize((event.n_rows + 1) * READ_OUT_WORDS, 0);
+        for bucket in read_out {
+            event.read_out[event.n_rows * READ_OUT_WORDS + bucket / 64] |= 1 << (bucket % 64);
+        }
+        event.n_rows += 1;
+    }
+
+    #[test]
+    fn fpn_zero_sample_stays_in_segment() {
+        let mut event = Event::new(Vec::new(), RowIndex::allocate(), true);
+        let fpn = [100i16; N_BUCKETS];
+        let mut pad = [100i16; N_BUCKETS];
+        pad[200..210].fill(400);
+        pad[205] = 100; // exactly the FPN, so zero once the FPN is subtracted
+        push_row(
+            &mut event,
+            [0, 0, 0, FPN_CHANNELS[0]],
+            FPN_PAD,
+            &fpn,
+            0..N_BUCKETS,
+        );
+        push_row(&mut event, [0, 0, 0, 0], 1, &pad, 0..N_BUCKETS);
+        event.process(&TraceProcessing {
+            subtract_fpn: true,
+            zero_threshold: Some(50),
+        });
+
+        let sparse = event.to_sparse();
+        assert_eq!(event.get_nrows(), 1);
+        assert_eq!(sparse.segments, vec![0, 197, 16]);
+        assert_eq!(sparse.samples[8], 0);
+        assert_eq!(sparse.samples[3], 300);
+    }
+
+    #[test]
+    fn unread_buckets_are_left_out() {
+        let mut event = Event::new(Vec::new(), RowIndex::allocate(), false);
+        let mut trace = [0i16; N_BUCKETS];
+        trace[..256].fill(50);
+        trace[100..105].fill(300);
+        push_row(&mut event, [0, 0, 0, 0], 1, &trace, 0..256);
+        // No sample over the threshold, so the row is removed
+        push_row(&mut event, [0, 0, 0, 1], 2, &[50; N_BUCKETS], 0..N_BUCKETS);
+        event.process(&TraceProcessing {
+            subtract_fpn: false,
+            zero_threshold: Some(100),
+        });
+
+        assert_eq!(event.get_nrows(), 1);
+        let row = event.get_rows().next().unwrap();
+        assert!(row[NUMBER_OF_HARDWARE_COLUMNS + 256..]
+            .iter()
+            .all(|s| *s == 0));
+        let sparse = event.to_sparse();
+        assert_eq!(sparse.segments, vec![0, 97, 11]);
+        assert_eq!(&sparse.samples[3..8], &[250; 5]);
+        assert_eq!(
+            event.read_out[..READ_OUT_WORDS]
+                .iter()
+                .map(|w| w.count_ones())
+                .sum::<u32>(),
+            11
+        );
+    }
+
+    /// Make a partial GRAW frame with a few samples of one channel of AGET 0 of CoBo 0
+    fn channel_frame(channel: u8) -> GrawFrame {
+        let n_items: u32 = 8;
+        let mut message = vec![0u8; 2 * SIZE_UNIT as usize];
+        message[0] = EXPECTED_META_TYPE;
+        message[1..4].copy_from_slice(&2u32.to_be_bytes()[1..]);
+        message[5..7].copy_from_slice(&EXPECTED_FRAME_TYPE_PARTIAL.to_be_bytes());
+        message[8..10].copy_from_slice(&EXPECTED_HEADER_SIZE.to_be_bytes());
+        message[10..12].copy_from_slice(&EXPECTED_ITEM_SIZE_PARTIAL.to_be_bytes());
+        message[12..16].copy_from_slice(&n_items.to_be_bytes());
+        let body = &mut message[SIZE_UNIT as usize..];
+        for time_bucket in 0..n_items {
+            let item: u32 = ((channel as u32) << 23) | (time_bucket << 14) | 100;
+            let start = (time_bucket * 4) as usize;
+            body[start..start + 4].copy_from_slice(&item.to_be_bytes());
+        }
+        GrawFrame::from_message(bytes::Bytes::from(message)).unwrap()
+    }
+
+    #[test]
+    fn fpn_rows_are_marked() {
+        let pad_map = PadMap::default();
+        let mut event = Event::new(Vec::new(), RowIndex::allocate(), true);
+        event
+            .append_frame(&pad_map, channel_frame(FPN_CHANNELS[0]))
+            .unwrap();
+        // Not a pad nor an FPN channel, so not stored
+        event.append_frame(&pad_map, channel_frame(0)).unwrap();
+        assert_eq!(event.get_nrows(), 1);
+        let row = event.get_rows().next().unwrap();
+        assert_eq!(row[NUMBER_OF_HARDWARE_COLUMNS - 2], FPN_CHANNELS[0] as i16);
+        assert_eq!(row[NUMBER_OF_HARDWARE_COLUMNS - 1], FPN_PAD);
+
+        event.process(&TraceProcessing::default());
+        assert_eq!(event.get_nrows(), 0);
+    }
+
+    #[test]
+    fn row_index_is_reset_for_reuse() {
+        let pad_map = PadMap::default();
+        let mut event = Event::new(Vec::new(), RowIndex::allocate(), true);
+        for channel in &FPN_CHANNELS[..2] {
+            event
+                .append_frame(&pad_map, channel_frame(*channel))
+                .unwrap();
+        }
+        assert_eq!(event.get_nrows(), 2);
+        let index = event.take_row_index();
+        assert_eq!(index.touched.count_ones(), 0);
+
+        // The second channel was row 1 of the first event, but is row 0 of this one
+        let mut event = Event::new(Vec::new(), index, true);
+        event
+            .append_frame(&pad_map, channel_frame(FPN_CHANNELS[1]))
+            .unwrap();
+        assert_eq!(event.get_nrows(), 1);
+        let row = event.get_rows().next().unwrap();
+        assert_eq!(row[NUMBER_OF_HARDWARE_COLUMNS - 2], FPN_CHANNELS[1] as i16);
+        assert_eq!(row[NUMBER_OF_HARDWARE_COLUMNS], 100);
+    }
+}
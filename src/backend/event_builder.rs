@@ -1,91 +1,268 @@
-use std::collections::VecDeque;
+use std::collections::{BTreeMap, VecDeque};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
 
 use fxhash::FxHashMap;
 use tokio::sync::{broadcast, mpsc};
 use tokio::task::JoinHandle;
+use tokio::time::MissedTickBehavior;
 
+use super::buffer_pool::BufferPool;
 use super::error::{ConduitError, EventBuilderError};
-use super::event::Event;
+use super::event::{Event, RowIndex, TraceProcessing};
+use super::event_filter::EventFilter;
 use super::graw_frame::GrawFrame;
 use super::message::ConduitMessage;
 use super::pad_map::PadMap;
+use super::stats::ConduitStats;
+
+/// Compact the recency queue once it holds this many stale entries per cached event
+const STALE_ENTRIES_PER_EVENT: usize = 4;
+/// The shortest interval at which the cache is checked for expired events
+const MIN_FLUSH_INTERVAL: Duration = Duration::from_millis(1);
+/// How long the reorder stage holds events when no event timeout is configured
+const DEFAULT_REORDER_WAIT: Duration = Duration::from_millis(500);
+/// The number of recently emitted event ids remembered to recognize late frames
+const RECENTLY_EMITTED: usize = 256;
+/// How long an emitted event id is remembered. Frames for the id after this are taken as a
+/// new event (e.g. the event ids starting over in a new run).
+const LATE_FRAME_WINDOW: Duration = Duration::from_secs(5);
+
+/// An event in the EventCache, with its bookkeeping
+#[derive(Debug)]
+struct CachedEvent {
+    event: Event,
+    generation: u64,  //generation of the latest update
+    created: Instant, //when the first frame arrived
+}
 
 /// An EventCache is a storage system for event data. In live data taking, modules
 /// may fill their internal memory buffers at different rates, resulting in chunks of
 /// the same physical event being transmitted at different times. To handle this, we
-/// cache events, building multiple events at the same time. Once we reach a size
-/// limit, the least recently modified event is popped from the cache.
+/// cache events, building multiple events at the same time. Events can be taken from
+/// the cache once they are complete or too old, and once we reach a size limit, the
+/// least recently modified event is popped from the cache. New events are built in
+/// buffers taken from the BufferPool, and the row index of each event taken from the cache
+/// is kept for a new event (see RowIndex).
+///
+/// Recency is tracked with a generation-stamped queue: every update pushes the event id
+/// with a new generation, and queue entries whose generation is no longer the event's
+/// current generation are stale and skipped when popping. Together with a running count
+/// of the cached frames, adding a frame is (amortized) constant time regardless of the
+/// cache size.
+///
+/// The ids of the last RECENTLY_EMITTED events taken from the cache are remembered for
+/// LATE_FRAME_WINDOW. A frame which arrives for one of them (e.g. from a source which is
+/// not expected, or a second frame from the same source) is late: it is dropped rather
+/// than starting a new event, which would be emitted again as an incomplete duplicate.
 #[derive(Debug)]
-struct EventCache {
-    events: FxHashMap<u32, Event>,
-    order: VecDeque<u32>,
+pub struct EventCache {
+    events: FxHashMap<u32, CachedEvent>,
+    order: VecDeque<(u32, u64)>, //event id and generation, oldest first
+    generation: u64,
+    n_frames: usize,
+    emitted: FxHashMap<u32, Instant>, //recently emitted event ids and when
+    emitted_order: VecDeque<(u32, Instant)>, //recently emitted event ids, oldest first
+    buffer_pool: BufferPool,
+    indexes: Vec<RowIndex>, //row indexes of the events taken from the cache, for reuse
+    keep_fpn: bool,         //store the FPN channels in new events
 }
 
 impl EventCache {
-    /// Create a new cache
-    pub fn new() -> Self {
+    /// Create a new cache. If keep_fpn is true, events keep their FPN channels for
+    /// subtraction (see Event::process).
+    pub fn new(buffer_pool: BufferPool, keep_fpn: bool) -> Self {
         EventCache {
             events: FxHashMap::default(),
             order: VecDeque::new(),
+            generation: 0,
+            n_frames: 0,
+            emitted: FxHashMap::default(),
+            emitted_order: VecDeque::with_capacity(RECENTLY_EMITTED),
+            buffer_pool,
+            indexes: Vec::new(),
+            keep_fpn,
         }
     }
 
     /// Add a frame to the cache. If there is no event to which this frame
-    /// corresponds, a new event is created for it.
+    /// corresponds, a new event is created for it. Returns the event id of the frame, or
+    /// None if the frame is late (its event was recently emitted) and was dropped.
     pub fn add_frame(
         &mut self,
         pad_map: &PadMap,
         frame: GrawFrame,
-    ) -> Result<(), EventBuilderError> {
+    ) -> Result<Option<u32>, EventBuilderError> {
         let frame_evt_id = frame.header.event_id;
+        if self.was_emitted(&frame_evt_id) {
+            return Ok(None);
+        }
+        self.generation += 1;
         match self.events.get_mut(&frame_evt_id) {
-            Some(event) => {
-                event.append_frame(pad_map, frame)?;
-                let mut event_position = 0;
-                for (idx, event_id) in self.order.iter().enumerate() {
-                    if *event_id == frame_evt_id {
-                        event_position = idx;
-                        break;
-                    }
-                }
-                self.order.remove(event_position);
-                self.order.push_back(frame_evt_id);
+            Some(cached) => {
+                cached.event.append_frame(pad_map, frame)?;
+                cached.generation = self.generation;
             }
             None => {
-                let mut event = Event::new();
+                let index = self.indexes.pop().unwrap_or_else(RowIndex::allocate);
+                let mut event = Event::new(self.buffer_pool.take(), index, self.keep_fpn);
                 event.append_frame(pad_map, frame)?;
-                self.events.insert(frame_evt_id, event);
-                self.order.push_back(frame_evt_id);
+                self.events.insert(
+                    frame_evt_id,
+                    CachedEvent {
+                        event,
+                        generation: self.generation,
+                        created: Instant::now(),
+                    },
+                );
             }
         }
+        self.order.push_back((frame_evt_id, self.generation));
+        self.n_frames += 1;
 
-        Ok(())
+        if self.order.len() > STALE_ENTRIES_PER_EVENT * (self.events.len() + 1) {
+            self.compact();
+        }
+
+        Ok(Some(frame_evt_id))
     }
 
     /// Returns the least recently used event
     pub fn get_lru_event(&mut self) -> Result<Event, EventBuilderError> {
-        if let Some(least_recently_used) = self.order.pop_front() {
-            if let Some(event) = self.events.remove(&least_recently_used) {
-                Ok(event)
-            } else {
-                Err(EventBuilderError::BrokenCache)
+        while let Some((event_id, generation)) = self.order.pop_front() {
+            let is_current = match self.events.get(&event_id) {
+                Some(cached) => cached.generation == generation,
+                None => false,
+            };
+            if is_current {
+                return self
+                    .remove_event(&event_id)
+                    .ok_or(EventBuilderError::BrokenCache);
             }
+        }
+        Err(EventBuilderError::BrokenCache)
+    }
+
+    /// Returns the event if it has received frames from all of the expected sources (see
+    /// Event::get_sources). The event is removed from the cache.
+    pub fn take_if_complete(&mut self, event_id: &u32, expected_sources: u64) -> Option<Event> {
+        let cached = self.events.get(event_id)?;
+        if cached.event.get_sources() & expected_sources == expected_sources {
+            self.remove_event(event_id)
         } else {
-            Err(EventBuilderError::BrokenCache)
+            None
         }
     }
 
+    /// Returns all of the events whose first frame arrived more than max_age ago, ordered by
+    /// event id. The events are removed from the cache.
+    pub fn take_expired(&mut self, max_age: Duration) -> Vec<Event> {
+        let now = Instant::now();
+        let mut expired: Vec<u32> = self
+            .events
+            .iter()
+            .filter(|(_, cached)| now.duration_since(cached.created) > max_age)
+            .map(|(event_id, _)| *event_id)
+            .collect();
+        expired.sort_unstable();
+        expired
+            .iter()
+            .filter_map(|event_id| self.remove_event(event_id))
+            .collect()
+    }
+
+    /// Remove every event from the cache, returning them in event id order
+    pub fn take_all(&mut self) -> Vec<Event> {
+        let mut event_ids: Vec<u32> = self.events.keys().copied().collect();
+        event_ids.sort_unstable();
+        event_ids
+            .iter()
+            .filter_map(|event_id| self.remove_event(event_id))
+            .collect()
+    }
+
+    /// Return the buffer of an event which will not be sent on to the pool
+    pub fn recycle(&self, event: Event) {
+        self.buffer_pool.recycle(event.take_data_matrix().0);
+    }
+
     /// Returns the size of the cache in GRAW Frames
     pub fn size(&self) -> usize {
-        self.events
-            .iter()
-            .fold(0, |acc, (_, event)| acc + event.get_nframes())
+        self.n_frames
+    }
+
+    /// Returns the number of events in the cache
+    pub fn n_events(&self) -> usize {
+        self.events.len()
+    }
+
+    /// Remove an event from the cache. Its entries in the recency queue become stale, its
+    /// id is remembered as recently emitted, and its row index is kept for reuse.
+    fn remove_event(&mut self, event_id: &u32) -> Option<Event> {
+        let mut cached = self.events.remove(event_id)?;
+        self.n_frames -= cached.event.get_nframes();
+        self.indexes.push(cached.event.take_row_index());
+        self.remember_emitted(*event_id);
+        Some(cached.event)
+    }
+
+    /// Remember an emitted event id, forgetting the oldest once RECENTLY_EMITTED are held
+    fn remember_emitted(&mut self, event_id: u32) {
+        if self.emitted_order.len() == RECENTLY_EMITTED {
+            if let Some((oldest, when)) = self.emitted_order.pop_front() {
+                // The id may have been emitted again since (a new run), keep that entry
+                if self.emitted.get(&oldest) == Some(&when) {
+                    self.emitted.remove(&oldest);
+                }
+            }
+        }
+        let now = Instant::now();
+        self.emitted.insert(event_id, now);
+        self.emitted_order.push_back((event_id, now));
+    }
+
+    /// Check if an event id was emitted within the LATE_FRAME_WINDOW
+    fn was_emitted(&self, event_id: &u32) -> bool {
+        self.emitted
+            .get(event_id)
+            .is_some_and(|when| when.elapsed() <= LATE_FRAME_WINDOW)
+    }
+
+    /// Drop the stale entries from the recency queue
+    fn compact(&mut self) {
+        let events = &self.events;
+        self.order.retain(|(event_id, generation)| {
+            events
+                .get(event_id)
+                .is_some_and(|cached| cached.generation == *generation)
+        });
     }
 }
 
+/// Settings controlling when the EventBuilder emits events
+#[derive(Debug, Clone)]
+pub struct EventBuilderConfig {
+    /// The maximum size of the event cache in GRAW frames. Once exceeded, the least recently
+    /// used event is emitted, complete or not.
+    pub max_cache_size: usize,
+    /// The (CoBo, AsAd) sources expected in every event, as a bitmask (see source_index).
+    /// An event is emitted as soon as it has frames from all of them.
+    pub expected_sources: u64,
+    /// The maximum time an incomplete event can wait in the cache. If None, incomplete
+    /// events are only emitted once the cache is full.
+    pub max_event_age: Option<Duration>,
+    /// The processing applied to the traces of each event before it is emitted
+    pub processing: TraceProcessing,
+    /// The filter selecting which (processed) events are emitted. If None, every event is
+    /// emitted.
+    pub filter: Option<EventFilter>,
+}
+
 /// EventBuilder receives GrawFrames from the various receivers and composes them into
 /// events. It then transmits events to the Conduit, where they can be polled by other
-/// pipelines.
+/// pipelines. Events are transmitted as soon as they are complete; incomplete events
+/// are transmitted once they reach the maximum age or when the cache is full. If there is
+/// an event filter, rejected events are counted and dropped instead.
 #[derive(Debug)]
 #[allow(dead_code)]
 pub struct EventBuilder {
@@ -94,24 +271,34 @@ pub struct EventBuilder {
     frame_receiver: mpsc::Receiver<GrawFrame>,
     event_sender: mpsc::Sender<Event>,
     event_cache: EventCache,
-    max_cache_size: usize,
+    config: EventBuilderConfig,
+    stats: Arc<ConduitStats>,
+    shard: usize,
+    n_rejected: u64, //events rejected by the filter, for the prescale
 }
 
 impl EventBuilder {
-    /// Create a new EventBuilder. Requires a PadMap
+    /// Create a new EventBuilder. Requires a PadMap and the BufferPool events are built in.
+    /// The shard index identifies the builder in the stats.
     pub fn new(
         pad_map: PadMap,
         frame_rx: mpsc::Receiver<GrawFrame>,
         event_tx: mpsc::Sender<Event>,
-        max_cache_size: usize,
+        config: EventBuilderConfig,
+        buffer_pool: BufferPool,
+        stats: Arc<ConduitStats>,
+        shard: usize,
     ) -> Self {
         EventBuilder {
             current_event_id: 0,
             pad_map,
             frame_receiver: frame_rx,
             event_sender: event_tx,
-            event_cache: EventCache::new(),
-            max_cache_size,
+            event_cache: EventCache::new(buffer_pool, config.processing.subtract_fpn),
+            config,
+            stats,
+            shard,
+            n_rejected: 0,
         }
     }
 
@@ -120,6 +307,12 @@ impl EventBuilder {
         &mut self,
         cancel: &mut broadcast::Receiver<ConduitMessage>,
     ) -> Result<(), EventBuilderError> {
+        let max_event_age = self.config.max_event_age;
+        let flush_period = max_event_age
+            .map(|age| (age / 4).max(MIN_FLUSH_INTERVAL))
+            .unwrap_or(Duration::from_secs(1));
+        let mut flush_interval = tokio::time::interval(flush_period);
+        flush_interval.set_missed_tick_behavior(MissedTickBehavior::Skip);
         loop {
             tokio::select! {
                 _ = cancel.recv() => {
@@ -129,7 +322,13 @@ impl EventBuilder {
                     if let Some(frame) = maybe {
                         self.build(frame).await?;
                     } else {
-                        return Err(EventBuilderError::ClosedChannel);
+                        // Every frame source has finished (e.g. the end of a replay)
+                        return self.flush_all().await;
+                    }
+                }
+                _ = flush_interval.tick(), if max_event_age.is_some() => {
+                    if let Some(age) = max_event_age {
+                        self.flush_expired(age).await?;
                     }
                 }
             }
@@ -137,34 +336,440 @@ impl EventBuilder {
     }
 
     /// Takes a GrawFrame and adds it to the event cache.
-    /// If the cache is full, an event is sent up to the conduit for exposure.
+    /// If the event is complete, or the cache is full, an event is sent up to the conduit
+    /// for exposure.
     async fn build(&mut self, frame: GrawFrame) -> Result<(), EventBuilderError> {
-        self.event_cache.add_frame(&self.pad_map, frame)?;
-        if self.event_cache.size() > self.max_cache_size {
-            self.event_sender
-                .send(self.event_cache.get_lru_event()?)
-                .await?
+        let Some(event_id) = self.event_cache.add_frame(&self.pad_map, frame)? else {
+            self.stats.record_late_frame();
+            return Ok(());
+        };
+        if let Some(event) = self
+            .event_cache
+            .take_if_complete(&event_id, self.config.expected_sources)
+        {
+            self.stats.record_complete_event();
+            self.send_event(event).await?
         }
+        while self.event_cache.size() > self.config.max_cache_size {
+            self.stats.record_full_cache_eviction();
+            let event = self.event_cache.get_lru_event()?;
+            self.send_event(event).await?
+        }
+        self.record_cache();
 
         Ok(())
     }
+
+    /// Process the traces of an event and send it to the Conduit, unless it is rejected by
+    /// the event filter. The prescale counts the rejections of this builder.
+    async fn send_event(&mut self, mut event: Event) -> Result<(), EventBuilderError> {
+        event.process(&self.config.processing);
+        if let Some(filter) = &self.config.filter {
+            if let Err(rejection) = filter.check(&event) {
+                self.n_rejected += 1;
+                if filter
+                    .prescale
+                    .is_some_and(|prescale| self.n_rejected.is_multiple_of(prescale))
+                {
+                    self.stats.record_prescaled_event();
+                } else {
+                    self.stats.record_filter_rejection(rejection);
+                    self.event_cache.recycle(event);
+                    return Ok(());
+                }
+            }
+        }
+        self.event_sender.send(event).await?;
+        Ok(())
+    }
+
+    /// Send every event which has waited in the cache for longer than max_age
+    async fn flush_expired(&mut self, max_age: Duration) -> Result<(), EventBuilderError> {
+        for event in self.event_cache.take_expired(max_age) {
+            self.stats.record_timeout_eviction();
+            self.send_event(event).await?
+        }
+        self.record_cache();
+        Ok(())
+    }
+
+    /// Send every event left in the cache, complete or not
+    async fn flush_all(&mut self) -> Result<(), EventBuilderError> {
+        for event in self.event_cache.take_all() {
+            self.stats.record_end_of_stream_eviction();
+            self.send_event(event).await?
+        }
+        self.record_cache();
+        Ok(())
+    }
+
+    /// Update the cache and frame channel occupancy in the stats
+    fn record_cache(&self) {
+        self.stats.record_cache(
+            self.shard,
+            self.event_cache.n_events(),
+            self.event_cache.size(),
+            self.frame_receiver.len(),
+        );
+    }
+}
+
+/// FrameRouter distributes GrawFrames across the EventBuilder shards. Every frame of an
+/// event is routed to the same shard (by event id), so each shard builds complete events
+/// independently of the others.
+#[derive(Debug, Clone)]
+pub struct FrameRouter {
+    shards: Vec<mpsc::Sender<GrawFrame>>,
+}
+
+impl FrameRouter {
+    /// Create a new router from the frame channels of the shards
+    pub fn new(shards: Vec<mpsc::Sender<GrawFrame>>) -> Self {
+        FrameRouter { shards }
+    }
+
+    /// Send a frame to the shard building its event
+    pub async fn send(&self, frame: GrawFrame) -> Result<(), mpsc::error::SendError<GrawFrame>> {
+        let shard = frame.header.event_id as usize % self.shards.len();
+        self.shards[shard].send(frame).await
+    }
+}
+
+/// The reorder stage merges the events of the EventBuilder shards. Events are held until more
+/// than window events are waiting, and then sent on in event id order. Events are not held
+/// longer than max_wait, so that they are not delayed at low rates: once the oldest waiting
+/// event has waited max_wait, every event which has waited that long is sent, along with the
+/// waiting events of lower id so that the events stay in order.
+async fn run_reorder_stage(
+    mut event_rx: mpsc::Receiver<Event>,
+    event_tx: mpsc::Sender<Event>,
+    window: usize,
+    max_wait: Duration,
+    cancel: &mut broadcast::Receiver<ConduitMessage>,
+) -> Result<(), EventBuilderError> {
+    let mut waiting: BTreeMap<u32, Event> = BTreeMap::new();
+    // When each waiting event arrived, oldest first. Entries of events which were already
+    // sent are skipped.
+    let mut arrivals: VecDeque<(Instant, u32)> = VecDeque::new();
+    loop {
+        while arrivals
+            .front()
+            .is_some_and(|(_, event_id)| !waiting.contains_key(event_id))
+        {
+            arrivals.pop_front();
+        }
+        let deadline = arrivals.front().map(|(arrived, _)| *arrived + max_wait);
+        let wake = deadline.unwrap_or_else(Instant::now).into();
+        tokio::select! {
+            _ = cancel.recv() => {
+                return Ok(());
+            }
+            maybe = event_rx.recv() => {
+                if let Some(event) = maybe {
+                    arrivals.push_back((Instant::now(), event.get_event_id()));
+                    waiting.insert(event.get_event_id(), event);
+                    while waiting.len() > window {
+                        if let Some((_, event)) = waiting.pop_first() {
+                            event_tx.send(event).await?;
+                        }
+                    }
+                } else {
+                    // Every shard has finished
+                    while let Some((_, event)) = waiting.pop_first() {
+                        event_tx.send(event).await?;
+                    }
+                    return Ok(());
+                }
+            }
+            _ = tokio::time::sleep_until(wake), if deadline.is_some() => {
+                // Send up to the highest id which has waited max_wait
+                let now = Instant::now();
+                let mut last_expired: Option<u32> = None;
+                while let Some(&(arrived, event_id)) = arrivals.front() {
+                    if arrived + max_wait > now {
+                        break;
+                    }
+                    arrivals.pop_front();
+                    if waiting.contains_key(&event_id) {
+                        last_expired = last_expired.max(Some(event_id));
+                    }
+                }
+                if let Some(last_expired) = last_expired {
+                    while let Some(entry) = waiting.first_entry() {
+                        if *entry.key() > last_expired {
+                            break;
+                        }
+                        event_tx.send(entry.remove()).await?;
+                    }
+                }
+            }
+        }
+    }
 }
 
-/// Helper function for starting the EventBuilder
-pub fn startup_event_builder(
+/// Helper function for starting the EventBuilders, one per frame channel (shard). The
+/// shards share the BufferPool, and each gets an equal share of the cache size. If the
+/// reorder window is not zero, the events of the shards are merged in event id order
+/// (see run_reorder_stage), otherwise they are sent as soon as they are built.
+#[allow(clippy::too_many_arguments)]
+pub fn startup_event_builders(
     rt: &tokio::runtime::Runtime,
-    frame_rx: mpsc::Receiver<GrawFrame>,
+    frame_rxs: Vec<mpsc::Receiver<GrawFrame>>,
     event_tx: mpsc::Sender<Event>,
     cancel: &broadcast::Sender<ConduitMessage>,
     pad_map: PadMap,
-    max_cache_size: usize,
-) -> JoinHandle<Result<(), ConduitError>> {
-    let mut evb = EventBuilder::new(pad_map, frame_rx, event_tx, max_cache_size);
-    let mut cancel_rx = cancel.subscribe();
-    rt.spawn(async move {
-        match evb.run(&mut cancel_rx).await {
-            Ok(()) => Ok(()),
-            Err(e) => Err(ConduitError::FailedEventBuilder(e)),
-        }
-    })
+    config: EventBuilderConfig,
+    buffer_pool: BufferPool,
+    reorder_window: usize,
+    stats: &Arc<ConduitStats>,
+) -> Vec<JoinHandle<Result<(), ConduitError>>> {
+    let mut handles = vec![];
+    let n_shards = frame_rxs.len().max(1);
+    let shard_config = EventBuilderConfig {
+        max_cache_size: config.max_cache_size.div_ceil(n_shards),
+        ..config.clone()
+    };
+    let shard_tx = if reorder_window > 0 {
+        let (merged_tx, merged_rx) = mpsc::channel::<Event>(event_tx.max_capacity());
+        let max_wait = config.max_event_age.unwrap_or(DEFAULT_REORDER_WAIT);
+        let mut cancel_rx = cancel.subscribe();
+        handles.push(rt.spawn(async move {
+            run_reorder_stage(
+                merged_rx,
+                event_tx,
+                reorder_window,
+                max_wait,
+                &mut cancel_rx,
+            )
+            .await
+            .map_err(ConduitError::FailedEventBuilder)
+        }));
+        merged_tx
+    } else {
+        event_tx
+    };
+    for (shard, frame_rx) in frame_rxs.into_iter().enumerate() {
+        let mut evb = EventBuilder::new(
+            pad_map.clone(),
+            frame_rx,
+            shard_tx.clone(),
+            shard_config.clone(),
+            buffer_pool.clone(),
+            stats.clone(),
+            shard,
+        );
+        let mut cancel_rx = cancel.subscribe();
+        handles.push(rt.spawn(async move {
+            match evb.run(&mut cancel_rx).await {
+                Ok(()) => Ok(()),
+                Err(e) => Err(ConduitError::FailedEventBuilder(e)),
+            }
+        }));
+    }
+    handles
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::backend::constants::*;
+    use crate::backend::pad_map::source_index;
+    use bytes::Bytes;
+
+    /// Make a partial GRAW frame from a (CoBo, AsAd) source with a few samples
+    fn make_frame(event_id: u32, cobo_id: u8, asad_id: u8) -> GrawFrame {
+        let n_items: u32 = 8;
+        let mut message = vec![0u8; 2 * SIZE_UNIT as usize];
+        message[0] = EXPECTED_META_TYPE;
+        message[1..4].copy_from_slice(&2u32.to_be_bytes()[1..]);
+        message[5..7].copy_from_slice(&EXPECTED_FRAME_TYPE_PARTIAL.to_be_bytes());
+        message[8..10].copy_from_slice(&EXPECTED_HEADER_SIZE.to_be_bytes());
+        message[10..12].copy_from_slice(&EXPECTED_ITEM_SIZE_PARTIAL.to_be_bytes());
+        message[12..16].copy_from_slice(&n_items.to_be_bytes());
+        message[22..26].copy_from_slice(&event_id.to_be_bytes());
+        message[26] = cobo_id;
+        message[27] = asad_id;
+        let body = &mut message[SIZE_UNIT as usize..];
+        for time_bucket in 0..n_items {
+            let item: u32 = (time_bucket << 14) | 100;
+            let start = (time_bucket * 4) as usize;
+            body[start..start + 4].copy_from_slice(&item.to_be_bytes());
+        }
+        GrawFrame::from_message(Bytes::from(message)).unwrap()
+    }
+
+    fn sources(asads: &[(u8, u8)]) -> u64 {
+        asads.iter().fold(0, |mask, (cobo, asad)| {
+            mask | 1 << source_index(*cobo, *asad).unwrap()
+        })
+    }
+
+    #[test]
+    fn lru_skips_stale_entries() {
+        let pad_map = PadMap::default();
+        let mut cache = EventCache::new(BufferPool::new(4), false);
+        cache.add_frame(&pad_map, make_frame(1, 0, 0)).unwrap();
+        cache.add_frame(&pad_map, make_frame(2, 0, 0)).unwrap();
+        // Event 1 is updated again, so its first entry in the recency queue is stale
+        cache.add_frame(&pad_map, make_frame(1, 0, 1)).unwrap();
+        assert_eq!(cache.order.len(), 3);
+        assert_eq!(cache.get_lru_event().unwrap().get_event_id(), 2);
+        assert_eq!(cache.get_lru_event().unwrap().get_event_id(), 1);
+        assert!(cache.order.is_empty());
+        assert!(matches!(
+            cache.get_lru_event(),
+            Err(EventBuilderError::BrokenCache)
+        ));
+    }
+
+    #[test]
+    fn compaction_bounds_the_recency_queue() {
+        let pad_map = PadMap::default();
+        let mut cache = EventCache::new(BufferPool::new(4), false);
+        cache.add_frame(&pad_map, make_frame(1, 0, 0)).unwrap();
+        for n in 0..100u32 {
+            cache
+                .add_frame(&pad_map, make_frame(2, 0, (n % 4) as u8))
+                .unwrap();
+            assert!(cache.order.len() <= STALE_ENTRIES_PER_EVENT * (cache.n_events() + 1));
+        }
+        assert_eq!(cache.get_lru_event().unwrap().get_event_id(), 1);
+        assert_eq!(cache.get_lru_event().unwrap().get_event_id(), 2);
+    }
+
+    #[test]
+    fn frames_are_counted() {
+        let pad_map = PadMap::default();
+        let mut cache = EventCache::new(BufferPool::new(4), false);
+        for asad in 0..3 {
+            cache.add_frame(&pad_map, make_frame(1, 0, asad)).unwrap();
+        }
+        for asad in 0..2 {
+            cache.add_frame(&pad_map, make_frame(2, 0, asad)).unwrap();
+        }
+        cache.add_frame(&pad_map, make_frame(3, 1, 0)).unwrap();
+        assert_eq!(cache.size(), 6);
+        assert_eq!(cache.n_events(), 3);
+
+        let event = cache
+            .take_if_complete(&1, sources(&[(0, 0), (0, 1), (0, 2)]))
+            .unwrap();
+        assert_eq!(event.get_nframes(), 3);
+        assert_eq!(cache.size(), 3);
+        // Not complete, so it stays in the cache
+        assert!(cache
+            .take_if_complete(&2, sources(&[(0, 0), (0, 1), (0, 2)]))
+            .is_none());
+        assert_eq!(cache.size(), 3);
+
+        assert_eq!(cache.get_lru_event().unwrap().get_event_id(), 2);
+        assert_eq!(cache.size(), 1);
+        assert_eq!(cache.take_all().len(), 1);
+        assert_eq!(cache.size(), 0);
+        assert_eq!(cache.n_events(), 0);
+    }
+
+    #[test]
+    fn late_frames_are_dropped() {
+        let pad_map = PadMap::default();
+        let mut cache = EventCache::new(BufferPool::new(4), false);
+        let expected = sources(&[(0, 0), (0, 1)]);
+        assert_eq!(
+            cache.add_frame(&pad_map, make_frame(1, 0, 0)).unwrap(),
+            Some(1)
+        );
+        assert_eq!(
+            cache.add_frame(&pad_map, make_frame(1, 0, 1)).unwrap(),
+            Some(1)
+        );
+        assert!(cache.take_if_complete(&1, expected).is_some());
+
+        // A source which is not expected, and a second frame from an expected source
+        assert_eq!(
+            cache.add_frame(&pad_map, make_frame(1, 0, 2)).unwrap(),
+            None
+        );
+        assert_eq!(
+            cache.add_frame(&pad_map, make_frame(1, 0, 0)).unwrap(),
+            None
+        );
+        assert_eq!(cache.n_events(), 0);
+        assert_eq!(cache.size(), 0);
+
+        // Events which were not emitted are still built
+        assert_eq!(
+            cache.add_frame(&pad_map, make_frame(2, 0, 0)).unwrap(),
+            Some(2)
+        );
+        assert_eq!(cache.n_events(), 1);
+    }
+
+    #[test]
+    fn emitted_ids_are_forgotten() {
+        let pad_map = PadMap::default();
+        let mut cache = EventCache::new(BufferPool::new(4), false);
+        for event_id in 0..=RECENTLY_EMITTED as u32 {
+            cache
+                .add_frame(&pad_map, make_frame(event_id, 0, 0))
+                .unwrap();
+            let event = cache.take_all().pop().unwrap();
+            cache.recycle(event);
+        }
+        // Only the last RECENTLY_EMITTED ids are remembered
+        assert_eq!(
+            cache.add_frame(&pad_map, make_frame(0, 0, 0)).unwrap(),
+            Some(0)
+        );
+        assert_eq!(
+            cache.add_frame(&pad_map, make_frame(1, 0, 0)).unwrap(),
+            None
+        );
+        assert_eq!(cache.emitted.len(), RECENTLY_EMITTED);
+    }
+
+    fn make_event(event_id: u32) -> Event {
+        let mut cache = EventCache::new(BufferPool::new(1), false);
+        cache
+            .add_frame(&PadMap::default(), make_frame(event_id, 0, 0))
+            .unwrap();
+        cache.get_lru_event().unwrap()
+    }
+
+    #[tokio::test]
+    async fn reorder_stage_bounds_the_wait() {
+        let max_wait = Duration::from_millis(100);
+        let (in_tx, in_rx) = mpsc::channel::<Event>(16);
+        let (out_tx, mut out_rx) = mpsc::channel::<Event>(16);
+        let (_cancel_tx, mut cancel_rx) = broadcast::channel(1);
+        let stage = tokio::spawn(async move {
+            run_reorder_stage(in_rx, out_tx, 8, max_wait, &mut cancel_rx).await
+        });
+
+        // Events keep arriving faster than max_wait, and never fill the window
+        let sent = tokio::spawn(async move {
+            let mut arrivals = FxHashMap::default();
+            for pair in [[2, 1], [4, 3], [6, 5], [8, 7]] {
+                for event_id in pair {
+                    arrivals.insert(event_id, Instant::now());
+                    in_tx.send(make_event(event_id)).await.unwrap();
+                }
+                tokio::time::sleep(Duration::from_millis(40)).await;
+            }
+            arrivals
+        });
+
+        let mut received = Vec::new();
+        while received.len() < 8 {
+            let event = out_rx.recv().await.unwrap();
+            received.push((event.get_event_id(), Instant::now()));
+        }
+        let arrivals = sent.await.unwrap();
+        let ids: Vec<u32> = received.iter().map(|(event_id, _)| *event_id).collect();
+        assert_eq!(ids, (1..=8).collect::<Vec<u32>>());
+        for (event_id, sent_at) in received {
+            assert!(sent_at - arrivals[&event_id] < max_wait + Duration::from_millis(50));
+        }
+        // The stage stops once its input is closed
+        stage.await.unwrap().unwrap();
+    }
 }
@@ -0,0 +1,105 @@
+use super::constants::NUMBER_OF_HARDWARE_COLUMNS;
+use super::event::Event;
+
+/// The names of the FilterRejection kinds, in the order of FilterRejection::kind
+pub const FILTER_REJECTION_KINDS: [&str; 3] = ["multiplicity", "charge", "outside_beam"];
+
+/// The reason an event was rejected by an EventFilter
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum FilterRejection {
+    Multiplicity,
+    Charge,
+    OutsideBeam,
+}
+
+impl FilterRejection {
+    /// The index of the rejection kind, used to count rejections by kind
+    pub fn kind(&self) -> usize {
+        match self {
+            Self::Multiplicity => 0,
+            Self::Charge => 1,
+            Self::OutsideBeam => 2,
+        }
+    }
+}
+
+/// EventFilter decides which built events are worth sending on to the Conduit. Events
+/// can be selected on their pad multiplicity (the number of traces), their summed charge
+/// (the sum of every sample), and the number of pads hit outside of the beam region. The
+/// filter runs after the trace processing, so the multiplicity and charge are most useful
+/// for zero suppressed events. A prescale lets one in every prescale rejected events
+/// through anyway, to keep a sample of the rejected events.
+#[derive(Debug, Clone, Default)]
+pub struct EventFilter {
+    pub min_multiplicity: usize,         //minimum number of traces
+    pub max_multiplicity: Option<usize>, //maximum number of traces
+    pub min_charge: Option<i64>,         //minimum sum of the samples of every trace
+    pub beam_pads: Vec<bool>,            //marks the pads of the beam region, by pad number
+    pub min_outside_beam: usize,         //minimum number of pads hit outside of the beam region
+    pub prescale: Option<u64>,           //accept one in every prescale rejected events
+}
+
+impl EventFilter {
+    /// Create a filter. The beam region is given as a list of pad numbers.
+    pub fn new(
+        min_multiplicity: usize,
+        max_multiplicity: Option<usize>,
+        min_charge: Option<i64>,
+        beam_pads: &[usize],
+        min_outside_beam: usize,
+        prescale: Option<u64>,
+    ) -> Self {
+        let mut beam_region = vec![false; beam_pads.iter().max().map_or(0, |pad| pad + 1)];
+        for pad in beam_pads {
+            beam_region[*pad] = true;
+        }
+        EventFilter {
+            min_multiplicity,
+            max_multiplicity,
+            min_charge,
+            beam_pads: beam_region,
+            min_outside_beam,
+            prescale: prescale.filter(|n| *n > 0),
+        }
+    }
+
+    /// Check if an event passes the filter, returning the reason it was rejected if not.
+    /// The cheapest selections are checked first.
+    pub fn check(&self, event: &Event) -> Result<(), FilterRejection> {
+        let multiplicity = event.get_nrows();
+        if multiplicity < self.min_multiplicity
+            || self.max_multiplicity.is_some_and(|max| multiplicity > max)
+        {
+            return Err(FilterRejection::Multiplicity);
+        }
+        if self.min_outside_beam > 0 {
+            let outside_beam = event
+                .get_rows()
+                .filter(|row| !self.is_beam_pad(row[NUMBER_OF_HARDWARE_COLUMNS - 1]))
+                .count();
+            if outside_beam < self.min_outside_beam {
+                return Err(FilterRejection::OutsideBeam);
+            }
+        }
+        if let Some(min_charge) = self.min_charge {
+            let charge: i64 = event
+                .get_rows()
+                .map(|row| {
+                    row[NUMBER_OF_HARDWARE_COLUMNS..]
+                        .iter()
+                        .map(|sample| *sample as i32)
+                        .sum::<i32>() as i64
+                })
+                .sum();
+            if charge < min_charge {
+                return Err(FilterRejection::Charge);
+            }
+        }
+        Ok(())
+    }
+
+    /// Check if a pad is in the beam region
+    fn is_beam_pad(&self, pad: i16) -> bool {
+        usize::try_from(pad).is_ok_and(|pad| self.beam_pads.get(pad).copied().unwrap_or(false))
+    }
+}
@@ -1,76 +1,173 @@
+use bytes::{Buf, Bytes, BytesMut};
 use std::net::SocketAddr;
+use std::sync::Arc;
 use tokio::io::AsyncReadExt;
 use tokio::net::TcpStream;
 use tokio::sync::{broadcast, mpsc};
 use tokio::task::JoinHandle;
 use tokio::time::timeout;
 
-use super::constants::{
-    EXPECTED_HEADER_SIZE, EXPORTER_PORT, MM_IP_SUBNET, NUMBER_OF_COBOS, SIZE_UNIT,
-};
+use super::constants::{EXPORTER_PORT, MM_IP_SUBNET, NUMBER_OF_COBOS};
 use super::error::{ConduitError, ExporterReceiverError};
-use super::graw_frame::{GrawFrame, GrawFrameHeader};
+use super::event_builder::FrameRouter;
+use super::graw_frame::GrawFrame;
 use super::message::ConduitMessage;
+use super::recording::FrameRecorder;
+use super::stats::ConduitStats;
 
 /// Just to make sure we never get hung on connecting
 const CONNECTION_TIMEOUT: std::time::Duration = std::time::Duration::from_secs(120);
-/// Convert from GRAW size to real bytes
-const HEADER_SIZE_BYTES: usize = ((EXPECTED_HEADER_SIZE as u32) * SIZE_UNIT) as usize;
+/// The initial size of the receive buffer of each connection
+const RECEIVE_BUFFER_SIZE: usize = 1 << 20;
+/// The number of received messages waiting to be parsed per connection
+const PARSE_QUEUE_SIZE: usize = 40;
+/// The size of the message length prefix sent by the DataExporter
+const LENGTH_PREFIX_SIZE: usize = std::mem::size_of::<u64>();
 
 /// This is the main loop of the receiver task, using a tokio::select macro to wait on
-/// either data to be available on the TcpStream or a cancel message
+/// either data to be available on the TcpStream or a cancel message. Data is read into a
+/// buffer which is reused for the lifetime of the connection, and complete messages are
+/// split off of it (without copying) and handed to a parser task. Reading the socket
+/// therefore never waits on parsing. The receiver index identifies the receiver in the stats
+/// and the recording.
 async fn run_exporter_receiver(
-    ip: &str,
-    port: &str,
-    tx: mpsc::Sender<GrawFrame>,
+    address: &str,
+    receiver: usize,
+    tx: FrameRouter,
+    stats: Arc<ConduitStats>,
+    recorder: Option<FrameRecorder>,
     mut cancel: broadcast::Receiver<ConduitMessage>,
 ) -> Result<(), ExporterReceiverError> {
-    let addr: SocketAddr = format!("{ip}:{port}").parse()?;
+    let addr: SocketAddr = address.parse()?;
     let mut socket: TcpStream = (timeout(CONNECTION_TIMEOUT, TcpStream::connect(&addr)).await?)?;
-    loop {
+    let (message_tx, message_rx) = mpsc::channel::<Bytes>(PARSE_QUEUE_SIZE);
+    let parser = tokio::spawn(run_frame_parser(
+        message_rx,
+        tx,
+        receiver,
+        stats.clone(),
+        recorder,
+    ));
+    let mut buffer = BytesMut::with_capacity(RECEIVE_BUFFER_SIZE);
+    let result = 'receive: loop {
         tokio::select! {
             _ = cancel.recv() => {
-                return Ok(());
+                break Ok(());
             },
-            _ = socket.readable() => {
-                if let Some(frame) = reciever_read_frame(&mut socket).await? {
-                    tx.send(frame).await?;
+            read = socket.read_buf(&mut buffer) => {
+                match read {
+                    Ok(0) => break Err(std::io::Error::from(std::io::ErrorKind::UnexpectedEof).into()),
+                    Ok(n_bytes) => stats.record_bytes(receiver, n_bytes),
+                    Err(e) => break Err(e.into()),
+                }
+                while let Some(message) = split_message(&mut buffer) {
+                    // The parser only stops early if it failed; its error is reported below
+                    if message_tx.send(message).await.is_err() {
+                        break 'receive Ok(());
+                    }
                 }
             }
         }
+    };
+    // Let the parser finish any queued messages
+    drop(message_tx);
+    match parser.await {
+        Ok(parsed) => result.and(parsed),
+        Err(_) => result,
+    }
+}
+
+/// Split the next complete message off of the front of the buffer. The message shares the
+/// buffer memory. Returns None if the buffer does not contain a complete message yet, making
+/// sure there is room for the rest of it.
+fn split_message(buffer: &mut BytesMut) -> Option<Bytes> {
+    loop {
+        if buffer.len() < LENGTH_PREFIX_SIZE {
+            return None;
+        }
+        let mut prefix = [0u8; LENGTH_PREFIX_SIZE];
+        prefix.copy_from_slice(&buffer[..LENGTH_PREFIX_SIZE]);
+        let message_size = u64::from_le_bytes(prefix) as usize;
+        // Empty messages carry nothing
+        if message_size == 0 {
+            buffer.advance(LENGTH_PREFIX_SIZE);
+            continue;
+        }
+        let total_size = LENGTH_PREFIX_SIZE + message_size;
+        if buffer.len() < total_size {
+            buffer.reserve(total_size - buffer.len());
+            return None;
+        }
+        buffer.advance(LENGTH_PREFIX_SIZE);
+        return Some(buffer.split_to(message_size).freeze());
     }
 }
 
-/// Read a single frame off the TcpStream
-async fn reciever_read_frame(
-    socket: &mut TcpStream,
-) -> Result<Option<GrawFrame>, ExporterReceiverError> {
-    let message_size = socket.read_u64_le().await?;
-    // Socket wasn't actually ready, maybe?
-    if message_size == 0 {
-        return Ok(None);
+/// The parse stage of a receiver. Converts raw messages to GrawFrames and sends them on to
+/// the EventBuilder shards. Messages are length-prefixed, so a frame which cannot be parsed is
+/// counted and skipped without losing the rest of the stream. If there is a recorder, every
+/// raw message (bad frames included) is recorded. Runs until the receiver stops sending
+/// messages.
+async fn run_frame_parser(
+    mut rx: mpsc::Receiver<Bytes>,
+    tx: FrameRouter,
+    receiver: usize,
+    stats: Arc<ConduitStats>,
+    recorder: Option<FrameRecorder>,
+) -> Result<(), ExporterReceiverError> {
+    while let Some(message) = rx.recv().await {
+        if let Some(recorder) = &recorder {
+            recorder.record(receiver, &message);
+        }
+        match GrawFrame::from_message(message) {
+            Ok(frame) => {
+                stats.record_frame(receiver);
+                tx.send(frame).await?;
+            }
+            Err(e) => {
+                stats.record_frame_error(&e);
+                log::warn!("Receiver {receiver} skipped a bad frame: {e}");
+            }
+        }
     }
-    let mut message_buffer: Vec<u8> = vec![0; message_size as usize];
-    socket.read_exact(&mut message_buffer).await?;
-    let header = GrawFrameHeader::from_buffer(&message_buffer[0..HEADER_SIZE_BYTES])?;
-    let mut frame = GrawFrame::new(header);
-    frame.read(&message_buffer[HEADER_SIZE_BYTES..])?;
-    Ok(Some(frame))
+    Ok(())
+}
+
+/// The DataExporter addresses of the AT-TPC, one per CoBo, in ip:port form
+pub fn default_exporter_addresses() -> Vec<String> {
+    (0..NUMBER_OF_COBOS)
+        .map(|idx| format!("{}.{}:{}", MM_IP_SUBNET, 60 + idx, EXPORTER_PORT))
+        .collect()
 }
 
-/// Helper function to start and spawn all DataExporter communication tasks
+/// Helper function to start and spawn all DataExporter communication tasks, one per
+/// address (ip:port)
 pub fn startup_exporter_recievers(
     rt: &tokio::runtime::Runtime,
-    frame_tx: &mpsc::Sender<GrawFrame>,
+    addresses: &[String],
+    frame_tx: &FrameRouter,
     cancel_tx: &broadcast::Sender<ConduitMessage>,
+    stats: &Arc<ConduitStats>,
+    recorder: Option<&FrameRecorder>,
 ) -> Vec<JoinHandle<Result<(), ConduitError>>> {
     let mut handles = vec![];
-    for idx in 0..NUMBER_OF_COBOS {
+    for (receiver, address) in addresses.iter().enumerate() {
         let this_frame_tx = frame_tx.clone();
         let this_cancel_rx = cancel_tx.subscribe();
-        let ip = format!("{}.{}", MM_IP_SUBNET, 60 + idx);
+        let this_stats = stats.clone();
+        let this_recorder = recorder.cloned();
+        let address = address.clone();
         let handle = rt.spawn(async move {
-            match run_exporter_receiver(&ip, EXPORTER_PORT, this_frame_tx, this_cancel_rx).await {
+            match run_exporter_receiver(
+                &address,
+                receiver,
+                this_frame_tx,
+                this_stats,
+                this_recorder,
+                this_cancel_rx,
+            )
+            .await
+            {
                 Ok(()) => Ok(()),
                 Err(e) => Err(ConduitError::BrokenReceiver(e)),
             }
@@ -1,35 +1,15 @@
 use bitvec::prelude::*;
 use byteorder::{BigEndian, ReadBytesExt};
+use bytes::Bytes;
 use std::io::Cursor;
 
 use super::constants::*;
 use super::error::{GrawDataError, GrawFrameError};
 
-/// Data from a single time-bucket (sampled point along the waveform)
-#[derive(Debug, Default, Clone)]
-pub struct GrawData {
-    pub aget_id: u8,
-    pub channel: u8,
-    pub time_bucket_id: u16,
-    pub sample: i16,
-}
-
-impl GrawData {
-    /// Sanity checks
-    pub fn check_data(&self) -> Result<(), GrawDataError> {
-        if self.aget_id > NUMBER_OF_AGETS {
-            return Err(GrawDataError::BadAgetID(self.aget_id));
-        }
-        if self.channel > NUMBER_OF_CHANNELS {
-            return Err(GrawDataError::BadChannel(self.channel));
-        }
-        if (self.time_bucket_id as u32) > NUMBER_OF_TIME_BUCKETS {
-            return Err(GrawDataError::BadTimeBucket(self.time_bucket_id));
-        }
-
-        Ok(())
-    }
-}
+/// Convert from GRAW size to real bytes
+const HEADER_SIZE_BYTES: usize = ((EXPECTED_HEADER_SIZE as u32) * SIZE_UNIT) as usize;
+/// The number of items an AGET can send in a full frame
+const ITEMS_PER_AGET_FULL: u32 = NUMBER_OF_CHANNELS as u32 * NUMBER_OF_TIME_BUCKETS;
 
 /// Unused, but maybe someday someone will care
 #[allow(dead_code)]
@@ -170,6 +150,10 @@ impl GrawFrameHeader {
 /// The header comprises one 256 bit chunks, and the body can contain several 256 bit
 /// chunks.
 ///
+/// The frame keeps the raw message it was received in. The body is only decoded when the
+/// frame is added to an event (see GrawFrame::decode), so that samples are written
+/// straight into the event without an intermediate collection.
+///
 /// ## Note
 /// Using 256 bit sizing is interesting because it often results in padding in both the
 /// body and the header. (It is done for performance reasons in the acquisition)
@@ -179,98 +163,103 @@ pub struct GrawFrame {
     pub header: GrawFrameHeader,
     hit_patterns: Vec<BitVec<u8>>, // idk again maybe someone will care
     multiplicity: Vec<u16>,        // idk again maybe someone will care
-    pub data: Vec<GrawData>,
+    message: Bytes,                // the raw header and body
+    body_start: usize,
+    body_end: usize, // excludes the padding
 }
 
 impl GrawFrame {
-    /// Make a new frame frmo a header
+    /// Make a new frame frmo a header, with an empty body
     pub fn new(header: GrawFrameHeader) -> GrawFrame {
         GrawFrame {
             header,
             hit_patterns: vec![],
             multiplicity: vec![],
-            data: vec![],
+            message: Bytes::new(),
+            body_start: 0,
+            body_end: 0,
         }
     }
 
-    /// Convert a binary buffer to a GRAW frame
-    pub fn read(&mut self, buffer: &[u8]) -> Result<(), GrawFrameError> {
-        let buffer_length: u64 = buffer.len() as u64;
-        let mut cursor = Cursor::new(buffer);
-
-        self.header.check_header(buffer_length as u32)?;
+    /// Convert a binary message (header and body) to a GRAW frame. The header is parsed and
+    /// the frame is validated; the body is kept as is.
+    pub fn from_message(message: Bytes) -> Result<GrawFrame, GrawFrameError> {
+        let mut header = GrawFrameHeader::from_buffer(&message)?;
+        let body_start = HEADER_SIZE_BYTES.min(message.len());
+        header.check_header((message.len() - body_start) as u32)?;
+        if header.frame_type == EXPECTED_FRAME_TYPE_FULL
+            && header.n_items > ITEMS_PER_AGET_FULL * NUMBER_OF_AGETS as u32
+        {
+            return Err(GrawFrameError::BadDatum(GrawDataError::BadTimeBucket(
+                (header.n_items / (NUMBER_OF_AGETS as u32 * NUMBER_OF_CHANNELS as u32)) as u16,
+            )));
+        }
         // Dont read the padding! Use actual size from items
-        let end_position =
-            cursor.position() + (self.header.n_items * self.header.item_size as u32) as u64;
+        let body_end =
+            (body_start + (header.n_items * header.item_size as u32) as usize).min(message.len());
+        let mut frame = GrawFrame::new(header);
+        frame.message = message;
+        frame.body_start = body_start;
+        frame.body_end = body_end;
+        Ok(frame)
+    }
+
+    /// Decode the frame body, passing each sample to store as (aget, channel, time bucket,
+    /// sample). The AGET and time bucket are always in range; channels outside of the AGET
+    /// are passed on (partial frames) and should be rejected by the hardware lookup. The
+    /// frame type was validated when the frame was created.
+    pub fn decode<F>(&self, store: F)
+    where
+        F: FnMut(u8, u8, u16, i16),
+    {
+        let body = &self.message[self.body_start..self.body_end];
         if self.header.frame_type == EXPECTED_FRAME_TYPE_PARTIAL {
-            self.extract_partial_data(&mut cursor, end_position)?;
+            GrawFrame::decode_partial(body, store);
         } else if self.header.frame_type == EXPECTED_FRAME_TYPE_FULL {
-            self.extract_full_data(&mut cursor, end_position)?;
+            GrawFrame::decode_full(body, store);
         }
-
-        Ok(())
     }
 
-    /// Extract the data from the frame body. Idk what partial refers to here.
+    /// Decode the data from the frame body. Idk what partial refers to here.
     /// Parsing done in 32-bit data words
-    fn extract_partial_data(
-        &mut self,
-        cursor: &mut Cursor<&[u8]>,
-        end_position: u64,
-    ) -> Result<(), GrawFrameError> {
-        let mut datum: GrawData;
-        let mut raw: u32;
-
-        while cursor.position() < end_position {
-            datum = GrawData::default();
-
-            raw = cursor.read_u32::<BigEndian>()?;
-            datum.aget_id = GrawFrame::extract_aget_id(&raw);
-            datum.channel = GrawFrame::extract_channel(&raw);
-            datum.time_bucket_id = GrawFrame::extract_time_bucket_id(&raw);
-            datum.sample = GrawFrame::extract_sample(&raw);
-
-            match datum.check_data() {
-                Ok(()) => (),
-                Err(_) => {
-                    continue;
-                }
-            }
-
-            self.data.push(datum);
+    fn decode_partial<F>(body: &[u8], mut store: F)
+    where
+        F: FnMut(u8, u8, u16, i16),
+    {
+        for word in body.chunks_exact(4) {
+            let raw = u32::from_be_bytes([word[0], word[1], word[2], word[3]]);
+            store(
+                GrawFrame::extract_aget_id(&raw),
+                GrawFrame::extract_channel(&raw),
+                GrawFrame::extract_time_bucket_id(&raw),
+                GrawFrame::extract_sample(&raw),
+            );
         }
-
-        Ok(())
     }
 
-    /// Extract the data from the frame body. Idk what full refers to here.
-    /// Parsing done in 16-bit data words
-    fn extract_full_data(
-        &mut self,
-        cursor: &mut Cursor<&[u8]>,
-        end_position: u64,
-    ) -> Result<(), GrawFrameError> {
-        let mut datum: GrawData;
-        let mut raw: u16;
-        let mut aget_counters: Vec<u64> = vec![0, 0, 0, 0];
-
-        while cursor.position() < end_position {
-            datum = GrawData::default();
-            raw = cursor.read_u16::<BigEndian>()?;
-            datum.aget_id = GrawFrame::extract_aget_id_full(&raw);
-            let aget_index: usize = datum.aget_id as usize;
-            datum.sample = GrawFrame::extract_sample_full(&raw);
-            datum.time_bucket_id = (aget_counters[aget_index] / 68) as u16; //integer division always rounds down
-            datum.channel = (aget_counters[aget_index] % 68) as u8; // % operator in Rust is the remainder
-
-            datum.check_data()?;
-
-            self.data.push(datum);
-
-            aget_counters[aget_index] += 1;
+    /// Decode the data from the frame body. Idk what full refers to here.
+    /// Parsing done in 16-bit data words. Items past the last time bucket of an AGET are
+    /// dropped.
+    fn decode_full<F>(body: &[u8], mut store: F)
+    where
+        F: FnMut(u8, u8, u16, i16),
+    {
+        let mut aget_counters: [u32; NUMBER_OF_AGETS as usize] = [0; NUMBER_OF_AGETS as usize];
+        for word in body.chunks_exact(2) {
+            let raw = u16::from_be_bytes([word[0], word[1]]);
+            let aget_id = GrawFrame::extract_aget_id_full(&raw);
+            let counter = &mut aget_counters[aget_id as usize];
+            if *counter >= ITEMS_PER_AGET_FULL {
+                continue;
+            }
+            store(
+                aget_id,
+                (*counter % NUMBER_OF_CHANNELS as u32) as u8, // % operator in Rust is the remainder
+                (*counter / NUMBER_OF_CHANNELS as u32) as u16, //integer division always rounds down
+                GrawFrame::extract_sample_full(&raw),
+            );
+            *counter += 1;
         }
-
-        Ok(())
     }
 
     fn extract_aget_id(raw_item: &u32) -> u8 {
@@ -1,11 +1,15 @@
 //! This is the module containing all of the backend code
 //! related to running the attpc_conduit
 
+pub mod buffer_pool;
 pub mod constants;
 pub mod error;
 pub mod event;
 pub mod event_builder;
+pub mod event_filter;
 pub mod exporter_receiver;
 pub mod graw_frame;
 pub mod message;
 pub mod pad_map;
+pub mod recording;
+pub mod stats;
@@ -1,58 +1,64 @@
 use std::fs::File;
-use std::hash::Hash;
 use std::io::Read;
 use std::path::Path;
 
-use fxhash::FxHashMap;
-
+use super::constants::*;
 use super::error::PadMapError;
 
 const ENTRIES_PER_LINE: usize = 5; //Number of elements in a single row in the CSV file
-
-/// HardwareID is a hashable wrapper around the full hardware address (including the pad number).
-#[derive(PartialEq, Eq, Debug, Clone)]
-pub struct HardwareID {
-    pub cobo_id: usize,
-    pub asad_id: usize,
-    pub aget_id: usize,
-    pub channel: usize,
-    pub pad_id: usize,
-}
-
-impl HardwareID {
-    pub fn new(cobo_id: &u8, asad_id: &u8, aget_id: &u8, channel: &u8, pad_id: &u64) -> Self {
-        HardwareID {
-            cobo_id: *cobo_id as usize,
-            asad_id: *asad_id as usize,
-            aget_id: *aget_id as usize,
-            channel: *channel as usize,
-            pad_id: *pad_id as usize,
-        }
+const NO_PAD: u16 = u16::MAX; //Marks a hardware address with no pad
+
+/// The number of distinct hardware addresses (CoBo, AsAd, AGET, channel)
+pub const NUMBER_OF_HARDWARE_ADDRESSES: usize = NUMBER_OF_COBOS as usize
+    * NUMBER_OF_ASADS as usize
+    * NUMBER_OF_AGETS as usize
+    * NUMBER_OF_CHANNELS as usize;
+
+/// Generate a compact, dense index for a given hardware location. Returns None if the
+/// location is outside of the AT-TPC electronics.
+pub fn hardware_index(cobo_id: u8, asad_id: u8, aget_id: u8, channel_id: u8) -> Option<usize> {
+    if cobo_id >= NUMBER_OF_COBOS
+        || asad_id >= NUMBER_OF_ASADS
+        || aget_id >= NUMBER_OF_AGETS
+        || channel_id >= NUMBER_OF_CHANNELS
+    {
+        return None;
     }
+    Some(
+        ((cobo_id as usize * NUMBER_OF_ASADS as usize + asad_id as usize)
+            * NUMBER_OF_AGETS as usize
+            + aget_id as usize)
+            * NUMBER_OF_CHANNELS as usize
+            + channel_id as usize,
+    )
 }
 
-impl Hash for HardwareID {
-    fn hash<H: std::hash::Hasher>(&self, state: &mut H) {
-        self.pad_id.hash(state) //Just use the pad number as it is unqiue by definition
+/// Generate the index of a (CoBo, AsAd) data source, used as a bit position in source
+/// bitmasks. Returns None if the source is outside of the AT-TPC electronics.
+pub fn source_index(cobo_id: u8, asad_id: u8) -> Option<u32> {
+    if cobo_id >= NUMBER_OF_COBOS || asad_id >= NUMBER_OF_ASADS {
+        return None;
     }
-}
-
-/// Generate a unique id number for a given hardware location
-fn generate_uuid(cobo_id: &u8, asad_id: &u8, aget_id: &u8, channel_id: &u8) -> u64 {
-    (*channel_id as u64)
-        + (*aget_id as u64) * 100
-        + (*asad_id as u64) * 10_000
-        + (*cobo_id as u64) * 1_000_000
+    Some(cobo_id as u32 * NUMBER_OF_ASADS as u32 + asad_id as u32)
 }
 
 /// PadMap contains the mapping of the individual hardware identifiers (CoBo ID,
 /// AsAd ID, AGET ID, AGET channel) to AT-TPC pad number. This can change from
 /// experiment to experiment, so PadMap reads in a CSV file where each row contains 5
 /// elements. The first four are the hardware identifiers (in the order listed
-/// previously) and the fifth is the pad number.
-#[derive(Debug, Clone, Default)]
+/// previously) and the fifth is the pad number. The map is stored as a dense table of
+/// pad numbers indexed by the compact hardware index (see hardware_index).
+#[derive(Debug, Clone)]
 pub struct PadMap {
-    map: FxHashMap<u64, HardwareID>,
+    pads: Vec<u16>,
+}
+
+impl Default for PadMap {
+    fn default() -> Self {
+        PadMap {
+            pads: vec![NO_PAD; NUMBER_OF_HARDWARE_ADDRESSES],
+        }
+    }
 }
 
 impl PadMap {
@@ -67,8 +73,6 @@ impl PadMap {
         let mut ag_id: u8;
         let mut ch_id: u8;
         let mut pd_id: u64;
-        let mut uuid: u64;
-        let mut hw_id: HardwareID;
 
         let mut pm = PadMap::default();
 
@@ -90,24 +94,49 @@ impl PadMap {
             ch_id = entries[3].parse()?;
             pd_id = entries[4].parse()?;
 
-            uuid = generate_uuid(&cb_id, &ad_id, &ag_id, &ch_id);
-            hw_id = HardwareID::new(&cb_id, &ad_id, &ag_id, &ch_id, &pd_id);
-            pm.map.insert(uuid, hw_id);
+            match hardware_index(cb_id, ad_id, ag_id, ch_id) {
+                Some(index) if pd_id < NO_PAD as u64 => pm.pads[index] = pd_id as u16,
+                _ => return Err(PadMapError::InvalidEntry(cb_id, ad_id, ag_id, ch_id, pd_id)),
+            }
         }
 
         Ok(pm)
     }
 
-    /// Get the full HardwareID for a given set of hardware identifiers. If returns
+    /// Get the compact hardware index for a given set of hardware identifiers. If returns
     /// None the identifiers given do not exist in the map
-    pub fn get_hardware_id(
+    pub fn get_hardware_index(
         &self,
-        cobo_id: &u8,
-        asad_id: &u8,
-        aget_id: &u8,
-        channel_id: &u8,
-    ) -> Option<&HardwareID> {
-        let uuid = generate_uuid(cobo_id, asad_id, aget_id, channel_id);
-        self.map.get(&uuid)
+        cobo_id: u8,
+        asad_id: u8,
+        aget_id: u8,
+        channel_id: u8,
+    ) -> Option<usize> {
+        let index = hardware_index(cobo_id, asad_id, aget_id, channel_id)?;
+        if self.pads[index] == NO_PAD {
+            None
+        } else {
+            Some(index)
+        }
+    }
+
+    /// Get the bitmask of the (CoBo, AsAd) sources with at least one pad (see source_index).
+    /// Only CoBos with an id less than n_cobos are included.
+    pub fn get_sources(&self, n_cobos: usize) -> u64 {
+        let channels_per_asad = NUMBER_OF_AGETS as usize * NUMBER_OF_CHANNELS as usize;
+        let mut sources: u64 = 0;
+        for (source, asad_pads) in self.pads.chunks_exact(channels_per_asad).enumerate() {
+            if source / (NUMBER_OF_ASADS as usize) < n_cobos
+                && asad_pads.iter().any(|pad| *pad != NO_PAD)
+            {
+                sources |= 1 << source;
+            }
+        }
+        sources
+    }
+
+    /// Get the pad number at a compact hardware index returned by get_hardware_index
+    pub fn get_pad_id(&self, index: usize) -> u16 {
+        self.pads[index]
     }
 }
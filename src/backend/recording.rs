@@ -0,0 +1,214 @@
+use bytes::{Bytes, BytesMut};
+use std::io::Read;
+use std::path::{Path, PathBuf};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
+use tokio::fs::File;
+use tokio::io::{AsyncReadExt, AsyncWriteExt, BufReader, BufWriter};
+use tokio::sync::{broadcast, mpsc};
+use tokio::task::JoinHandle;
+
+use super::error::{ConduitError, RecordingError};
+use super::event_builder::FrameRouter;
+use super::graw_frame::GrawFrame;
+use super::message::ConduitMessage;
+use super::stats::ConduitStats;
+
+/// Identifies a file as a Conduit recording
+const RECORDING_MAGIC: [u8; 8] = *b"ATTPCREC";
+/// The version of the recording format
+const RECORDING_VERSION: u32 = 1;
+/// The size of the recording header (magic, version, number of receivers)
+const RECORDING_HEADER_SIZE: usize = 16;
+/// The number of frames waiting to be written before the recording starts dropping frames
+const RECORDING_QUEUE_SIZE: usize = 4096;
+/// The maximum number of frames taken from the queue per write batch
+const RECORDING_BATCH_SIZE: usize = 256;
+/// The size of the file buffer used to batch writes and reads
+const RECORDING_BUFFER_SIZE: usize = 8 << 20;
+
+/// A raw GRAW frame message queued for the recording
+#[derive(Debug)]
+struct RecordedFrame {
+    time: u64,     //nanoseconds since the recording started
+    receiver: u32, //the receiver (CoBo) the frame came from
+    message: Bytes,
+}
+
+/// FrameRecorder is the handle the receivers use to record the raw GRAW frame messages
+/// they receive. Recording never waits: if the recording task falls behind, frames are
+/// dropped from the recording (and counted in the stats) rather than slowing the receivers.
+///
+/// A recording is a header (magic, version, number of receivers) followed by one record per
+/// frame: the time since the recording started (u64, ns), the receiver index (u32), the
+/// message size (u32) and the raw message. All integers are little endian.
+#[derive(Debug, Clone)]
+pub struct FrameRecorder {
+    tx: mpsc::Sender<RecordedFrame>,
+    start: Instant,
+    stats: Arc<ConduitStats>,
+}
+
+impl FrameRecorder {
+    /// Queue a raw message for the recording. The message memory is shared, not copied.
+    pub fn record(&self, receiver: usize, message: &Bytes) {
+        let frame = RecordedFrame {
+            time: self.start.elapsed().as_nanos() as u64,
+            receiver: receiver as u32,
+            message: message.clone(),
+        };
+        if self.tx.try_send(frame).is_err() && self.stats.record_recording_drop() == 0 {
+            log::warn!("The recording cannot keep up with the data; frames are being dropped from the recording!");
+        }
+    }
+}
+
+/// The main loop of the recording task. Queued frames are written in batches through a
+/// buffered file. Runs until every FrameRecorder has been dropped, then flushes the file.
+async fn run_frame_recorder(
+    path: PathBuf,
+    n_receivers: usize,
+    mut rx: mpsc::Receiver<RecordedFrame>,
+    stats: Arc<ConduitStats>,
+) -> Result<(), RecordingError> {
+    let file = File::create(&path).await?;
+    let mut writer = BufWriter::with_capacity(RECORDING_BUFFER_SIZE, file);
+    writer.write_all(&RECORDING_MAGIC).await?;
+    writer.write_u32_le(RECORDING_VERSION).await?;
+    writer.write_u32_le(n_receivers as u32).await?;
+
+    let mut batch: Vec<RecordedFrame> = Vec::with_capacity(RECORDING_BATCH_SIZE);
+    while rx.recv_many(&mut batch, RECORDING_BATCH_SIZE).await > 0 {
+        let n_frames = batch.len();
+        for frame in batch.drain(..) {
+            writer.write_u64_le(frame.time).await?;
+            writer.write_u32_le(frame.receiver).await?;
+            writer.write_u32_le(frame.message.len() as u32).await?;
+            writer.write_all(&frame.message).await?;
+        }
+        stats.record_recorded_frames(n_frames);
+    }
+    writer.flush().await?;
+    log::info!("Recording {} closed.", path.display());
+    Ok(())
+}
+
+/// Read the header of a recording, returning the number of receivers it was recorded with
+fn parse_recording_header(header: &[u8; RECORDING_HEADER_SIZE]) -> Result<usize, RecordingError> {
+    let mut word = [0u8; 4];
+    word.copy_from_slice(&header[8..12]);
+    let version = u32::from_le_bytes(word);
+    if header[..8] != RECORDING_MAGIC || version != RECORDING_VERSION {
+        return Err(RecordingError::BadFileFormat);
+    }
+    word.copy_from_slice(&header[12..]);
+    Ok(u32::from_le_bytes(word) as usize)
+}
+
+/// Read the number of receivers (CoBos) a recording was made with
+pub fn read_recording_receivers(path: &Path) -> Result<usize, RecordingError> {
+    let mut header = [0u8; RECORDING_HEADER_SIZE];
+    std::fs::File::open(path)?.read_exact(&mut header)?;
+    parse_recording_header(&header)
+}
+
+/// The main loop of the replay task. Frames are read from the recording and sent on to the
+/// EventBuilder shards. If a speed is given, frames are sent at the times they were recorded,
+/// scaled by 1/speed; otherwise they are sent as fast as the builders take them. Runs until
+/// the recording ends or a cancel message is received.
+async fn run_replay(
+    path: PathBuf,
+    tx: FrameRouter,
+    speed: Option<f64>,
+    stats: Arc<ConduitStats>,
+    mut cancel: broadcast::Receiver<ConduitMessage>,
+) -> Result<(), RecordingError> {
+    let file = File::open(&path).await?;
+    let mut reader = BufReader::with_capacity(RECORDING_BUFFER_SIZE, file);
+    let mut header = [0u8; RECORDING_HEADER_SIZE];
+    reader.read_exact(&mut header).await?;
+    parse_recording_header(&header)?;
+
+    let start = tokio::time::Instant::now();
+    loop {
+        let time = match reader.read_u64_le().await {
+            Ok(time) => time,
+            Err(e) if e.kind() == std::io::ErrorKind::UnexpectedEof => break,
+            Err(e) => return Err(e.into()),
+        };
+        let receiver = reader.read_u32_le().await? as usize;
+        let message_size = reader.read_u32_le().await? as usize;
+        let mut message = BytesMut::zeroed(message_size);
+        reader.read_exact(&mut message).await?;
+        stats.record_bytes(receiver, message_size);
+
+        let frame = match GrawFrame::from_message(message.freeze()) {
+            Ok(frame) => frame,
+            Err(e) => {
+                stats.record_frame_error(&e);
+                log::warn!("Replay skipped a bad frame: {e}");
+                continue;
+            }
+        };
+        stats.record_frame(receiver);
+        let send = async {
+            if let Some(speed) = speed {
+                let due = Duration::try_from_secs_f64(time as f64 * 1.0e-9 / speed)
+                    .unwrap_or(Duration::ZERO);
+                tokio::time::sleep_until(start + due).await;
+            }
+            tx.send(frame).await
+        };
+        tokio::select! {
+            _ = cancel.recv() => return Ok(()),
+            sent = send => sent?,
+        }
+    }
+    log::info!("Replay of {} finished.", path.display());
+    Ok(())
+}
+
+/// Start the recording task, returning the FrameRecorder the receivers record through and
+/// the task handle. The recording ends once every receiver has stopped.
+pub fn startup_recorder(
+    rt: &tokio::runtime::Runtime,
+    path: PathBuf,
+    n_receivers: usize,
+    stats: &Arc<ConduitStats>,
+) -> (FrameRecorder, JoinHandle<Result<(), ConduitError>>) {
+    let (tx, rx) = mpsc::channel::<RecordedFrame>(RECORDING_QUEUE_SIZE);
+    let this_stats = stats.clone();
+    let handle = rt.spawn(async move {
+        match run_frame_recorder(path, n_receivers, rx, this_stats).await {
+            Ok(()) => Ok(()),
+            Err(e) => Err(ConduitError::FailedRecording(e)),
+        }
+    });
+    let recorder = FrameRecorder {
+        tx,
+        start: Instant::now(),
+        stats: stats.clone(),
+    };
+    (recorder, handle)
+}
+
+/// Start the replay task, which feeds the frames of a recording to the EventBuilder shards.
+/// Speed is the multiple of the recorded rate to replay at; None replays as fast as possible.
+pub fn startup_replay(
+    rt: &tokio::runtime::Runtime,
+    path: PathBuf,
+    frame_tx: &FrameRouter,
+    cancel_tx: &broadcast::Sender<ConduitMessage>,
+    speed: Option<f64>,
+    stats: &Arc<ConduitStats>,
+) -> JoinHandle<Result<(), ConduitError>> {
+    let this_frame_tx = frame_tx.clone();
+    let this_cancel_rx = cancel_tx.subscribe();
+    let this_stats = stats.clone();
+    rt.spawn(async move {
+        match run_replay(path, this_frame_tx, speed, this_stats, this_cancel_rx).await {
+            Ok(()) => Ok(()),
+            Err(e) => Err(ConduitError::FailedRecording(e)),
+        }
+    })
+}
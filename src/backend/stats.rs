@@ -0,0 +1,214 @@
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::Instant;
+
+use super::error::GrawFrameError;
+use super::event_filter::{FilterRejection, FILTER_REJECTION_KINDS};
+
+/// The names of the GrawFrameError kinds, in the order of GrawFrameError::kind
+pub const FRAME_ERROR_KINDS: [&str; 7] = [
+    "io",
+    "meta_type",
+    "frame_size",
+    "frame_type",
+    "header_size",
+    "item_size",
+    "bad_datum",
+];
+
+/// Counters describing the state of the backend. All counters are relaxed atomics, so
+/// updating them costs next to nothing on the hot path; a snapshot may be very slightly
+/// inconsistent between counters. The stats are shared by every backend task.
+#[derive(Debug)]
+pub struct ConduitStats {
+    start: Instant,
+    frames_received: Vec<AtomicU64>, //per receiver (CoBo)
+    bytes_received: Vec<AtomicU64>,  //per receiver (CoBo)
+    last_data: Vec<AtomicU64>,       //per receiver, nanoseconds since start + 1, 0 for never
+    frame_errors: [AtomicU64; FRAME_ERROR_KINDS.len()],
+    cached_events: Vec<AtomicU64>, //per builder shard
+    cached_frames: Vec<AtomicU64>, //per builder shard
+    queued_frames: Vec<AtomicU64>, //per builder shard, frames waiting in its channel
+    complete_events: AtomicU64,
+    timeout_evictions: AtomicU64,
+    full_cache_evictions: AtomicU64,
+    end_of_stream_evictions: AtomicU64,
+    late_frames: AtomicU64,
+    recorded_frames: AtomicU64,
+    recording_drops: AtomicU64,
+    filter_rejections: [AtomicU64; FILTER_REJECTION_KINDS.len()],
+    prescaled_events: AtomicU64,
+}
+
+/// A point-in-time copy of the ConduitStats
+#[derive(Debug, Clone)]
+pub struct StatsSnapshot {
+    pub frames_received: Vec<u64>,
+    pub bytes_received: Vec<u64>,
+    pub seconds_since_data: Vec<Option<f64>>,
+    pub frame_errors: Vec<(&'static str, u64)>,
+    pub cached_events: u64,
+    pub cached_frames: u64,
+    pub queued_frames: u64,
+    pub complete_events: u64,
+    pub timeout_evictions: u64,
+    pub full_cache_evictions: u64,
+    pub end_of_stream_evictions: u64,
+    pub late_frames: u64,
+    pub recorded_frames: u64,
+    pub recording_drops: u64,
+    pub filter_rejections: Vec<(&'static str, u64)>,
+    pub prescaled_events: u64,
+}
+
+fn counters(n: usize) -> Vec<AtomicU64> {
+    (0..n).map(|_| AtomicU64::new(0)).collect()
+}
+
+impl ConduitStats {
+    /// Create new stats for the given number of receivers and builder shards
+    pub fn new(n_receivers: usize, n_shards: usize) -> Self {
+        ConduitStats {
+            start: Instant::now(),
+            frames_received: counters(n_receivers),
+            bytes_received: counters(n_receivers),
+            last_data: counters(n_receivers),
+            frame_errors: Default::default(),
+            cached_events: counters(n_shards),
+            cached_frames: counters(n_shards),
+            queued_frames: counters(n_shards),
+            complete_events: AtomicU64::new(0),
+            timeout_evictions: AtomicU64::new(0),
+            full_cache_evictions: AtomicU64::new(0),
+            end_of_stream_evictions: AtomicU64::new(0),
+            late_frames: AtomicU64::new(0),
+            recorded_frames: AtomicU64::new(0),
+            recording_drops: AtomicU64::new(0),
+            filter_rejections: Default::default(),
+            prescaled_events: AtomicU64::new(0),
+        }
+    }
+
+    /// Record bytes read from the socket of a receiver
+    pub fn record_bytes(&self, receiver: usize, n_bytes: usize) {
+        if let Some(bytes) = self.bytes_received.get(receiver) {
+            bytes.fetch_add(n_bytes as u64, Ordering::Relaxed);
+        }
+        if let Some(last) = self.last_data.get(receiver) {
+            last.store(
+                self.start.elapsed().as_nanos() as u64 + 1,
+                Ordering::Relaxed,
+            );
+        }
+    }
+
+    /// Record a frame parsed by a receiver
+    pub fn record_frame(&self, receiver: usize) {
+        if let Some(frames) = self.frames_received.get(receiver) {
+            frames.fetch_add(1, Ordering::Relaxed);
+        }
+    }
+
+    /// Record a frame which could not be parsed
+    pub fn record_frame_error(&self, error: &GrawFrameError) {
+        self.frame_errors[error.kind()].fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Record the occupancy of the cache and the frame channel of a builder shard
+    pub fn record_cache(&self, shard: usize, n_events: usize, n_frames: usize, n_queued: usize) {
+        if let Some(events) = self.cached_events.get(shard) {
+            events.store(n_events as u64, Ordering::Relaxed);
+        }
+        if let Some(frames) = self.cached_frames.get(shard) {
+            frames.store(n_frames as u64, Ordering::Relaxed);
+        }
+        if let Some(queued) = self.queued_frames.get(shard) {
+            queued.store(n_queued as u64, Ordering::Relaxed);
+        }
+    }
+
+    /// Record a complete event emitted by a builder
+    pub fn record_complete_event(&self) {
+        self.complete_events.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Record an incomplete event emitted because it was too old
+    pub fn record_timeout_eviction(&self) {
+        self.timeout_evictions.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Record an incomplete event emitted because the cache was full
+    pub fn record_full_cache_eviction(&self) {
+        self.full_cache_evictions.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Record an incomplete event emitted because every frame source has finished
+    pub fn record_end_of_stream_eviction(&self) {
+        self.end_of_stream_evictions.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Record a frame dropped because its event was already emitted
+    pub fn record_late_frame(&self) {
+        self.late_frames.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Record frames written to the recording
+    pub fn record_recorded_frames(&self, n_frames: usize) {
+        self.recorded_frames
+            .fetch_add(n_frames as u64, Ordering::Relaxed);
+    }
+
+    /// Record a frame dropped from the recording. Returns the number of frames dropped
+    /// before this one.
+    pub fn record_recording_drop(&self) -> u64 {
+        self.recording_drops.fetch_add(1, Ordering::Relaxed)
+    }
+
+    /// Record an event rejected by the event filter
+    pub fn record_filter_rejection(&self, rejection: FilterRejection) {
+        self.filter_rejections[rejection.kind()].fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Record an event which failed the event filter but was accepted by the prescale
+    pub fn record_prescaled_event(&self) {
+        self.prescaled_events.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Take a snapshot of the counters
+    pub fn snapshot(&self) -> StatsSnapshot {
+        let load = |counter: &AtomicU64| counter.load(Ordering::Relaxed);
+        let now = self.start.elapsed().as_nanos() as u64 + 1;
+        StatsSnapshot {
+            frames_received: self.frames_received.iter().map(load).collect(),
+            bytes_received: self.bytes_received.iter().map(load).collect(),
+            seconds_since_data: self
+                .last_data
+                .iter()
+                .map(|last| match load(last) {
+                    0 => None,
+                    time => Some(now.saturating_sub(time) as f64 * 1.0e-9),
+                })
+                .collect(),
+            frame_errors: FRAME_ERROR_KINDS
+                .iter()
+                .zip(self.frame_errors.iter())
+                .map(|(kind, count)| (*kind, load(count)))
+                .collect(),
+            cached_events: self.cached_events.iter().map(load).sum(),
+            cached_frames: self.cached_frames.iter().map(load).sum(),
+            queued_frames: self.queued_frames.iter().map(load).sum(),
+            complete_events: load(&self.complete_events),
+            timeout_evictions: load(&self.timeout_evictions),
+            full_cache_evictions: load(&self.full_cache_evictions),
+            end_of_stream_evictions: load(&self.end_of_stream_evictions),
+            late_frames: load(&self.late_frames),
+            recorded_frames: load(&self.recorded_frames),
+            recording_drops: load(&self.recording_drops),
+            filter_rejections: FILTER_REJECTION_KINDS
+                .iter()
+                .zip(self.filter_rejections.iter())
+                .map(|(kind, count)| (*kind, load(count)))
+                .collect(),
+            prescaled_events: load(&self.prescaled_events),
+        }
+    }
+}
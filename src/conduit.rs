@@ -1,31 +1,46 @@
-use numpy::IntoPyArray;
 use numpy::PyArray2;
 use std::path::PathBuf;
+use std::sync::Arc;
+use std::time::Duration;
 use tokio::sync::broadcast;
 use tokio::sync::mpsc;
 use tokio::task::JoinHandle;
 
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3::types::PyDict;
 
-use super::backend::constants::NUMBER_OF_COBOS;
+use super::backend::buffer_pool::BufferPool;
+use super::backend::constants::MAX_POOLED_BUFFERS;
 use super::backend::error::ConduitError;
-use super::backend::event::Event;
-use super::backend::event_builder::startup_event_builder;
-use super::backend::exporter_receiver::startup_exporter_recievers;
+use super::backend::event::{Event, TraceProcessing};
+use super::backend::event_builder::{startup_event_builders, EventBuilderConfig, FrameRouter};
+use super::backend::event_filter::EventFilter;
+use super::backend::exporter_receiver::{default_exporter_addresses, startup_exporter_recievers};
 use super::backend::graw_frame::GrawFrame;
 use super::backend::message::ConduitMessage;
 use super::backend::pad_map::PadMap;
+use super::backend::recording::{read_recording_receivers, startup_recorder, startup_replay};
+use super::backend::stats::ConduitStats;
+use super::event_filter::PyEventFilter;
+use super::event_matrix::{event_to_pyarray, sparse_to_pyarrays, SparseArrays};
+
+/// The handles of the backend service tasks
+type ServiceHandles = Vec<JoinHandle<Result<(), ConduitError>>>;
 
 /// The Conduit is the main interface for controlling the behavior of the backend
 /// as well as exposing events to further analysis pipelines. Conduit is python compatible
-/// with all of it's methods exposed to Python.
+/// with all of it's methods exposed to Python. Event data matrices are built in buffers
+/// from the Conduit's BufferPool and handed to Python without a copy.
 #[pyclass]
 #[derive(Debug)]
 pub struct Conduit {
     event_receiver: Option<mpsc::Receiver<Event>>,
+    buffer_pool: BufferPool,
     cancel_sender: broadcast::Sender<ConduitMessage>,
     runtime: tokio::runtime::Runtime,
-    handles: Option<Vec<JoinHandle<Result<(), ConduitError>>>>,
+    handles: Option<ServiceHandles>,
+    stats: Option<Arc<ConduitStats>>,
     pad_path: PathBuf,
 }
 
@@ -45,55 +60,161 @@ impl Conduit {
 
         Self {
             event_receiver: None,
+            buffer_pool: BufferPool::new(MAX_POOLED_BUFFERS),
             cancel_sender: cancel_tx,
             runtime: rt,
             handles: None,
+            stats: None,
             pad_path,
         }
     }
 
-    /// Initialize and start all of the backend services
-    pub fn connect(&mut self, max_cache_size: usize) {
+    /// Initialize and start all of the backend services. The DataExporter addresses (ip:port)
+    /// default to those of the AT-TPC CoBos. Events are emitted once every AsAd of the
+    /// connected CoBos has sent a frame, or once they are older than the event timeout (in
+    /// seconds). If the event timeout is None, incomplete events wait until the cache is full.
+    /// Event building is split across n_builders tasks by event id. If the reorder window is
+    /// not zero, events are released in event id order once more than reorder_window events
+    /// are waiting. If a record path is given, every received frame is also written to a
+    /// recording at that path, which can be played back with replay. Built events can have
+    /// the fixed pattern noise subtracted, and can be zero suppressed at the zero threshold
+    /// (after baseline subtraction). If an event filter is given, only the (processed) events
+    /// it accepts are made available; the rest are counted in the stats.
+    #[allow(clippy::too_many_arguments)]
+    #[pyo3(signature = (max_cache_size, exporter_addresses=None, event_timeout=Some(0.5), n_builders=1, reorder_window=0, record_path=None, subtract_fpn=false, zero_threshold=None, event_filter=None))]
+    pub fn connect(
+        &mut self,
+        max_cache_size: usize,
+        exporter_addresses: Option<Vec<String>>,
+        event_timeout: Option<f64>,
+        n_builders: usize,
+        reorder_window: usize,
+        record_path: Option<PathBuf>,
+        subtract_fpn: bool,
+        zero_threshold: Option<i16>,
+        event_filter: Option<PyEventFilter>,
+    ) -> PyResult<()> {
         if self.handles.is_some() {
             log::warn!("Could not start services, as they're already started!");
-            return;
+            return Ok(());
         }
 
-        log::info!("Creating communication channels and loading pad map...");
-        let (frame_tx, frame_rx) = mpsc::channel::<GrawFrame>(40);
-        let (event_tx, event_rx) = mpsc::channel::<Event>(40);
-        let pad_map = match PadMap::new(&self.pad_path) {
-            Ok(map) => map,
-            Err(e) => {
-                log::error!("PadMap ran into a problem: {e}");
-                return;
-            }
+        let max_event_age = event_age(event_timeout)?;
+        let addresses = exporter_addresses.unwrap_or_else(default_exporter_addresses);
+        let Some((frame_tx, stats, mut handles)) = self.start_event_builders(
+            addresses.len(),
+            max_cache_size,
+            max_event_age,
+            n_builders,
+            reorder_window,
+            TraceProcessing {
+                subtract_fpn,
+                zero_threshold,
+            },
+            event_filter.map(|filter| filter.filter),
+        ) else {
+            return Ok(());
         };
 
+        let recorder = record_path.map(|path| {
+            log::info!("Recording frames to {}...", path.display());
+            let (recorder, handle) = startup_recorder(&self.runtime, path, addresses.len(), &stats);
+            handles.push(handle);
+            recorder
+        });
+
         log::info!("Starting DataExporter communication...");
-        let mut handles = startup_exporter_recievers(&self.runtime, &frame_tx, &self.cancel_sender);
-        if handles.len() < NUMBER_OF_COBOS as usize {
+        let receiver_handles = startup_exporter_recievers(
+            &self.runtime,
+            &addresses,
+            &frame_tx,
+            &self.cancel_sender,
+            &stats,
+            recorder.as_ref(),
+        );
+        if receiver_handles.len() < addresses.len() {
             log::warn!(
                 "There was an issue spawning DataExporter receivers! Only spawned {} receivers",
-                handles.len()
+                receiver_handles.len()
             )
         }
+        handles.extend(receiver_handles);
 
-        log::info!("Starting Event Builder communication...");
-        let evb_handle = startup_event_builder(
+        self.handles = Some(handles);
+        self.stats = Some(stats);
+
+        log::info!("Communication started.");
+        Ok(())
+    }
+
+    /// Start the backend services, feeding the event builders from a recording (see connect)
+    /// instead of the DataExporters. The frames are replayed at speed times the recorded rate.
+    /// If the speed is None, the frames are replayed as fast as the event builders take them.
+    /// The other arguments are the same as for connect.
+    #[allow(clippy::too_many_arguments)]
+    #[pyo3(signature = (recording_path, max_cache_size, speed=Some(1.0), event_timeout=Some(0.5), n_builders=1, reorder_window=0, subtract_fpn=false, zero_threshold=None, event_filter=None))]
+    pub fn replay(
+        &mut self,
+        recording_path: PathBuf,
+        max_cache_size: usize,
+        speed: Option<f64>,
+        event_timeout: Option<f64>,
+        n_builders: usize,
+        reorder_window: usize,
+        subtract_fpn: bool,
+        zero_threshold: Option<i16>,
+        event_filter: Option<PyEventFilter>,
+    ) -> PyResult<()> {
+        if self.handles.is_some() {
+            log::warn!("Could not start services, as they're already started!");
+            return Ok(());
+        }
+
+        let max_event_age = event_age(event_timeout)?;
+        let n_receivers = match read_recording_receivers(&recording_path) {
+            Ok(n) => n,
+            Err(e) => {
+                log::error!("Could not open recording {}: {e}", recording_path.display());
+                return Ok(());
+            }
+        };
+        let speed = match speed {
+            Some(s) if !(s.is_finite() && s > 0.0) => {
+                log::warn!("Invalid replay speed {s}, replaying as fast as possible");
+                None
+            }
+            _ => speed,
+        };
+        let Some((frame_tx, stats, mut handles)) = self.start_event_builders(
+            n_receivers,
+            max_cache_size,
+            max_event_age,
+            n_builders,
+            reorder_window,
+            TraceProcessing {
+                subtract_fpn,
+                zero_threshold,
+            },
+            event_filter.map(|filter| filter.filter),
+        ) else {
+            return Ok(());
+        };
+
+        log::info!("Replaying {}...", recording_path.display());
+        handles.push(startup_replay(
             &self.runtime,
-            frame_rx,
-            event_tx,
+            recording_path,
+            &frame_tx,
             &self.cancel_sender,
-            pad_map,
-            max_cache_size,
-        );
-        handles.push(evb_handle);
+            speed,
+            &stats,
+        ));
 
         self.handles = Some(handles);
-        self.event_receiver = Some(event_rx);
+        self.stats = Some(stats);
 
-        log::info!("Communication started.");
+        log::info!("Replay started.");
+        Ok(())
     }
 
     /// Shutdown all of the backend services
@@ -106,9 +227,11 @@ impl Conduit {
         log::info!("Stopping all Conduit services...");
 
         let handles = self.handles.take().expect("This literally cannot happen");
-        self.cancel_sender
-            .send(ConduitMessage::Cancel)
-            .expect("Somehow all the services were already dead");
+        // The services can finish on their own (i.e. at the end of a replay), in which case
+        // nobody is left to cancel
+        if self.cancel_sender.send(ConduitMessage::Cancel).is_err() {
+            log::info!("All of the Conduit services had already finished");
+        }
         for handle in handles {
             match self.runtime.block_on(handle) {
                 Ok(res) => match res {
@@ -121,25 +244,266 @@ impl Conduit {
         log::info!("Conduit stopped.");
     }
 
-    /// Poll the conduit for any new events. The events are marshalled to Python numpy arrarys.
+    /// Poll the conduit for any new events. The events are marshalled to Python numpy arrarys
+    /// which share the event memory. If a timeout (in seconds) is given, wait up to the timeout for an event with the GIL
+    /// released. Otherwise the poll does not block.
+    #[pyo3(signature = (timeout=None))]
     pub fn poll_events<'py>(
         &mut self,
         py: Python<'py>,
-    ) -> Option<(u32, Bound<'py, PyArray2<i16>>)> {
-        match self.event_receiver.as_mut() {
-            Some(rx) => match rx.try_recv() {
-                Ok(event) => Some((
-                    event.get_event_id(),
-                    event.convert_to_data_matrix().into_pyarray(py),
-                )),
-                Err(_) => None,
-            },
-            None => None,
+        timeout: Option<f64>,
+    ) -> PyResult<Option<(u32, Bound<'py, PyArray2<i16>>)>> {
+        let Some(rx) = self.event_receiver.as_mut() else {
+            return Ok(None);
+        };
+        let maybe_event = match timeout {
+            Some(secs) => {
+                let runtime = &self.runtime;
+                let duration = timeout_duration(secs)?;
+                py.allow_threads(|| {
+                    runtime.block_on(async {
+                        match duration {
+                            Some(duration) => tokio::time::timeout(duration, rx.recv())
+                                .await
+                                .ok()
+                                .flatten(),
+                            None => rx.recv().await,
+                        }
+                    })
+                })
+            }
+            None => rx.try_recv().ok(),
+        };
+        match maybe_event {
+            Some(event) => Ok(Some((
+                event.get_event_id(),
+                event_to_pyarray(py, event, &self.buffer_pool)?,
+            ))),
+            None => Ok(None),
         }
     }
 
+    /// Poll the conduit for up to max_events events in a single call. If a timeout (in seconds)
+    /// is given, wait up to the timeout for the first event with the GIL released. Otherwise the
+    /// poll does not block. The events are marshalled to Python numpy arrays which share the
+    /// event memory.
+    #[pyo3(signature = (max_events, timeout=None))]
+    pub fn poll_events_batch<'py>(
+        &mut self,
+        py: Python<'py>,
+        max_events: usize,
+        timeout: Option<f64>,
+    ) -> PyResult<Vec<(u32, Bound<'py, PyArray2<i16>>)>> {
+        let events = self.receive_events(py, max_events, timeout)?;
+        events
+            .into_iter()
+            .map(|event| {
+                let event_id = event.get_event_id();
+                Ok((event_id, event_to_pyarray(py, event, &self.buffer_pool)?))
+            })
+            .collect()
+    }
+
+    /// Poll the conduit for up to max_events events in sparse form (see poll_events_batch).
+    /// Only the runs of read out samples of each trace which were not zero suppressed are
+    /// marshalled, which is much less data than the full matrix for zero suppressed events. The events are encoded with the
+    /// GIL released, and their matrix buffers are returned to the pool.
+    #[pyo3(signature = (max_events, timeout=None))]
+    pub fn poll_events_sparse<'py>(
+        &mut self,
+        py: Python<'py>,
+        max_events: usize,
+        timeout: Option<f64>,
+    ) -> PyResult<Vec<(u32, SparseArrays<'py>)>> {
+        let events = self.receive_events(py, max_events, timeout)?;
+        let pool = &self.buffer_pool;
+        let sparse_events: Vec<_> = py.allow_threads(|| {
+            events
+                .into_iter()
+                .map(|event| {
+                    let event_id = event.get_event_id();
+                    let sparse = event.to_sparse();
+                    pool.recycle(event.take_data_matrix().0);
+                    (event_id, sparse)
+                })
+                .collect()
+        });
+        Ok(sparse_events
+            .into_iter()
+            .map(|(event_id, sparse)| (event_id, sparse_to_pyarrays(py, sparse)))
+            .collect())
+    }
+
+    /// Get a snapshot of the backend statistics as a dictionary. Per-DataExporter values are
+    /// lists in the order of the exporter addresses. Counters are totals since the last call
+    /// to connect. Returns an empty dictionary if the conduit has never been connected.
+    pub fn stats<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let dict = PyDict::new(py);
+        let Some(stats) = self.stats.as_ref() else {
+            return Ok(dict);
+        };
+        let snapshot = stats.snapshot();
+        dict.set_item("frames_received", snapshot.frames_received)?;
+        dict.set_item("bytes_received", snapshot.bytes_received)?;
+        dict.set_item("seconds_since_data", snapshot.seconds_since_data)?;
+        let frame_errors = PyDict::new(py);
+        for (kind, count) in snapshot.frame_errors {
+            frame_errors.set_item(kind, count)?;
+        }
+        dict.set_item("frame_errors", frame_errors)?;
+        dict.set_item("cached_events", snapshot.cached_events)?;
+        dict.set_item("cached_frames", snapshot.cached_frames)?;
+        dict.set_item("frame_queue_depth", snapshot.queued_frames)?;
+        dict.set_item(
+            "event_queue_depth",
+            self.event_receiver.as_ref().map_or(0, |rx| rx.len()),
+        )?;
+        dict.set_item("complete_events", snapshot.complete_events)?;
+        dict.set_item("timeout_evictions", snapshot.timeout_evictions)?;
+        dict.set_item("full_cache_evictions", snapshot.full_cache_evictions)?;
+        dict.set_item("end_of_stream_evictions", snapshot.end_of_stream_evictions)?;
+        dict.set_item("late_frames", snapshot.late_frames)?;
+        dict.set_item("recorded_frames", snapshot.recorded_frames)?;
+        dict.set_item("recording_drops", snapshot.recording_drops)?;
+        let filter_rejections = PyDict::new(py);
+        for (kind, count) in snapshot.filter_rejections {
+            filter_rejections.set_item(kind, count)?;
+        }
+        dict.set_item("filter_rejections", filter_rejections)?;
+        dict.set_item("prescaled_events", snapshot.prescaled_events)?;
+        Ok(dict)
+    }
+
     /// See if the conduit is connected to it's receivers
     pub fn is_connected(&self) -> bool {
         self.handles.is_some()
     }
+
+    /// See if the conduit has no more events to give: the services sending built events have
+    /// all stopped (i.e. at the end of a replay, or once every receiver has exited) and every
+    /// event has been polled. Also true if the conduit has never been connected.
+    pub fn is_finished(&self) -> bool {
+        self.event_receiver
+            .as_ref()
+            .is_none_or(|rx| rx.is_closed() && rx.is_empty())
+    }
+}
+
+impl Conduit {
+    /// Take up to max_events events from the event channel. If a timeout (in seconds) is
+    /// given, wait up to the timeout for the first event with the GIL released (see
+    /// timeout_duration). Otherwise only the events which are ready are taken.
+    fn receive_events(
+        &mut self,
+        py: Python<'_>,
+        max_events: usize,
+        timeout: Option<f64>,
+    ) -> PyResult<Vec<Event>> {
+        let mut events: Vec<Event> = Vec::with_capacity(max_events);
+        if let Some(rx) = self.event_receiver.as_mut() {
+            match timeout {
+                Some(secs) if max_events > 0 => {
+                    let runtime = &self.runtime;
+                    let duration = timeout_duration(secs)?;
+                    py.allow_threads(|| {
+                        runtime.block_on(async {
+                            let receive = rx.recv_many(&mut events, max_events);
+                            match duration {
+                                // Timing out just means no events were ready
+                                Some(duration) => {
+                                    let _ = tokio::time::timeout(duration, receive).await;
+                                }
+                                None => {
+                                    receive.await;
+                                }
+                            }
+                        })
+                    });
+                }
+                _ => {
+                    while events.len() < max_events {
+                        match rx.try_recv() {
+                            Ok(event) => events.push(event),
+                            Err(_) => break,
+                        }
+                    }
+                }
+            }
+        }
+        Ok(events)
+    }
+
+    /// Create the communication channels and stats, load the pad map, and start the event
+    /// builders for frames from n_cobos CoBos, emitting incomplete events after max_event_age
+    /// (if given) and applying the given trace processing and event filter to the built
+    /// events. Returns the FrameRouter feeding the builders, the stats, and the builder
+    /// handles, or None if the pad map could not be loaded.
+    #[allow(clippy::too_many_arguments)]
+    fn start_event_builders(
+        &mut self,
+        n_cobos: usize,
+        max_cache_size: usize,
+        max_event_age: Option<Duration>,
+        n_builders: usize,
+        reorder_window: usize,
+        processing: TraceProcessing,
+        filter: Option<EventFilter>,
+    ) -> Option<(FrameRouter, Arc<ConduitStats>, ServiceHandles)> {
+        log::info!("Creating communication channels and loading pad map...");
+        let (frame_txs, frame_rxs): (Vec<_>, Vec<_>) = (0..n_builders.max(1))
+            .map(|_| mpsc::channel::<GrawFrame>(40))
+            .unzip();
+        let frame_tx = FrameRouter::new(frame_txs);
+        let (event_tx, event_rx) = mpsc::channel::<Event>(40);
+        let pad_map = match PadMap::new(&self.pad_path) {
+            Ok(map) => map,
+            Err(e) => {
+                log::error!("PadMap ran into a problem: {e}");
+                return None;
+            }
+        };
+        let stats = Arc::new(ConduitStats::new(n_cobos, n_builders.max(1)));
+
+        log::info!("Starting Event Builder communication...");
+        // The DataExporters are given in CoBo order
+        let config = EventBuilderConfig {
+            max_cache_size,
+            expected_sources: pad_map.get_sources(n_cobos),
+            max_event_age,
+            processing,
+            filter,
+        };
+        let handles = startup_event_builders(
+            &self.runtime,
+            frame_rxs,
+            event_tx,
+            &self.cancel_sender,
+            pad_map,
+            config,
+            self.buffer_pool.clone(),
+            reorder_window,
+            &stats,
+        );
+        self.event_receiver = Some(event_rx);
+        Some((frame_tx, stats, handles))
+    }
+}
+
+/// Convert a Python timeout in seconds to a Duration. An infinite timeout, or one too large
+/// for a Duration, gives None: wait indefinitely. Negative and NaN timeouts are a
+/// ValueError.
+fn timeout_duration(secs: f64) -> PyResult<Option<Duration>> {
+    if secs.is_nan() || secs < 0.0 {
+        return Err(PyValueError::new_err(format!(
+            "The timeout must be a non-negative number of seconds, got {secs}"
+        )));
+    }
+    Ok(Duration::try_from_secs_f64(secs).ok())
+}
+
+/// Convert the Python event timeout in seconds to the maximum age of an incomplete event
+/// (see timeout_duration). An infinite event timeout is the same as None: incomplete
+/// events wait until the cache is full.
+fn event_age(event_timeout: Option<f64>) -> PyResult<Option<Duration>> {
+    Ok(event_timeout.map(timeout_duration).transpose()?.flatten())
 }
@@ -0,0 +1,42 @@
+use pyo3::prelude::*;
+
+use super::backend::event_filter::EventFilter;
+
+/// PyEventFilter exposes the backend EventFilter to Python, where it is configured and
+/// handed to the Conduit when connecting. Events rejected by the filter never reach Python;
+/// they are counted in the Conduit stats.
+#[pyclass(name = "EventFilter", frozen)]
+#[derive(Debug, Clone)]
+pub struct PyEventFilter {
+    pub filter: EventFilter,
+}
+
+#[pymethods]
+impl PyEventFilter {
+    /// Create a new filter. The beam region is a list of pad numbers. A prescale of zero
+    /// is treated as no prescale.
+    #[new]
+    #[pyo3(signature = (min_multiplicity=0, max_multiplicity=None, min_charge=None, beam_pads=None, min_outside_beam=0, prescale=None))]
+    pub fn new(
+        min_multiplicity: usize,
+        max_multiplicity: Option<usize>,
+        min_charge: Option<i64>,
+        beam_pads: Option<Vec<usize>>,
+        min_outside_beam: usize,
+        prescale: Option<u64>,
+    ) -> Self {
+        if prescale == Some(0) {
+            log::warn!("An event filter prescale of 0 is invalid, no prescale will be used");
+        }
+        Self {
+            filter: EventFilter::new(
+                min_multiplicity,
+                max_multiplicity,
+                min_charge,
+                &beam_pads.unwrap_or_default(),
+                min_outside_beam,
+                prescale,
+            ),
+        }
+    }
+}
@@ -0,0 +1,83 @@
+use numpy::ndarray::{Array2, ArrayView2};
+use numpy::{PyArray1, PyArray2};
+use pyo3::prelude::*;
+
+use super::backend::buffer_pool::BufferPool;
+use super::backend::constants::{NUMBER_OF_HARDWARE_COLUMNS, NUMBER_OF_MATRIX_COLUMNS};
+use super::backend::event::{Event, SparseTraces, SEGMENT_COLUMNS};
+
+/// The numpy arrays of an event in sparse form: the hardware columns of each trace (Nx5),
+/// the segments (trace, first time bucket, length) of read out samples (Mx3), and the
+/// samples of every segment, in order
+pub type SparseArrays<'py> = (
+    Bound<'py, PyArray2<i16>>,
+    Bound<'py, PyArray2<i32>>,
+    Bound<'py, PyArray1<i16>>,
+);
+
+/// EventMatrix owns the data matrix of an event marshalled to Python. The numpy array
+/// given to Python borrows the matrix buffer and keeps the EventMatrix alive (as its base
+/// object), so no copy is made. Once the array is garbage collected the buffer is returned
+/// to the BufferPool. The buffer is only touched from Rust when it is created and dropped.
+#[pyclass(frozen)]
+#[derive(Debug)]
+pub struct EventMatrix {
+    data: Vec<i16>,
+    pool: BufferPool,
+}
+
+impl Drop for EventMatrix {
+    fn drop(&mut self) {
+        self.pool.recycle(std::mem::take(&mut self.data));
+    }
+}
+
+/// Marshall an event to Python as a numpy array without copying the data matrix
+pub fn event_to_pyarray<'py>(
+    py: Python<'py>,
+    event: Event,
+    pool: &BufferPool,
+) -> PyResult<Bound<'py, PyArray2<i16>>> {
+    let (mut data, n_rows) = event.take_data_matrix();
+    assert_eq!(
+        data.len(),
+        n_rows * NUMBER_OF_MATRIX_COLUMNS,
+        "Event data matrix has an invalid shape"
+    );
+    // The array is writable from Python, so it is made from a mutable pointer to the buffer,
+    // never from a shared borrow of the EventMatrix. Moving the Vec into the EventMatrix does
+    // not move its buffer.
+    let buffer = data.as_mut_ptr();
+    let owner = Bound::new(
+        py,
+        EventMatrix {
+            data,
+            pool: pool.clone(),
+        },
+    )?;
+    // SAFETY: The buffer holds n_rows full matrix rows (checked above). It is owned by the
+    // EventMatrix, which is the base object of the array: the EventMatrix, and so its Drop
+    // which returns the buffer to the pool, outlives the array and every view of it. The
+    // buffer is never accessed from Rust, resized or reallocated while the EventMatrix is
+    // alive.
+    Ok(unsafe {
+        let view = ArrayView2::from_shape_ptr((n_rows, NUMBER_OF_MATRIX_COLUMNS), buffer);
+        PyArray2::borrow_from_array(&view, owner.into_any())
+    })
+}
+
+/// Marshall the sparse traces of an event to Python as numpy arrays. The arrays take
+/// ownership of the sparse vectors, so no copy is made.
+pub fn sparse_to_pyarrays(py: Python<'_>, sparse: SparseTraces) -> SparseArrays<'_> {
+    let n_traces = sparse.hardware.len() / NUMBER_OF_HARDWARE_COLUMNS;
+    let n_segments = sparse.segments.len() / SEGMENT_COLUMNS;
+    let hardware = Array2::from_shape_vec((n_traces, NUMBER_OF_HARDWARE_COLUMNS), sparse.hardware)
+        .expect("Sparse hardware has an invalid shape");
+    let segments = Array2::from_shape_vec((n_segments, SEGMENT_COLUMNS), sparse.segments)
+        .expect("Sparse segments have an invalid shape");
+    (
+        PyArray2::from_owned_array(py, hardware),
+        PyArray2::from_owned_array(py, segments),
+        PyArray1::from_vec(py, sparse.samples),
+    )
+}
@@ -1,14 +1,18 @@
-mod backend;
+pub mod backend;
 mod conduit;
+mod event_filter;
+mod event_matrix;
 
 use pyo3::prelude::*;
 
 use conduit::Conduit;
+use event_filter::PyEventFilter;
 
 /// The _attpc_conduit python module
 #[pymodule]
 fn _attpc_conduit(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     pyo3_log::init();
     m.add_class::<Conduit>()?;
+    m.add_class::<PyEventFilter>()?;
     Ok(())
 }